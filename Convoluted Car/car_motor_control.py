@@ -1,13 +1,17 @@
 import time
-from mqtt import MQTTClient
+from mqtt_session import MqttSession
 from wifi import *
-from machine import Pin, PWM
+from machine import Pin
+from pose_subscriber import PoseSubscriber
+from fixed_rate import FixedRateLoop
+from motor_driver import MotorDriver
 
-connect_wifi()  # connect to wifi using  custom wifi module
+start_wifi()  # starts connecting, the motors are set up meanwhile (see wifi.py)
 
 mqtt_broker = 'broker.hivemq.com' 
 port = 1883
 topic_sub = 'ME35-24/noahmedha'
+follow_tag = None  # AprilTag id this car follows, None for the first tag seen
 
 # adjust range depending on camera position
 y_min = -4.5
@@ -19,74 +23,77 @@ x_avg = (x_min + x_max) / 2
 
 x_pos, y_pos = x_avg, y_avg   # set to avg values to keep motors still
 
-def callback(topic, msg):
-    # callback for new mqtt message on topic
-    global x_pos, y_pos
+max_speed = 100  # speed at the ends of the y range (% of full duty)
+max_turn = 30    # speed difference between the wheels at the ends of the x range
 
-    # decode the message and update position variables
-    string = msg.decode()
-    if string[1] == ",":       # confirm correct format coming from camera
-        found_tag, x, y = string.split(',')
-        x_pos, y_pos = x_avg, y_avg
-        if int(found_tag) == 1:
-            x_pos = float(x)
-            y_pos = float(y)
-            
-
-client = MQTTClient('motorcontrol', mqtt_broker , port)
-client.connect()
-print('Connected to %s MQTT broker' % (mqtt_broker))
-client.set_callback(callback)          # set the callback if anything is read
-client.subscribe(topic_sub.encode())   # subscribe to a bunch of topics
-
-# Setup PWM control for four pins, two for each motor
-pwm2 = PWM(Pin(2))
-pwm3 = PWM(Pin(3))
-pwm4 = PWM(Pin(4))
-pwm5 = PWM(Pin(5))
-pwm2.freq(1000)
-pwm3.freq(1000)
-pwm4.freq(1000)
-pwm5.freq(1000)
+max_pose_age_ms = 250  # stop the motors if the newest pose is older than this
 
-def motor_run(speed, m1, m2):
-    # run motor at specified speed (%), m2 and m2 are pwm pins
-
-    speed = int(max(-100, min(100, speed))) # constrain from -100 to 100
-    if speed >= 0:
-        m2.duty_u16(0)  # Ensure backward pin is off
-        m1.duty_u16(int(speed * 65535 // 100))  # Apply PWM to m1 (forward)
-    else:
-        m1.duty_u16(0)  # Ensure forward pin is off
-        m2.duty_u16(int(-speed * 65535 // 100))  # Apply PWM to m2 (backward)
+# Setup PWM control for four pins, two for each motor; speeds are in % and
+# only changed duties are written (see motor_driver.py)
+motors = MotorDriver(left=(2, 3), right=(4, 5), freq=1000, levels=100)
 
 def motor_stop():
     # Stop both motors
-    pwm2.duty_u16(0)
-    pwm3.duty_u16(0)
-    pwm4.duty_u16(0)
-    pwm5.duty_u16(0)
+    motors.stop()
     
 pin20 = Pin(20, Pin.IN) # setup pin to detect start/stop
+running = pin20.value() == 1
+
+def start_stop(pin):
+    # start/stop line changed, a stop cuts the motors here instead of
+    # waiting for the loop
+    global running
+    running = pin.value() == 1
+    if not running:
+        motors.stop(force=True)
+
+pin20.irq(start_stop, Pin.IRQ_RISING | Pin.IRQ_FALLING)
+boot.mark('motors ready')
+
+wait_wifi()  # returns as soon as the link is up
+client = MqttSession('motorcontrol', mqtt_broker , port, auto_reconnect=False)  # reconnected by the loop
+client.connect()
+print('Connected to %s MQTT broker' % (mqtt_broker))
+boot.mark('mqtt connected')
+boot.report()
+
+# keeps only the newest pose from the camera, see pose_subscriber.py
+pose = PoseSubscriber(client, topic_sub.encode(), tag_id=follow_tag,
+                      max_age_ms=max_pose_age_ms)
+
+# runs the loop every 10 ms from fixed deadlines, loop.stats() shows the
+# real period and jitter (see fixed_rate.py)
+loop = FixedRateLoop(10)
     
 while True:
-    client.check_msg() # check for new messages
+    if not client.connected:
+        # broker or Wi-Fi gone: stop first, the reconnect blocks the loop
+        # until the connect succeeds or fails (see mqtt_session.py)
+        motors.stop()
+        client.poll(reconnect=True)  # retried with a backoff
     
-    if pin20.value() == 1: # check if should be running
+    pose.drain() # read all pending messages, keep the newest pose
+    
+    if running and pose.fresh() and client.connected: # check if should be running
+        
+        x_pos, y_pos = x_avg, y_avg
+        if pose.found:
+            x_pos = pose.x
+            y_pos = pose.y
         
         # compute speed and turn from x, y position
         
-        # speed ranges from -100 to 100
-        speed = -int((max(y_min, min(y_max, y_pos)) - y_avg) * (100/((y_max - y_min)/2)))
+        # speed ranges from -max_speed to max_speed
+        speed = -int((max(y_min, min(y_max, y_pos)) - y_avg) * (max_speed/((y_max - y_min)/2)))
         
-        # turn ranges from -30 to 30
-        turn = int((max(x_min, min(x_max, x_pos)) - x_avg) * (30/((x_max - x_min)/2)))
+        # turn ranges from -max_turn to max_turn
+        turn = int((max(x_min, min(x_max, x_pos)) - x_avg) * (max_turn/((x_max - x_min)/2)))
         
         # alter speed values for each motor to account for turn
-        motor_run(speed - turn, pwm2, pwm3)
-        motor_run(speed + turn, pwm4, pwm5)
+        motors.drive(speed - turn, speed + turn)
+        if not running:
+            motor_stop() # stopped while this pass was driving
     else:
         motor_stop()
         
-    time.sleep_ms(10)
-
+    loop.wait()  # sleep until the next 10 ms deadline
@@ -1,9 +1,9 @@
 import time
-from mqtt import MQTTClient
+from mqtt_session import MqttSession
 from wifi import *
 from machine import Pin, PWM
 
-connect_wifi()  # connect to wifi using  custom wifi module
+start_wifi()  # starts connecting, the pin is set up meanwhile (see wifi.py)
 
 mqtt_broker = 'broker.hivemq.com' 
 port = 1883
@@ -11,32 +11,30 @@ topic_sub = 'ME35-24/carstartstop'
 
 run = False     # flag for start/stop
 
+# setup pin to communicate with other Pico
+pin2 = Pin(2, Pin.OUT)
+pin2.value(0)
+
 def callback(topic, msg):
-    # callback for when a new MQTT message is recieved on the topic
+    # callback for when a new MQTT message is recieved on the topic, drives
+    # the line to the motor Pico right away
     global run
-    string = msg.decode()
-    if string == "run":
+    if msg == b"run":
         run = True
-    elif string == "stop":
-        run = False          
+        pin2.value(1)
+    elif msg == b"stop":
+        run = False
+        pin2.value(0)
 
-client = MQTTClient('startstop', mqtt_broker , port)
+wait_wifi()  # returns as soon as the link is up
+client = MqttSession('startstop', mqtt_broker , port)  # reconnects by itself
 client.connect()
 print('Connected to %s MQTT broker' % (mqtt_broker))
+boot.mark('mqtt connected')
+boot.report()
 client.set_callback(callback)          # set the callback if anything is read
 client.subscribe(topic_sub.encode())   # subscribe to a bunch of topics
-    
-# setup pin to communicate with other Pico
-pin2 = Pin(2, Pin.OUT)
-pin2.value(0)
 
-# loop forever
+# loop forever, wait_msg() returns as soon as a message has been handled
 while True:
-    client.check_msg()
-    
-    if run:
-        pin2.value(1)
-    else:
-        pin2.value(0)
-        
-    time.sleep_ms(100)
\ No newline at end of file
+    client.wait_msg()
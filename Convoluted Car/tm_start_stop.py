@@ -1,8 +1,25 @@
 from pyscript.js_modules import teach, pose, mqtt_library
+from pyscript import document, window
+from pyscript.ffi import create_proxy, to_js
+from predictions import PredictionDecoder
 import time
 
 topic = "ME35-24/carstartstop"
 
+# 'event' acts on every prediction the model writes to the page,
+# 'poll' reads the page every poll_s seconds instead
+mode = 'event'
+poll_s = 1
+
+# a class only takes over after winning min_votes of the last vote_window
+# predictions, each with a score of at least min_score and margin above the
+# runner-up
+vote_window = 5
+min_votes = 3
+min_score = 0.6
+margin = 0.2
+resend_s = 5  # repeat the current command this often in case one was lost
+
 # initialize MQTT client
 client = mqtt_library.myClient
 client.init()
@@ -17,6 +34,8 @@ def stop():
     message = 'stop'
     client.publish(topic, message)
 
+commands = {'start': run, 'stop': stop}  # class name -> command sent
+
 
 def run_model(URL2):
     s = pose.s
@@ -35,28 +54,49 @@ def get_predictions():
     return predictions
 
 
+class Commander:
+    """sends the command of the voted class when it changes"""
+
+    def __init__(self):
+        # see predictions.py for the voting
+        self.decoder = PredictionDecoder(window=vote_window, min_votes=min_votes,
+                                         min_score=min_score, margin=margin)
+        self.sent_at = 0
+        self.published = 0
+
+    def act(self, predictions):
+        # publish on a change of class, and every resend_s seconds
+        now = time.time()
+        changed = self.decoder.feed_pairs(predictions) if predictions else None
+        name = self.decoder.name()
+        if changed is None and (name is None or now - self.sent_at < resend_s):
+            return
+        if changed is not None:
+            print(name)
+        if name in commands:
+            commands[name]()
+            self.published += 1
+        self.sent_at = now
+
+
+state = Commander()
+
+
+def on_labels(mutations, observer):
+    # the model just wrote new predictions to the page
+    state.act(get_predictions())
+
+
 run_model("https://teachablemachine.withgoogle.com/models/wovVCX6Nw/")
 
-while True:
-    predictions = get_predictions()
-    
-    # parse the predictions array to find the class with max value
-    classes = []
-    values = []
-    if predictions: 
-        for i in range(0, len(predictions)):
-            class_name = predictions[i].split(': ')[0]
-            value = predictions[i].split(': ')[1]
-            classes.append(class_name)
-            values.append(float(value))
-        max_index = values.index(max(values))
-        predicted_class = classes[max_index]
-        
-        # act according to predicted class
-        if predicted_class == "start":
-            run()
-        elif predicted_class == "stop":
-            stop()
-        else:
-            print(predicted_class)
-    time.sleep(1)
\ No newline at end of file
+if mode == 'event':
+    # the label container is filled in by the model once it has loaded
+    while not document.getElementById('label-container'):
+        time.sleep(0.1)
+    observer = window.MutationObserver.new(create_proxy(on_labels))
+    observer.observe(document.getElementById('label-container'),
+                     to_js({'childList': True, 'subtree': True, 'characterData': True}))
+else:
+    while True:
+        state.act(get_predictions())
+        time.sleep(poll_s)
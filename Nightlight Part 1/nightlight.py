@@ -1,7 +1,7 @@
 import time
-from mqtt import MQTTClient
-import network
+from mqtt_session import MqttSession
 from secrets2 import mysecrets
+from wifi import start_wifi, wifi_async, boot
 import urequests
 import asyncio
 from machine import Pin, PWM
@@ -14,6 +14,10 @@ class Nightlight():
     def __init__(self):
         self.on = False
         
+        # start connecting to wifi with credentials stored in secrets2.py,
+        # the hardware is set up meanwhile (see wifi.py)
+        start_wifi(ssid=mysecrets['SSID'], key=mysecrets['key'])
+        
         # setup 'breathing' LED
         self.led = PWM(Pin('GPIO0', Pin.OUT))
         self.led.freq(50)
@@ -25,7 +29,7 @@ class Nightlight():
         self.buzzer.duty_u16(0)
         
         # setup button and callback
-        self.button = Pin('GPIO20', Pin.IN, machine.Pin.PULL_UP)
+        self.button = Pin('GPIO20', Pin.IN, Pin.PULL_UP)
         self.button.irq(trigger=Pin.IRQ_FALLING, handler=self.button_press)
         
         # setup neopixel
@@ -35,23 +39,19 @@ class Nightlight():
 
         self.breath_task = None     # to store breath task, allows for cancelation
         
-        # connect to wifi and mqtt
-        self.connect()
-        self.start_mqtt()
+        boot.mark('hardware ready')
 
         # Start the event loop
-        asyncio.create_task(self.check_messages())  # Schedule the MQTT message checking
-        asyncio.get_event_loop().run_forever()      # Keep the event loop running
+        asyncio.create_task(self.online())      # mqtt once wifi is up, then check messages
+        asyncio.get_event_loop().run_forever()  # Keep the event loop running
         
-    def connect(self):
-        # connects to wifi with credentials stored in secrets.py
-        wlan = network.WLAN(network.STA_IF)
-        wlan.active(True)
-        wlan.connect(mysecrets['SSID'], mysecrets['key'])
-        while wlan.ifconfig()[0] == '0.0.0.0':
-            print('.', end=' ')
-            time.sleep(1)
-        return wlan.ifconfig()
+    async def online(self):
+        # wait for wifi without holding up the other tasks, then start mqtt
+        await wifi_async()
+        self.start_mqtt()
+        boot.mark('mqtt connected')
+        boot.report()
+        await self.check_messages()
     
     def start_mqtt(self):
         # connect MQTT client and subscribe to topic
@@ -64,7 +64,8 @@ class Nightlight():
             if topic.decode() == topic_sub and msg.decode() == 'toggle':
                 self.toggle_state()
 
-        self.client = MQTTClient('Noah', mqtt_broker , port, keepalive=60)
+        # pings and reconnects by itself, see mqtt_session.py
+        self.client = MqttSession('Noah', mqtt_broker , port, keepalive=60)
         self.client.connect()
         print('Connected to %s MQTT broker' % (mqtt_broker))
         self.client.set_callback(callback)          # set the callback if anything is read
@@ -2,10 +2,9 @@ from MSA311 import Acceleration
 import asyncio
 from machine import Pin, PWM
 import time
-import network
-from secrets import mysecrets
+from wifi import start_wifi, wifi_async, boot
 import urequests
-from mqtt import MQTTClient
+from mqtt_session import MqttSession
 import neopixel
 import random
 
@@ -18,9 +17,8 @@ class Nightlight():
         self.on = True
         self.button_toggle = False
         
-        # connect
-        self.connect_wifi(2)
-        self.start_mqtt()
+        # start connecting, the hardware is set up meanwhile (see wifi.py)
+        start_wifi(2)
         
         # setup acccelerometer
         scl = Pin('GPIO27', Pin.OUT)
@@ -48,20 +46,21 @@ class Nightlight():
         self.neo[0] = (0,0,0)
         self.neo.write()
         
-        # startup asyncio
-        asyncio.create_task(self.check_messages())
+        boot.mark('hardware ready')
+        
+        # startup asyncio, mqtt once wifi is up
+        asyncio.create_task(self.online())
         asyncio.create_task(self.pan_servo())
         asyncio.get_event_loop().run_forever()
         
-    def connect_wifi(self, index=2):
-        wlan = network.WLAN(network.STA_IF)
-        wlan.active(True)
-        wlan.connect(mysecrets[index]['SSID'], mysecrets[index]['key'])
-        while wlan.ifconfig()[0] == '0.0.0.0':
-            print('.', end=' ')
-            time.sleep(1)
+    async def online(self):
+        # wait for wifi without holding up the other tasks, then start mqtt
+        await wifi_async()
         print('wifi connected')
-        return wlan.ifconfig()
+        self.start_mqtt()
+        boot.mark('mqtt connected')
+        boot.report()
+        await self.check_messages()
     
     def start_mqtt(self):
         # connect MQTT client and subscribe to topic
@@ -80,7 +79,9 @@ class Nightlight():
                     print('off')
                 self.update_neopixel()
 
-        self.client = MQTTClient('Noah', mqtt_broker , port, keepalive=0)
+        # reconnects by itself once a call fails, see mqtt_session.py; with
+        # keepalive=0, as before, it never pings
+        self.client = MqttSession('Noah', mqtt_broker , port, keepalive=0)
         self.client.connect()
         print('Connected to %s MQTT broker' % (mqtt_broker))
         self.client.set_callback(callback)          # set the callback if anything is read
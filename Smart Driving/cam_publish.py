@@ -1,31 +1,16 @@
 import time
-import network
-from mqtt import MQTTClient
-from secrets import mysecrets
+from mqtt_session import MqttSession
+from wifi import start_wifi, wait_wifi, boot
+from pose_frame import PoseBatchEncoder
+from apriltag_roi import RoiTagFinder
 import machine
 import sensor
 
-SSID = mysecrets['SSID']  # Network SSID
-KEY = mysecrets['key']    # Network Password
-
 mqtt_broker = 'broker.hivemq.com'
 
 topic_pub = 'ME35-24/noahcam'
 
-# Init wlan module and connect to network
-wlan = network.WLAN(network.STA_IF)
-wlan.active(True)
-wlan.connect(SSID, KEY)
-
-while not wlan.isconnected():
-    print('Trying to connect to "{:s}"...'.format(SSID))
-    time.sleep_ms(1000)
-
-# We should have a valid IP now via DHCP
-print("WiFi Connected ", wlan.ifconfig())
-
-client = MQTTClient("openmv_noah", mqtt_broker, port=1883)
-client.connect()
+start_wifi()  # starts connecting, the camera is set up meanwhile (see wifi.py)
 
 # Setup camera
 sensor.reset()
@@ -35,29 +20,43 @@ sensor.skip_frames(time=2000)
 sensor.set_auto_gain(False)  # must turn this off to prevent image washout...
 sensor.set_auto_whitebal(False)  # must turn this off to prevent image washout...
 
+boot.mark('camera ready')
+
+print("WiFi Connected ", wait_wifi())  # returns as soon as the link is up
+
+# reconnects by itself, only the newest frame waits for a reconnect
+# (see mqtt_session.py)
+client = MqttSession("openmv_noah", mqtt_broker, port=1883, queue_size=1)
+client.connect()
+boot.mark('mqtt connected')
+boot.report()
+
 f_x = (2.8 / 3.984) * 160  # find_apriltags defaults to this if not set
 f_y = (2.8 / 2.952) * 120  # find_apriltags defaults to this if not set
 c_x = 160 * 0.5  # find_apriltags defaults to this if not set (the image.w * 0.5)
 c_y = 120 * 0.5  # find_apriltags defaults to this if not set (the image.h * 0.5)
 
-found_tag = 0
+# search only around the last tags, full frame after 3 misses and every
+# 10 frames to pick up new tags (see apriltag_roi.py)
+finder = RoiTagFinder(f_x, f_y, c_x, c_y, width=160, height=120,
+                      max_misses=3, full_every=10)
+finder.tracking = True  # False to search the full frame every time
+
+encoder = PoseBatchEncoder()  # packs every tag into one frame (see pose_frame.py)
+topic = topic_pub.encode()
+
 while True:
-    # get x, y coordinates of a tag
-    x, z = None, None
+    # get id and x, y, z coordinates of every tag
     img = sensor.snapshot()
-    for tag in img.find_apriltags(
-        fx=f_x, fy=f_y, cx=c_x, cy=c_y):
+    encoder.begin(time.ticks_ms())  # capture time sent along with the poses
+    for tag in finder.find(img):
         img.draw_rectangle(tag.rect, color=(255, 0, 0))
         img.draw_cross(tag.cx, tag.cy, color=(0, 255, 0))
-        x = tag.x_translation
-        z = tag.z_translation
-
-        found_tag = 1 # 1 if tag, 0 if no tag found
+        encoder.add(tag.id, tag.x_translation, tag.y_translation, tag.z_translation)
 
-    msg = f'{found_tag},{x},{z}' # string to be sent over mqtt
-    #print(msg)
+    msg = encoder.finish() # one frame with all tags to be sent over mqtt
 
-    client.publish(topic_pub.encode(), msg.encode()) # publish
+    client.publish(topic, msg) # publish
 
-    found_tag = 0      # reset found_tag to 0
+    finder.maybe_report()  # print full-frame and ROI fps every 2 s
     time.sleep_ms(10)
@@ -1,13 +1,18 @@
 import time
-from mqtt import MQTTClient
+from mqtt_session import MqttSession
 from wifi import *
-from machine import Pin, PWM
+from pose_subscriber import PoseSubscriber
+from fixed_rate import FixedRateLoop
+from pose_estimator import PoseEstimator
+from motor_driver import MotorDriver
+from telemetry import Telemetry
 
-connect_wifi()  # connect to wifi using custom wifi module
+start_wifi()  # starts connecting, the motors are set up meanwhile (see wifi.py)
 
 mqtt_broker = 'broker.hivemq.com'
 port = 1883
 topic_sub = 'ME35-24/noahcam'
+follow_tag = None  # AprilTag id this car follows, None for the first tag seen
 
 desired_x = 0  # Desired position, 0 is center
 desired_z = -7 # z < -3 for the size april tag used
@@ -16,37 +21,7 @@ x_pos = desired_x
 z_pos = desired_z
 found_tag = True
 
-def callback(topic, msg):
-    # callback function to decode mqtt message
-    global x_pos, z_pos, found_tag
-    string = msg.decode()
-    if string[1] == ",":  # confirm correct format from camera
-        tag, x, z = string.split(',')
-        if int(tag) == 1:
-            found_tag = True
-            x_pos = float(x)
-            z_pos = float(z)
-        else:
-            found_tag = False
-            x_pos = desired_x
-            z_pos = desired_z
-
-# connect to MQTT
-client = MQTTClient('motorcontrol', mqtt_broker, port)
-client.connect()
-print('Connected to %s MQTT broker' % (mqtt_broker))
-client.set_callback(callback)  # set the callback for messages
-client.subscribe(topic_sub.encode())  # subscribe to the topic
-
-# Setup PWM control for four pins, two for each motor
-pwm2 = PWM(Pin(2))
-pwm3 = PWM(Pin(3))
-pwm4 = PWM(Pin(4))
-pwm5 = PWM(Pin(5))
-pwm2.freq(1000)
-pwm3.freq(1000)
-pwm4.freq(1000)
-pwm5.freq(1000)
+max_pose_age_ms = 250  # stop the motors if the newest pose is older than this
 
 # PD controller gains
 kp_speed = 7.0  # Proportional gain for speed
@@ -57,80 +32,93 @@ kd_turn = 0.5  # Derivative gain for turning
 
 dead_zone = 6000  # dead zone threshold
 
-# Variables to track previous error for PD controllers
-previous_error_speed = 0
-previous_error_turn = 0
-previous_time = time.ticks_ms()
+# Setup PWM control for four pins, two for each motor. Speeds are steps of
+# duty_step duty above the dead zone; the driver clamps them and only writes
+# changed duties (see motor_driver.py)
+duty_step = 64
+motors = MotorDriver(left=(2, 3), right=(4, 5), freq=1000, levels=1024,
+                     dead_zone=dead_zone, full_scale=1024 * duty_step)
+
+# Smooths the camera poses and predicts them forward to when the motors act,
+# velocities come from the camera timestamps (see pose_estimator.py)
+estimator = PoseEstimator(alpha=0.5, beta=0.2, latency_ms=40)
+boot.mark('motors ready')
+
+# connect to MQTT as soon as the link is up
+wait_wifi()
+client = MqttSession('motorcontrol', mqtt_broker, port, auto_reconnect=False)  # reconnected by the loop
+client.connect()
+print('Connected to %s MQTT broker' % (mqtt_broker))
+boot.mark('mqtt connected')
+boot.report()
 
-# PD controller for speed
-def pd_controller_speed(error, previous_error, delta_time):
-    if delta_time > 0:
-        derivative = (error - previous_error) / delta_time
-    else:
-        derivative = 0
-    control_signal = (kp_speed * error) + (kd_speed * derivative)
+# keeps only the newest pose from the camera, see pose_subscriber.py
+pose = PoseSubscriber(client, topic_sub.encode(), tag_id=follow_tag,
+                      max_age_ms=max_pose_age_ms)
+
+# PD controller for speed, velocity is the rate of change of the error
+def pd_controller_speed(error, velocity):
+    control_signal = (kp_speed * error) + (kd_speed * velocity)
     return control_signal * 1000
 
 # PD controller for turning
-def pd_controller_turn(x_pos, previous_x_pos, delta_time):
+def pd_controller_turn(x_pos, x_velocity):
     error_turn = x_pos - desired_x
-    if delta_time > 0:
-        derivative_turn = (x_pos - previous_x_pos) / delta_time
-    else:
-        derivative_turn = 0
-    turn_signal = (kp_turn * error_turn) + (kd_turn * derivative_turn)
+    turn_signal = (kp_turn * error_turn) + (kd_turn * x_velocity)
     return turn_signal * 1000.0
 
-# Function to control motors based on speed and turn signals
+# Function to control motors based on speed and turn signals (duty units)
 def control_motors(control_signal_speed, turn_signal):
-    # Calculate PWM for speed
-    pwm_val = abs(control_signal_speed) + dead_zone
-    pwm_val = min(65535, int(pwm_val))
-    turn_signal = int(turn_signal)
-
-    # Adjust motor PWM values based on turn signal
-    if control_signal_speed > 0:  # Moving forward
-        pwm2.duty_u16(0)   # Ensure backward pin is off
-        pwm3.duty_u16(pwm_val - turn_signal)  # Apply PWM to right motor
-            
-        pwm4.duty_u16(0)   # Ensure backward pin is off
-        pwm5.duty_u16(pwm_val + turn_signal)  # Reduce left motor speed
-    else:  # Moving backward
-        pwm3.duty_u16(0)  # Ensure forward pin is off
-        pwm2.duty_u16(pwm_val + turn_signal)  # Reverse left motor
-        
-        pwm5.duty_u16(0)  # Ensure forward pin is off
-        pwm4.duty_u16(pwm_val - turn_signal)  # Reverse right motor
+    speed = int(abs(control_signal_speed) / duty_step)
+    turn = int(turn_signal / duty_step)
+
+    # Adjust motor speeds based on turn signal
+    if control_signal_speed > 0:  # Moving forward, on pins 3 and 5
+        motors.drive(-(speed - turn), -(speed + turn))
+    else:  # Moving backward, on pins 2 and 4
+        motors.drive(speed + turn, speed - turn)
+
+# runs the loop every 10 ms from fixed deadlines, loop.stats() shows the
+# real period and jitter (see fixed_rate.py)
+loop = FixedRateLoop(10)
+
+# last 5 s of the loop, call telemetry.flush() from the REPL to append it to
+# telemetry.bin and telemetry.load() on the computer to read it
+telemetry = Telemetry(500)
 
 while True:
-    client.check_msg()  # check for new messages
+    if not client.connected:
+        # broker or Wi-Fi gone: stop first, the reconnect blocks the loop
+        # until the connect succeeds or fails (see mqtt_session.py)
+        motors.stop()
+        client.poll(reconnect=True)  # retried with a backoff
+
+    if pose.drain():  # read all pending messages, keep the newest pose
+        if pose.found:
+            estimator.update(pose.x, pose.z, pose.stamp)
+        else:
+            estimator.reset()
 
+    # never drive on an old pose, or while the broker is away
+    found_tag = pose.found and pose.fresh() and client.connected
     if found_tag:
-        # Time tracking
-        current_time = time.ticks_ms()
-        delta_time = time.ticks_diff(current_time, previous_time) / 1000.0  # Convert to seconds
+        # filtered pose and velocities, predicted to now
+        x_pos, z_pos, x_vel, z_vel = estimator.estimate(pose.age_ms())
 
         # Speed control based on z_pos
         error_speed = z_pos - desired_z
-        control_signal_speed = pd_controller_speed(error_speed, previous_error_speed, delta_time)
+        control_signal_speed = pd_controller_speed(error_speed, z_vel)
 
         # Turn control based on x_pos
-        turn_signal = pd_controller_turn(x_pos, previous_error_turn, delta_time)
+        turn_signal = pd_controller_turn(x_pos, x_vel)
 
-        # Update previous errors and time
-        previous_error_speed = error_speed
-        previous_error_turn = x_pos
-        previous_time = current_time
-        
-        print(control_signal_speed, turn_signal)
+        telemetry.record(time.ticks_ms(), x_pos, z_pos, control_signal_speed, turn_signal, 1)
 
         # Control the motors using the control signals
         control_motors(control_signal_speed, turn_signal)
     else:
         # stop
-        pwm2.duty_u16(0)
-        pwm3.duty_u16(0)
-        pwm5.duty_u16(0)
-        pwm4.duty_u16(0)
+        motors.stop()
+        telemetry.record(time.ticks_ms(), pose.x, pose.z, 0, 0, 0)
 
-    time.sleep_ms(10)
+    loop.wait()  # sleep until the next 10 ms deadline
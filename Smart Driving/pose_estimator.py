@@ -0,0 +1,71 @@
+import time
+
+
+class AlphaBeta:
+    """alpha-beta filter tracking position and velocity along one axis"""
+
+    def __init__(self, alpha=0.5, beta=0.2):
+        self.alpha = alpha  # how much of the position residual is taken
+        self.beta = beta    # how much of the residual goes into velocity
+        self.pos = 0.0
+        self.vel = 0.0
+
+    def reset(self, pos):
+        self.pos = pos
+        self.vel = 0.0
+
+    def update(self, meas, dt):
+        # fold in a measurement taken dt seconds after the previous one
+        pred = self.pos + self.vel * dt
+        residual = meas - pred
+        self.pos = pred + self.alpha * residual
+        self.vel = self.vel + self.beta * residual / dt
+
+    def predict(self, ahead):
+        # position ahead seconds after the last measurement
+        return self.pos + self.vel * ahead
+
+
+class PoseEstimator:
+    """filters x/z tag poses using the camera's capture timestamps
+
+    update() takes each new pose with its camera ticks_ms stamp, so the
+    velocity comes from the real time between frames rather than the car's
+    loop time. estimate() predicts the pose forward to now (how long ago the
+    pose was received) plus latency_ms, the average capture-to-receive delay.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.2, latency_ms=40, max_gap_ms=500,
+                 max_ahead_ms=300):
+        self.x = AlphaBeta(alpha, beta)
+        self.z = AlphaBeta(alpha, beta)
+        self.latency_ms = latency_ms      # camera capture to car receive
+        self.max_gap_ms = max_gap_ms      # restart the filter after a longer gap
+        self.max_ahead_ms = max_ahead_ms  # never extrapolate further than this
+        self.stamp = None
+
+    def reset(self):
+        # forget the track, the next pose starts it again
+        self.stamp = None
+
+    def update(self, x, z, stamp):
+        # add a pose captured at camera time stamp (ms)
+        if self.stamp is not None:
+            dt_ms = time.ticks_diff(stamp, self.stamp)
+            if -self.max_gap_ms <= dt_ms <= 0:
+                return  # same or older frame
+        if self.stamp is None or abs(dt_ms) > self.max_gap_ms:  # long gap or camera restarted
+            self.x.reset(x)
+            self.z.reset(z)
+        else:
+            dt = dt_ms / 1000.0
+            self.x.update(x, dt)
+            self.z.update(z, dt)
+        self.stamp = stamp
+
+    def estimate(self, age_ms=0):
+        # returns (x, z, x_vel, z_vel) predicted to the time the motors act,
+        # age_ms is how long ago the last pose was received by the car
+        ahead = min(age_ms + self.latency_ms, self.max_ahead_ms) / 1000.0
+        return (self.x.predict(ahead), self.z.predict(ahead),
+                self.x.vel, self.z.vel)
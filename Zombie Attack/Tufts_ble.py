@@ -1,40 +1,126 @@
 # This is a minimal library that only advertises (Yells) and reads advertisements (Sniff).
-# It also uses the first character to filter out advertisements.
+# It also uses the first character to filter out advertisements, and Sniff
+# queues the ids of the ones it keeps for drain(). Yell can add the player's
+# game state, read back with Sniff.decode_state().
 
 import bluetooth
 import time
 import struct
+from array import array
 
 NAME_FLAG = 0x09
+MANUFACTURER_FLAG = 0xFF
+COMPANY_ID = 0xFFFF     # reserved for testing, no company's data
+MAX_PAYLOAD = 31
+HUMAN = 0
+ZOMBIE = 1
 IRQ_SCAN_RESULT = 5
 IRQ_SCAN_DONE = 6
 
 class Sniff: 
-    def __init__(self, discriminator = '!', verbose = True): 
+    def __init__(self, discriminator = '!', verbose = True, size = 64): 
         self._ble = bluetooth.BLE()
         self._ble.active(True)
         self._ble.irq(self._irq)
         self.scanning = False 
-        self.last = None
-        self.last_rssi = None
         self.verbose = verbose
         self.discriminator = discriminator
+        self._disc = ord(discriminator)
+        
+        # sightings of names '<discriminator><id>' (e.g. '!12'), written by
+        # the IRQ and read with drain(); when full new ones are dropped
+        self.size = size
+        self.ids = array('H', [0] * size)
+        self.rssis = array('b', [0] * size)
+        self.ticks = array('I', [0] * size)
+        self.head = 0       # next slot the IRQ writes
+        self.tail = 0       # next slot drain() reads
+        self.heard = 0      # advertisements seen
+        self.accepted = 0   # sightings put in the buffer
+        self.dropped = 0    # sightings lost to a full buffer
+        self.last_id = None # newest sighting, for code that reads last/last_rssi
+        self.last_rssi = None
+        self.flag = None    # e.g. an asyncio.ThreadSafeFlag, set on every sighting
+
+    @property
+    def last(self):
+        return None if self.last_id is None else self.discriminator + str(self.last_id)
+
+    @last.setter
+    def last(self, value):
+        self.last_id = None if value is None else int(value[1:])
 
     def _irq(self, event, data):
         if event == IRQ_SCAN_RESULT: #check to see if it is a serialperipheral
             addr_type, addr, adv_type, rssi, adv_data = data
-            name = self.decode_name(adv_data)
+            self.heard += 1
             if self.verbose:
                 print('.',end='')
-            if name == '':
+            # find the name field and read the id straight from adv_data,
+            # nothing is allocated for other devices' packets
+            i = 0
+            n = len(adv_data)
+            while i + 1 < n:
+                length = adv_data[i]
+                if length == 0:
+                    return
+                if adv_data[i + 1] == NAME_FLAG:
+                    break
+                i += 1 + length
+            else:
+                return
+            end = i + 1 + length
+            i += 2
+            if end > n or i >= end or adv_data[i] != self._disc:
+                return
+            tag = 0
+            i += 1
+            if i >= end or end - i > 5:  # no digits, or more than an id can have
+                return
+            while i < end:
+                digit = adv_data[i] - 48
+                if digit < 0 or digit > 9:
+                    return
+                tag = tag * 10 + digit
+                i += 1
+            if tag > 65535:  # does not fit the id ring
                 return
-            if name[0] == self.discriminator:
-                self.last = name
-                self.last_rssi = rssi
+            head = self.head
+            nxt = (head + 1) % self.size
+            if nxt == self.tail:
+                self.dropped += 1
+                return
+            self.ids[head] = tag
+            self.rssis[head] = rssi
+            self.ticks[head] = time.ticks_ms()
+            self.head = nxt
+            self.accepted += 1
+            self.last_id = tag
+            self.last_rssi = rssi
+            if self.flag is not None:
+                self.flag.set()
 
         elif event == IRQ_SCAN_DONE:  # close everything
             self.scanning = False
 
+    def pending(self):
+        return (self.head - self.tail) % self.size
+
+    def drain(self, ids, rssis, ticks, start=0):
+        # copy the waiting sightings (oldest first) into the given arrays
+        # from index start, as many as fit, and return how many
+        n = start
+        tail = self.tail
+        room = len(ids)
+        while tail != self.head and n < room:
+            ids[n] = self.ids[tail]
+            rssis[n] = self.rssis[tail]
+            ticks[n] = self.ticks[tail]
+            tail = (tail + 1) % self.size
+            n += 1
+        self.tail = tail
+        return n - start
+
     def decode_field(self, payload, adv_type):
         i = 0
         result = []
@@ -48,6 +134,18 @@ class Sniff:
         n = self.decode_field(payload, NAME_FLAG)
         return str(n[0], "utf-8") if n else ""
 
+    def decode_state(self, payload):
+        # (player, state, {tag: hits}) from Yell's manufacturer data, or None
+        for data in self.decode_field(payload, MANUFACTURER_FLAG):
+            if len(data) >= 5 and struct.unpack_from("<H", data)[0] == COMPANY_ID:
+                player, state = struct.unpack_from("<HB", data, 2)
+                hits = {}
+                for i in range(5, len(data) - 2, 3):
+                    tag, count = struct.unpack_from("<HB", data, i)
+                    hits[tag] = count
+                return player, state, hits
+        return None
+
     def scan(self, duration = 2000):
         self.scanning = True
         #run for duration sec, with checking every 30 ms for 30 ms
@@ -60,14 +158,50 @@ class Sniff:
         self.scanning = False
 
 class Yell:
+    # Builds the payload once and only restarts advertising when it changes,
+    # so advertise() can be called every loop. Besides the name (which Sniff
+    # reads) the payload can carry the game state in a manufacturer data
+    # field: company id, player id, state and (id, count) hit pairs, as many
+    # as fit in the 31 byte packet.
     def __init__(self):
         self._ble = bluetooth.BLE()
         self._ble.active(True)
-        
-    def advertise(self, name = 'Pico', interval_us=100000):
-        short = name[:8]
-        payload = struct.pack("BB", len(short) + 1, NAME_FLAG) + name[:8]  # byte length, byte type, value
-        self._ble.gap_advertise(interval_us, adv_data=payload)
+        self.payload = None     # bytes on the air, None when not advertising
+        self.interval_us = None
+        self._built = None      # last payload built, and what from
+        self._name = None
+        self._player = None
+        self._state = None
+        self._hits = None
+        self.builds = 0
+        self.restarts = 0       # gap_advertise() calls
+
+    def build(self, name, player=None, state=None, hits=None):
+        short = name[:8].encode()
+        payload = struct.pack("BB", len(short) + 1, NAME_FLAG) + short  # byte length, byte type, value
+        if player is not None:
+            data = struct.pack("<HHB", COMPANY_ID, player, state or 0)
+            room = (MAX_PAYLOAD - len(payload) - 2 - len(data)) // 3
+            for tag, count in sorted((hits or {}).items())[:max(0, room)]:
+                data += struct.pack("<HB", tag, min(count, 255))
+            payload += struct.pack("BB", len(data) + 1, MANUFACTURER_FLAG) + data
+        self.builds += 1
+        return payload
+
+    def advertise(self, name = 'Pico', interval_us=100000, player=None, state=None, hits=None):
+        if (name != self._name or player != self._player or state != self._state
+                or hits != self._hits):
+            self._built = self.build(name, player, state, hits)
+            self._name, self._player, self._state = name, player, state
+            self._hits = None if hits is None else dict(hits)
+        if self._built == self.payload and interval_us == self.interval_us:
+            return  # already on the air
+        self.payload = self._built
+        self.interval_us = interval_us
+        self._ble.gap_advertise(interval_us, adv_data=self.payload)
+        self.restarts += 1
         
     def stop_advertising(self):
-        self._ble.gap_advertise(None)
\ No newline at end of file
+        self._ble.gap_advertise(None)
+        self.payload = None
+        self.interval_us = None
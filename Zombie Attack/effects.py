@@ -0,0 +1,120 @@
+import asyncio
+import neopixel
+from machine import Pin
+
+# NeoPixel and buzzer feedback that never holds up the game.
+#
+# play('flash', ...) only queues the effect; the run() task plays the queue
+# one effect at a time and goes back to the base color and tone (show())
+# after each. The game loop keeps scanning while an effect plays.
+#
+#   flash  color, times, on_ms, off_ms, freq   blink with a beep
+#   pulse  color, period_ms, times             fade up and down
+#   tones  [(freq, ms), ...]                   tone sequence, freq 0 rests
+#
+# define(name, fn) adds effects: fn(effects, *args) is an async function.
+
+
+class Pixel:
+    """one NeoPixel, written only when its color changes"""
+
+    def __init__(self, pin):
+        self.neo = neopixel.NeoPixel(Pin(pin), 1)
+        self.color = None
+
+    def show(self, color):
+        if color != self.color:
+            self.neo[0] = color
+            self.neo.write()
+            self.color = color
+
+
+class Effects:
+    def __init__(self, pixel, buzzer, size=4, duty=1000):
+        self.pixel = pixel
+        self.buzzer = buzzer
+        self.duty = duty          # buzzer loudness while a tone plays
+        self.size = size
+        self.queue = []           # (name, args) waiting to play
+        self.event = asyncio.Event()
+        self.effects = {'flash': Effects.flash, 'pulse': Effects.pulse, 'tones': Effects.tones}
+        self.color = (0, 0, 0)    # base color and tone, between effects
+        self.freq = 0
+        self.playing = None       # name of the effect playing
+        self.played = 0
+        self.dropped = 0          # effects thrown out of a full queue, or unknown
+        self.failed = 0           # effects that raised while playing
+
+    def define(self, name, fn):
+        self.effects[name] = fn
+
+    def play(self, name, *args):
+        # queue an effect and return at once; a full queue drops the oldest
+        if name not in self.effects:
+            print('no effect called', name)
+            self.dropped += 1
+            return False
+        if len(self.queue) >= self.size:
+            self.queue.pop(0)
+            self.dropped += 1
+        self.queue.append((name, args))
+        self.event.set()
+        return True
+
+    def show(self, color, freq=0):
+        # base color and tone (0: quiet); shown now unless an effect is playing
+        self.color = color
+        self.freq = freq
+        if self.playing is None:
+            self._base()
+
+    def _base(self):
+        self.pixel.show(self.color)
+        self.tone(self.freq)
+
+    def tone(self, freq):
+        if freq:
+            self.buzzer.freq(freq)
+            self.buzzer.duty_u16(self.duty)
+        else:
+            self.buzzer.duty_u16(0)
+
+    async def run(self):
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            while self.queue:
+                name, args = self.queue.pop(0)
+                self.playing = name
+                try:
+                    await self.effects[name](self, *args)
+                    self.played += 1
+                except Exception as e:
+                    # a bad effect (or bad arguments) must not stop the player
+                    print('effect', name, 'failed:', e)
+                    self.failed += 1
+                finally:
+                    self.playing = None
+                    self._base()
+
+    async def flash(self, color=(255, 0, 0), times=1, on_ms=200, off_ms=200, freq=880):
+        for i in range(times):
+            self.tone(freq)
+            self.pixel.show(color)
+            await asyncio.sleep_ms(on_ms)
+            self.pixel.show((0, 0, 0))
+            await asyncio.sleep_ms(off_ms)
+            self.tone(0)
+
+    async def pulse(self, color=(0, 0, 255), period_ms=1000, times=1, steps=10):
+        wait = period_ms // (2 * steps)
+        for i in range(times):
+            for k in list(range(1, steps + 1)) + list(range(steps - 1, -1, -1)):
+                self.pixel.show(tuple(c * k // steps for c in color))
+                await asyncio.sleep_ms(wait)
+
+    async def tones(self, notes):
+        for freq, ms in notes:
+            self.tone(freq)
+            await asyncio.sleep_ms(ms)
+        self.tone(0)
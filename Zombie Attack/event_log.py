@@ -0,0 +1,216 @@
+import struct
+import time
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+# Append-only log of the game's events on flash.
+#
+# Every event is one fixed 8 byte record:
+#
+#   tick   I   time.ticks_ms()
+#   tag    H   tag id (0 for START)
+#   kind   B   START, ENTER, LEAVE, TAG, ZOMBIFY or RSSI
+#   value  b   RSSI: filtered RSSI, others: times tagged by this tag so far
+#
+# record() packs into one of two block buffers and never touches flash. When
+# a buffer fills, the other one takes the records and the full one waits for
+# service() to append it to the file as a block:
+#
+#   magic  4s  b'EVT1'
+#   count  H   number of records in the block
+#   pad    H   0
+#   count records
+#
+# so the scan loop only writes when it has time to, a whole block at once.
+# Under asyncio, run() is that task: it writes a full block only when quiet()
+# says there is time (e.g. the sniffer's ring is nearly empty), letting the
+# other tasks run before and after the write. If both buffers are full, records are dropped (and counted) rather than
+# waiting for flash. load() on the host reads the logs of many devices into
+# NumPy arrays, stats() turns them into per-player numbers.
+
+MAGIC = b'EVT1'
+HEADER = '<4sHH'
+HEADER_SIZE = struct.calcsize(HEADER)
+RECORD = '<IHBb'
+RECORD_SIZE = struct.calcsize(RECORD)
+
+# same numbers as tag_tracker's events
+START = 0
+ENTER = 1
+LEAVE = 2
+TAG = 3
+ZOMBIFY = 4
+RSSI = 5
+KIND_NAMES = ('start', 'enter', 'leave', 'tag', 'zombify', 'rssi')
+
+
+class EventLog:
+    """double-buffered writer of event records, block records per write"""
+
+    def __init__(self, path='events.bin', block=64):
+        self.path = path
+        self.block = block
+        self.buffers = (bytearray(HEADER_SIZE + block * RECORD_SIZE),
+                        bytearray(HEADER_SIZE + block * RECORD_SIZE))
+        self.active = 0       # buffer record() writes to
+        self.count = 0        # records in the active buffer
+        self.full = None      # buffer waiting for service(), None if none
+        self.records = 0
+        self.dropped = 0      # records lost with both buffers full
+        self.written = 0      # blocks appended to the file
+        self.record(time.ticks_ms(), START)
+
+    def record(self, tick, kind, tag=0, value=0):
+        if self.count == self.block:
+            if self.full is not None:
+                self.dropped += 1
+                return False
+            self.full = self.active
+            self.active ^= 1
+            self.count = 0
+        struct.pack_into(RECORD, self.buffers[self.active], HEADER_SIZE + self.count * RECORD_SIZE,
+                         tick, tag, kind, max(-128, min(127, value)))
+        self.count += 1
+        self.records += 1
+        return True
+
+    def service(self):
+        # append the full buffer to the file, if there is one; call when
+        # there is time for a flash write
+        if self.full is None:
+            return False
+        self._write(self.buffers[self.full], self.block)
+        self.full = None
+        return True
+
+    async def run(self, quiet=None, poll_ms=100):
+        # task: append full blocks while quiet() is True (always if None);
+        # the write itself still holds up the other tasks while it lasts
+        while True:
+            await asyncio.sleep_ms(poll_ms)
+            if self.full is None or (quiet is not None and not quiet()):
+                continue
+            await asyncio.sleep_ms(0)  # whatever is waiting goes first
+            self.service()
+
+    def close(self):
+        # write out everything held, e.g. at the end of the game
+        self.service()
+        if self.count:
+            self._write(self.buffers[self.active], self.count)
+            self.count = 0
+
+    def _write(self, buf, n):
+        struct.pack_into(HEADER, buf, 0, MAGIC, n, 0)
+        with open(self.path, 'ab') as f:
+            f.write(memoryview(buf)[:HEADER_SIZE + n * RECORD_SIZE])
+        self.written += 1
+
+
+def load(paths):
+    # host side: every block of one or more devices' logs, memory-mapped and
+    # concatenated into NumPy arrays {'device', 'game', 'tick', 'tag', 'kind',
+    # 'value'}; device is the index in paths, game counts START records
+    import os
+    import numpy as np
+    if isinstance(paths, str):
+        paths = [paths]
+    dtype = np.dtype([('tick', '<u4'), ('tag', '<u2'), ('kind', 'u1'), ('value', 'i1')])
+    parts = []
+    devices = []
+    for device, path in enumerate(paths):
+        if not os.path.getsize(path):
+            continue
+        data = np.memmap(path, np.uint8, 'r')
+        offset = 0
+        while offset + HEADER_SIZE <= len(data):
+            magic, n, pad = struct.unpack_from(HEADER, data, offset)
+            if magic != MAGIC:
+                raise ValueError('bad event block at byte %d of %s' % (offset, path))
+            offset += HEADER_SIZE
+            parts.append(np.frombuffer(data, dtype, n, offset))
+            devices.append(np.full(n, device, np.uint16))
+            offset += n * RECORD_SIZE
+    rec = np.concatenate(parts) if parts else np.zeros(0, dtype)
+    device = np.concatenate(devices) if devices else np.zeros(0, np.uint16)
+    # a game starts at each START and with each device's log
+    starts = rec['kind'] == START
+    starts[1:] |= device[1:] != device[:-1]
+    if len(starts):
+        starts[0] = True
+    events = {name: rec[name] for name in dtype.names}
+    events['device'] = device
+    events['game'] = np.cumsum(starts) - 1
+    return events
+
+
+def stats(events):
+    # host side: one row per (game, tag) heard in it, as NumPy arrays
+    # {'game', 'device', 'tag', 'enters', 'tags', 'in_range_s', 'rssi_mean',
+    # 'rssi_max', 'zombified'}, and {'game', 'device', 'length_s',
+    # 'zombie'} per game (zombie -1 if the player was not zombified)
+    import numpy as np
+    game, tag, kind = events['game'], events['tag'].astype(np.int64), events['kind']
+    tick = events['tick'].astype(np.int64)
+    n_games = int(game.max()) + 1 if len(game) else 0
+
+    # per game
+    first = np.full(n_games, np.iinfo(np.int64).max)
+    last = np.full(n_games, np.iinfo(np.int64).min)
+    np.minimum.at(first, game, tick)
+    np.maximum.at(last, game, tick)
+    per_game = {
+        'game': np.arange(n_games),
+        'device': np.zeros(n_games, np.int64),
+        'length_s': ((last - first) & 0xffffffff) / 1000.0,
+        'zombie': np.full(n_games, -1),
+    }
+    per_game['device'][game] = events['device']
+    z = kind == ZOMBIFY
+    per_game['zombie'][game[z]] = tag[z]
+
+    # per (game, tag), for the events about a tag
+    about = kind != START
+    key = game[about] * 65536 + tag[about]
+    keys, row = np.unique(key, return_inverse=True)
+    k = kind[about]
+    value = events['value'][about].astype(np.float64)
+    rssi = k == RSSI
+    n_rssi = np.bincount(row, rssi, len(keys))
+    rssi_max = np.full(len(keys), np.nan)
+    if rssi.any():
+        rssi_max[:] = -128
+        np.maximum.at(rssi_max, row[rssi], value[rssi])
+        rssi_max[n_rssi == 0] = np.nan
+
+    # time in range: each ENTER with the LEAVE that follows it for that tag,
+    # or the end of the game if it never left
+    t = tick[about]
+    order = np.lexsort((t, row))
+    edge = np.isin(k[order], (ENTER, LEAVE))
+    o = order[edge]
+    r, kk, tt = row[o], k[o], t[o]
+    g_end = last[game[about][o]]
+    pair = np.zeros(len(o), bool)
+    pair[:-1] = (kk[:-1] == ENTER) & (kk[1:] == LEAVE) & (r[:-1] == r[1:])
+    until = np.where(pair, np.roll(tt, -1), g_end)
+    stay = np.where(kk == ENTER, (until - tt) & 0xffffffff, 0) / 1000.0
+
+    g = keys // 65536
+    tags = keys % 65536
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rssi_mean = np.bincount(row, np.where(rssi, value, 0), len(keys)) / n_rssi
+    return {
+        'game': g,
+        'device': per_game['device'][g],
+        'tag': tags,
+        'enters': np.bincount(row, k == ENTER, len(keys)).astype(np.int64),
+        'tags': np.bincount(row, k == TAG, len(keys)).astype(np.int64),
+        'in_range_s': np.bincount(r, stay, len(keys)),
+        'rssi_mean': rssi_mean,
+        'rssi_max': rssi_max,
+        'zombified': per_game['zombie'][g] == tags,
+    }, per_game
@@ -0,0 +1,151 @@
+import _thread
+import asyncio
+import time
+from array import array
+
+# Dual-core mode: core 1 runs the game rules, core 0 the output.
+#
+# Ingest runs on core 1 (_thread). It drains sightings from Sniff's ring and
+# runs the TagTracker on them: the per-tag filter, enter/leave/tag/zombify
+# and the leave timeouts all happen there. Core 0 only gets the results:
+#
+#   events  every ENTER/LEAVE/TAG/ZOMBIFY as (event, tag id, ticks_ms, times
+#           tagged by it). Core 1 queues them in its own buffer; when core 0
+#           has finished with the previous ones, the two buffers are swapped
+#           under a lock and flag is set. take_events() hands them to core 0.
+#   view    the ids and filtered RSSI of the tags in range and the strongest
+#           level, copied under the lock after every pass; snapshot() reads
+#           them, the same call as TagTracker.snapshot().
+#
+# Core 0 never touches the tracker while core 1 runs; after stop() it is
+# core 0's again (results() for the file). If core 0 falls behind, events
+# wait in core 1's buffer and only a full buffer loses them (lost_events).
+#
+# The BLE IRQ that fills Sniff's ring still runs on core 0: MicroPython runs
+# it from the scheduler of the main thread.
+
+
+class Busy:
+    """time spent working, out of the time since start"""
+
+    def __init__(self):
+        self.start = time.ticks_us()
+        self.busy_us = 0
+        self.since = 0
+
+    def begin(self):
+        self.since = time.ticks_us()
+
+    def end(self):
+        self.busy_us += time.ticks_diff(time.ticks_us(), self.since)
+
+    def percent(self):
+        elapsed = time.ticks_diff(time.ticks_us(), self.start)
+        return 100 * self.busy_us / elapsed if elapsed > 0 else 0
+
+
+def _events(n):
+    # event, tag id, ticks_ms, times tagged
+    return (bytearray(n), array('H', [0] * n), array('I', [0] * n), array('H', [0] * n))
+
+
+class Ingest:
+    def __init__(self, sniff, tracker, size=32, events=16, view=16, idle_us=1000):
+        self.sniff = sniff
+        self.tracker = tracker
+        tracker.on_event = self._event  # called on core 1
+        self.idle_us = idle_us    # core 1 sleep when there is nothing to do
+        self.lock = _thread.allocate_lock()
+        self.flag = asyncio.ThreadSafeFlag()
+        # sightings, core 1 only
+        self.sightings = (array('H', [0] * size), array('b', [0] * size), array('I', [0] * size))
+        # events: core 1 fills queued, core 0 reads handed
+        self.queued = _events(events)
+        self.handed = _events(events)
+        self.n_queued = 0
+        self.n_handed = 0         # events in handed, 0 once core 0 took them
+        self.lost_events = 0
+        # view of the tags in range, written by core 1 under the lock
+        self.view_ids = array('H', [0] * view)
+        self.view_levels = array('f', [0] * view)
+        self.n_view = 0
+        self.level = -200.0
+        self.busy = Busy()        # core 1
+        self.running = False
+        self.alive = False
+
+    def start(self):
+        self.running = True
+        self.alive = True
+        _thread.start_new_thread(self._run, ())
+
+    def stop(self):
+        # ask core 1 to finish and wait for it
+        self.running = False
+        while self.alive:
+            time.sleep_ms(1)
+
+    def _event(self, event, tag_id, t):
+        # core 1, from the tracker
+        n = self.n_queued
+        if n == len(self.queued[0]):
+            self.lost_events += 1
+            return
+        kinds, ids, ticks, counts = self.queued
+        kinds[n] = event
+        ids[n] = tag_id
+        ticks[n] = t
+        counts[n] = self.tracker.counts[self.tracker.slots[tag_id]]
+        self.n_queued = n + 1
+
+    def _run(self):
+        # core 1
+        sniff = self.sniff
+        tracker = self.tracker
+        ids, rssis, ticks = self.sightings
+        try:
+            while self.running:
+                self.busy.begin()
+                n = sniff.drain(ids, rssis, ticks)
+                if n:
+                    tracker.process(ids, rssis, ticks, n)
+                tracker.expire(time.ticks_ms())  # every pass, so a quiet room drops the level too
+                handed = False
+                with self.lock:
+                    self.n_view, self.level = tracker.snapshot(self.view_ids, self.view_levels)
+                    if self.n_queued and not self.n_handed:
+                        self.queued, self.handed = self.handed, self.queued
+                        self.n_handed, self.n_queued = self.n_queued, 0
+                        handed = True
+                self.busy.end()
+                if handed:
+                    self.flag.set()
+                if not sniff.pending():
+                    time.sleep_us(self.idle_us)
+        finally:
+            self.alive = False
+
+    def take_events(self, handler):
+        # core 0: handler(event, tag id, ticks_ms, times tagged) for every
+        # event core 1 handed over; after stop(), for the queued ones too
+        with self.lock:
+            n = self.n_handed
+        kinds, ids, ticks, counts = self.handed
+        for k in range(n):
+            handler(kinds[k], ids[k], ticks[k], counts[k])
+        with self.lock:
+            self.n_handed = 0
+            if not self.alive and self.n_queued:
+                self.queued, self.handed = self.handed, self.queued
+                self.n_handed, self.n_queued = self.n_queued, 0
+        if not self.alive and self.n_handed:
+            self.take_events(handler)
+
+    def snapshot(self, ids, levels):
+        # core 0: like TagTracker.snapshot(), from core 1's last pass
+        with self.lock:
+            n = min(self.n_view, len(ids), len(self.view_ids))
+            for k in range(n):
+                ids[k] = self.view_ids[k]
+                levels[k] = self.view_levels[k]
+            return self.n_view, self.level
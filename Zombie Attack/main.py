@@ -1,144 +1,181 @@
 import time
-from Tufts_ble import Sniff, Yell  # Import BLE modules for scanning and advertising
-import neopixel  # Library for controlling NeoPixels
+from Tufts_ble import Sniff, Yell, ZOMBIE  # Import BLE modules for scanning and advertising
 from machine import Pin, PWM  # Library for controlling GPIO pins and PWM
 import asyncio
+from array import array
+from tag_tracker import TagTracker, ENTER, LEAVE, TAG, ZOMBIFY
+from event_log import EventLog, RSSI
+from effects import Effects, Pixel
+from ingest import Busy, Ingest
 
-# Control LED brightness based on RSSI strength
-def leds_by_strength(leds, rssi, thresh):
-    n_leds = len(leds)
-    # Calculate number of LEDs to turn on based on RSSI and threshold
-    num = min(n_leds - int((thresh - rssi) / 5), n_leds)
+DUAL_CORE = False  # True: core 1 runs the game rules, see ingest.py
+
+class LedBar:
+    """LEDs lit in proportion to RSSI, only changed pins are written"""
     
-    # Turn all LEDs off initially
-    for i in range(n_leds):
-        leds[i].off()
+    def __init__(self, pins, thresh, step=5):
+        self.leds = [Pin(i, Pin.OUT, value=0) for i in pins]
+        self.thresh = thresh  # all LEDs on at and above this RSSI
+        self.step = step      # dB per LED below it
+        self.lit = 0
+        self.writes = 0
+        
+    def show(self, rssi):
+        n_leds = len(self.leds)
+        # Calculate number of LEDs to turn on based on RSSI and threshold
+        num = max(0, min(n_leds - int((self.thresh - rssi) / self.step), n_leds))
+        # switch only the LEDs between the old and the new level
+        for i in range(num, self.lit):
+            self.leds[i].off()
+        for i in range(self.lit, num):
+            self.leds[i].on()
+        self.writes += abs(num - self.lit)
+        self.lit = num
         
-    # Turn on the appropriate number of LEDs
-    for i in range(num):
-        leds[i].on()
+    def off(self):
+        self.show(-200)
 
-# Flash the NeoPixel red and trigger the buzzer
-def flash_red(neo, buz):
-    buz.freq(880)  # Set buzzer frequency to 880Hz
-    buz.duty_u16(1000)  # Set buzzer duty cycle to 1000
-    neo[0] = (255, 0, 0)  # Set NeoPixel to red
-    neo.write()  # Apply color to the NeoPixel
-    time.sleep(0.2)  # Wait for 0.2 seconds
-    neo[0] = (0, 0, 0)  # Turn off NeoPixel
-    neo.write()  # Apply the update
-    time.sleep(0.2)  # Wait for 0.2 seconds
-    buz.duty_u16(0)  # Turn off the buzzer
+# Flash the NeoPixel red and trigger the buzzer, played by the effects task
+def flash_red(effects):
+    effects.play('flash', (255, 0, 0), 1, 200, 200, 880)  # 0.2 s red and 880Hz, 0.2 s off
 
-# Save the results to a text file
-def save_results(results):
+# Save the results to a text file, and the rest of the game's events
+def save_results(results, log):
     with open("zombie_results.txt", "w") as f:
         f.write(str(results))  # Convert the results to string and write to file
+    log.close()  # events.bin, read with results.py on the computer
+
+# Take the sightings as the sniffer reports them and run the game rules on them
+async def sightings(c, tracker, ids, rssis, ticks, busy):
+    c.flag = asyncio.ThreadSafeFlag()  # set by the BLE IRQ for every sighting
+    while True:
+        await c.flag.wait()
+        busy.begin()
+        n = c.drain(ids, rssis, ticks)
+        while n:
+            tracker.process(ids, rssis, ticks, n)
+            n = c.drain(ids, rssis, ticks)  # more came in, or more than fit
+        busy.end()
+
+# Dual-core: core 1 runs the game rules, take the events it hands over
+async def events(ingest, on_event, busy):
+    while True:
+        await ingest.flag.wait()
+        busy.begin()
+        ingest.take_events(on_event)
+        busy.end()
 
 # Main function to handle BLE tracking and interaction
-def main():
-    # Initialize LEDs on GPIO pins 0 to 5
-    leds = [Pin(i, Pin.OUT) for i in range(6)]
-    
+async def main():
     # Initialize buzzer on GPIO18
     buz = PWM(Pin('GPIO18', Pin.OUT))
     
-    # Initialize NeoPixel on GPIO28
-    neo = neopixel.NeoPixel(Pin(28), 1)
-    neo[0] = (0, 255, 0)  # Set initial color to green
-    neo.write()  # Apply the update
+    # Initialize NeoPixel on GPIO28, flashes and tones play on their own task
+    effects = Effects(Pixel(28), buz)
+    effects.show((0, 255, 0))  # Set initial color to green
+    player = asyncio.create_task(effects.run())
     
-    # Initialize tag tracking variables
-    tags = [0] * 13
-    start_times = [None] * 13
-    last_times = [None] * 13
-    in_range = [False] * 13  # Track if each tag is currently in range
-    just_tagged = [False] * 13  # Track if each tag was recently tagged
     c = Sniff('!', verbose=False)  # BLE sniffer, scanning for advertisements
     
-    rssi_thresh = -60  # RSSI threshold for detecting devices
+    rssi_thresh = -60  # filtered RSSI threshold for detecting devices
     
-    alive = True  # Flag for player's status
-    zombie = 0  # ID of the zombie that tags the player
+    # Initialize LEDs on GPIO pins 0 to 5
+    bar = LedBar(range(6), rssi_thresh)
+    
+    log = EventLog('events.bin')  # every game event, see event_log.py
+    # full blocks go to flash from their own task, only while the sniffer's
+    # ring is nearly empty so the sightings are not held up
+    writer = asyncio.create_task(log.run(lambda: c.pending() < 8))
+    
+    def on_event(event, tagged, t, count):
+        # game events from the tracker, see tag_tracker.py; count is the
+        # times tagged by this tag so far
+        log.record(t, event, tagged, count)
+        if event == ENTER:
+            print(f"Tag {tagged} re-entered range")
+        elif event == LEAVE:
+            print(f"Tag {tagged} left range")
+        elif event == TAG:
+            print(f'Tagged by group {tagged}')
+            flash_red(effects)  # Flash red and activate buzzer, without waiting for it
+        elif event == ZOMBIFY:
+            print(f'Zombified by {tagged}')
+    
+    # enter/leave/tag/zombify rules for any number of tags, on each tag's
+    # filtered RSSI (range_m=1.5 would decide on estimated distance instead)
+    tracker = TagTracker(rssi_thresh=rssi_thresh, alpha=0.3,
+                         on_event=lambda event, tagged, t: on_event(
+                             event, tagged, t, tracker.counts[tracker.slots[tagged]]))
     c.scan(0)  # Start BLE scan indefinitely
 
-    while alive:
-        latest = c.last  # Latest advertisement received
-        rssi = c.last_rssi  # RSSI of the latest advertisement
+    busy = Busy()  # core 0 time in the game rules or events, LEDs and log (not the IRQs)
+    if DUAL_CORE:
+        ingest = Ingest(c, tracker)  # the tracker is core 1's until ingest.stop()
+        ingest.start()
+        scanner = asyncio.create_task(events(ingest, on_event, busy))
+        view = ingest
+    else:
+        # sightings taken from the sniffer as they come, see Sniff.drain()
+        ids = array('H', [0] * 32)
+        rssis = array('b', [0] * 32)
+        ticks = array('I', [0] * 32)
+        scanner = asyncio.create_task(sightings(c, tracker, ids, rssis, ticks, busy))
+        view = tracker
+    in_range = array('H', [0] * 16)  # tags in range and their filtered RSSI
+    levels = array('f', [0] * 16)
+
+    # every 0.1 s: leave range, LEDs, NeoPixel and the log
+    while tracker.zombie is None:
+        busy.begin()
+        if not DUAL_CORE:
+            tracker.expire(time.ticks_ms())  # tags no longer heard leave range
+        n, level = view.snapshot(in_range, levels)
         
-        # If a new advertisement is received
-        if latest:
-            leds_by_strength(leds, rssi, rssi_thresh)  # Update LEDs based on RSSI
-            c.last, c.last_rssi = None, None  # Reset last advertisement and RSSI
-            
-            if rssi > rssi_thresh:  # If RSSI is strong enough
-                neo[0] = (0, 0, 255)  # Set NeoPixel to blue as a warning
-                neo.write()
-                
-                t = time.ticks_ms()  # Get current time in milliseconds
-                tagged = int(latest[1:])  # Extract tag ID from advertisement
-                index = tagged - 1  # Adjust tag ID to array index
-                
-                # If the tag re-enters the range
-                if not in_range[index]:
-                    print(f"Tag {tagged} re-entered range")
-                    in_range[index], start_times[index], last_times[index] = True, t, t
-                    just_tagged[index] = False
-                
-                else:
-                    # Check if still in range (within 1 second)
-                    if t - last_times[index] < 1000:
-                        last_times[index] = t  # Update the last seen time
-                    else:
-                        # Tag has left the range for too long
-                        print(f"Tag {tagged} left range")
-                        in_range[index] = False
-                        just_tagged[index] = False
-                        start_times[index], last_times[index] = None, None
-                
-                # If the tag has been in range for more than 3 seconds and hasn't been recently tagged
-                if in_range[index] and t - start_times[index] > 3000 and not just_tagged[index]:
-                    tags[index] += 1  # Increment tag count for this tag
-                    print(f'Tagged by group {tagged}')
-                    just_tagged[index] = True
-                    flash_red(neo, buz)  # Flash red and activate buzzer
-                    
-                    # If the player is tagged 3 times by the same group, they become a zombie
-                    if tags[index] == 3:
-                        print(f'Zombified by {tagged}')
-                        zombie = tagged
-                        alive = False
-                        save_results(tags)  # Save the tagging results to file
-                        
+        if n:
+            effects.show((0, 0, 255))  # Set NeoPixel to blue as a warning, a tag is in range
         else:
-            # Set NeoPixel to green to signify the player is safe
-            neo[0] = (0, 255, 0)
-            neo.write()
-            leds_by_strength(leds, -200, rssi_thresh)  # Turn off all LEDs
+            effects.show((0, 255, 0))  # Set NeoPixel to green to signify the player is safe
+        bar.show(level)  # LEDs from the strongest filtered RSSI
+        
+        now = time.ticks_ms()
+        for k in range(min(n, len(in_range))):  # filtered RSSI of the tags in range
+            log.record(now, RSSI, in_range[k], int(levels[k]))
+        busy.end()
         
-        time.sleep(0.1)  # Wait for 0.1 seconds before the next loop
+        await asyncio.sleep(0.1)  # Wait for 0.1 seconds before the next loop
+
+    if DUAL_CORE:
+        ingest.stop()
+        ingest.take_events(on_event)  # the last ones, the ZOMBIFY among them
+    scanner.cancel()
+    writer.cancel()
+    if DUAL_CORE:
+        print('core 0 busy %d%%, core 1 busy %d%%' % (busy.percent(), ingest.busy.percent()))
+    else:
+        print('core 0 busy %d%%' % busy.percent())
+    zombie = tracker.zombie  # ID of the zombie that tagged the player
+    results = tracker.results()
+    save_results(results, log)  # Save the tagging results to file
 
     c.stop_scan()  # Stop BLE scanning when the player becomes a zombie
 
     # Set NeoPixel red and activate buzzer to indicate zombification
-    neo[0] = (255, 0, 0)
-    neo.write()
-    buz.freq(440)
-    buz.duty_u16(1000)
+    effects.show((255, 0, 0), 440)
     
     # Wait for button press to start advertising
     button = Pin('GPIO20', Pin.IN)
     p = Yell()  # Start BLE advertising
     while button.value():
-        p.advertise(f'!{zombie}')  # Advertise the zombie's tag ID
-        time.sleep(0.1)
+        # Advertise the zombie's tag ID and how we were tagged, the radio is
+        # only restarted if that changes
+        p.advertise(f'!{zombie}', player=zombie, state=ZOMBIE, hits=results)
+        await asyncio.sleep(0.1)
     
     # Stop advertising and turn everything off
     p.stop_advertising()
-    buz.duty_u16(0)
-    neo[0] = (0, 0, 0)
-    neo.write()
-    leds_by_strength(leds, -200, rssi_thresh)  # Turn off all LEDs
+    effects.show((0, 0, 0))
+    player.cancel()
+    bar.off()  # Turn off all LEDs
 
 # Start the main function
-main()
+asyncio.run(main())
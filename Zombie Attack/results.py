@@ -1,7 +1,35 @@
+import sys
+
+# On the Pico: prints zombie_results.txt.
+# On the computer, with the events.bin of one or more players copied over:
+#
+#   python results.py player1/events.bin player2/events.bin ...
+#
+# prints every game and, per game, the zombies that came in range.
+
 def read_results():
     with open("zombie_results.txt", "r") as f:
         array_str = f.read()
     print(array_str)
     return array_str
 
-read_results()
\ No newline at end of file
+def report(paths):
+    from event_log import load, stats
+    events = load(paths)
+    rows, games = stats(events)
+    print('%d events from %d logs, %d games' % (len(events['tick']), len(paths), len(games['game'])))
+    for g in games['game']:
+        zombie = games['zombie'][g]
+        print('\ngame %d (%s): %.1f s, %s' % (
+            g, paths[games['device'][g]], games['length_s'][g],
+            'zombified by %d' % zombie if zombie >= 0 else 'not zombified'))
+        print('  %5s %6s %5s %10s %9s %8s' % ('tag', 'enters', 'tags', 'in range s', 'mean rssi', 'max rssi'))
+        for i in (rows['game'] == g).nonzero()[0]:
+            print('  %5d %6d %5d %10.1f %9.1f %8.0f%s' % (
+                rows['tag'][i], rows['enters'][i], rows['tags'][i], rows['in_range_s'][i],
+                rows['rssi_mean'][i], rows['rssi_max'][i], ' *' if rows['zombified'][i] else ''))
+
+if len(sys.argv) > 1:
+    report(sys.argv[1:])
+else:
+    read_results()
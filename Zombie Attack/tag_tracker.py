@@ -0,0 +1,191 @@
+# Keeps the zombie game rules for every tag id heard, however many players:
+#
+#   enter   a strong sighting of a tag that is not in range
+#   leave   no strong sighting of an in-range tag for leave_ms
+#   tag     a tag stays in range for tag_ms (once per stay)
+#   zombify the same tag has tagged us tags_to_zombify times
+#
+# "Strong" is decided on each tag's filtered RSSI (an exponential moving
+# average with weight alpha on the new sample), or with range_m set, on the
+# distance the log-distance path-loss model gives for it.
+
+import math
+import time
+from array import array
+
+ENTER = 1
+LEAVE = 2
+TAG = 3
+ZOMBIFY = 4
+
+
+def rssi_to_distance(rssi, tx_power=-59, n=2.0):
+    # log-distance path loss: tx_power is the RSSI at 1 m, n the path-loss
+    # exponent (2 in free space, 2.5-4 indoors); returns meters
+    return 10 ** ((tx_power - rssi) / (10 * n))
+
+
+class TagTracker:
+    """per-tag state in arrays, one slot per tag id heard so far
+
+    Slots are found through a dict and the arrays double when full. Only the
+    tags in range are checked for the leave timeout, so a tick costs the
+    number of sightings plus the tags in range, not the whole roster.
+    on_event(event, tag_id, t) is called for every ENTER/LEAVE/TAG/ZOMBIFY.
+    """
+
+    def __init__(self, capacity=16, rssi_thresh=-60, leave_ms=1000, tag_ms=3000,
+                 tags_to_zombify=3, alpha=0.3, range_m=None, tx_power=-59, n=2.0,
+                 hold_ms=200, on_event=None):
+        self.rssi_thresh = rssi_thresh
+        self.alpha = alpha
+        if range_m is not None:
+            # same test as the distance, done on the filtered RSSI
+            self.rssi_thresh = tx_power - 10 * n * math.log10(range_m)
+        self.tx_power = tx_power
+        self.n = n
+        self.leave_ms = leave_ms
+        self.tag_ms = tag_ms
+        self.tags_to_zombify = tags_to_zombify
+        self.hold_ms = hold_ms    # how long strongest() keeps a sighting's level
+        self.on_event = on_event
+        self.slots = {}           # tag id -> slot
+        self.ids = array('H')     # slot -> tag id
+        self.counts = array('H')  # times tagged by this tag
+        self.start = array('I')   # ticks_ms the tag came in range
+        self.last = array('I')    # ticks_ms of its last strong sighting
+        self.heard = array('I')   # ticks_ms of its last sighting
+        self.level = array('f')   # filtered RSSI
+        self.in_range = bytearray()
+        self.just_tagged = bytearray()
+        self._grow(capacity)
+        self.used = 0
+        self.active = []          # slots of the tags in range
+        self.zombie = None        # id of the tag that zombified us
+        self.sightings = 0
+        self.peak = -200.0        # strongest filtered RSSI of the last process()
+        self.peak_at = 0          # ticks_ms of its last sighting
+
+    def _grow(self, n):
+        self.ids.extend(array('H', [0] * n))
+        self.counts.extend(array('H', [0] * n))
+        self.start.extend(array('I', [0] * n))
+        self.last.extend(array('I', [0] * n))
+        self.heard.extend(array('I', [0] * n))
+        self.level.extend(array('f', [0] * n))
+        self.in_range.extend(bytearray(n))
+        self.just_tagged.extend(bytearray(n))
+
+    def slot(self, tag_id):
+        s = self.slots.get(tag_id)
+        if s is None:
+            s = self.used
+            if s == len(self.ids):
+                self._grow(len(self.ids))
+            self.slots[tag_id] = s
+            self.ids[s] = tag_id
+            self.used += 1
+        return s
+
+    def _event(self, event, s, t):
+        if self.on_event is not None:
+            self.on_event(event, self.ids[s], t)
+
+    def _leave(self, s, t):
+        self.in_range[s] = 0
+        self.just_tagged[s] = 0
+        self.active.remove(s)
+        self._event(LEAVE, s, t)
+
+    def sighting(self, tag_id, rssi, t):
+        # one advertisement heard at ticks_ms t; True if the tag's filtered
+        # RSSI is strong enough
+        self.sightings += 1
+        if self.zombie is not None:
+            return False
+        s = self.slot(tag_id)
+        if self.heard[s] == 0 or time.ticks_diff(t, self.heard[s]) >= self.leave_ms:
+            self.level[s] = rssi  # first sighting in a while, start over
+        else:
+            self.level[s] += self.alpha * (rssi - self.level[s])
+        self.heard[s] = t or 1
+        level = self.level[s]
+        if level > self.peak:
+            self.peak = level
+        if level <= self.rssi_thresh:
+            return False
+        if not self.in_range[s]:
+            self.in_range[s] = 1
+            self.just_tagged[s] = 0
+            self.start[s] = self.last[s] = t
+            self.active.append(s)
+            self._event(ENTER, s, t)
+        elif time.ticks_diff(t, self.last[s]) < self.leave_ms:
+            self.last[s] = t
+        else:
+            self._leave(s, t)  # gone too long, comes back in on its next sighting
+            return True
+        if not self.just_tagged[s] and time.ticks_diff(t, self.start[s]) > self.tag_ms:
+            self.just_tagged[s] = 1
+            self.counts[s] += 1
+            self._event(TAG, s, t)
+            if self.counts[s] == self.tags_to_zombify:
+                self.zombie = tag_id
+                self._event(ZOMBIFY, s, t)
+        return True
+
+    def process(self, ids, rssis, ticks, n):
+        # every sighting drained this tick, returns how many were strong
+        strong = 0
+        self.peak = -200.0
+        for k in range(n):
+            if self.sighting(ids[k], rssis[k], ticks[k]):
+                strong += 1
+        if n:
+            self.peak_at = ticks[n - 1]
+        return strong
+
+    def expire(self, now):
+        # tags in range without a strong sighting for leave_ms leave, and
+        # the last process() stops counting in strongest() after hold_ms
+        if time.ticks_diff(now, self.peak_at) >= self.hold_ms:
+            self.peak = -200.0
+        active = self.active
+        i = len(active) - 1
+        while i >= 0:
+            s = active[i]
+            if time.ticks_diff(now, self.last[s]) >= self.leave_ms:
+                self._leave(s, now)
+            i -= 1
+
+    def strongest(self):
+        # strongest filtered RSSI of the tags in range and the last process(),
+        # -200 when nothing has been heard for hold_ms
+        level = self.peak
+        for s in self.active:
+            if self.level[s] > level:
+                level = self.level[s]
+        return level
+
+    def snapshot(self, ids, levels):
+        # ids and filtered RSSI of the tags in range into the given arrays,
+        # as many as fit; returns (tags in range, strongest())
+        n = 0
+        for s in self.active:
+            if n == len(ids):
+                break
+            ids[n] = self.ids[s]
+            levels[n] = self.level[s]
+            n += 1
+        return len(self.active), self.strongest()
+
+    def distance(self, tag_id):
+        # estimated distance to a tag in meters, None if never heard
+        s = self.slots.get(tag_id)
+        if s is None:
+            return None
+        return rssi_to_distance(self.level[s], self.tx_power, self.n)
+
+    def results(self):
+        # {tag id: times tagged} for every tag that tagged us
+        return {self.ids[s]: self.counts[s] for s in range(self.used) if self.counts[s]}
@@ -0,0 +1,419 @@
+"""Closed-loop car simulator running the real controller scripts on CPython.
+
+The car script (e.g. Smart Driving/car_tracker.py) runs unchanged against the
+stand-ins in mpy.py on a virtual clock. A differential-drive model reads the
+four motor PWM duties, and a simulated camera publishes pose frames (the real
+pose_frame encoder) with configurable noise, latency and frame drops.
+
+    python simulator/car_sim.py "Smart Driving/car_tracker.py" --duration 20
+    python simulator/car_sim.py "Convoluted Car/car_motor_control.py" --scene joystick
+
+Scenes:
+    step      camera on the car, the followed tag jumps to a new spot at t=1 s
+    circle    camera on the car, the tag drives around a circle
+    joystick  fixed camera, the tag is moved like a joystick (car_motor_control)
+    FILE      a telemetry.bin recorded on the car, replayed as the tag's path
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mpy import ROOT, USEFUL, Runtime, VirtualClock  # noqa: E402
+
+TOPICS = {
+    'car_tracker.py': b'ME35-24/noahcam',
+    'car_motor_control.py': b'ME35-24/noahmedha',
+}
+
+
+class DiffDriveCar:
+    """differential-drive kinematics driven by the four motor PWM channels
+
+    Each wheel takes the signed duty (forward pin minus reverse pin); duties
+    below deadband do not move it, above it the wheel speed rises linearly to
+    max_speed and follows the command with a first-order lag of tau seconds.
+    """
+
+    def __init__(self, device, left=(2, 3), right=(4, 5), max_speed=5.0,
+                 track=1.2, deadband=5000, tau=0.08, x=0.0, y=0.0, heading=math.pi / 2):
+        self.device = device
+        self.left, self.right = left, right
+        self.max_speed = max_speed  # tag units per second at full duty
+        self.track = track          # wheel spacing in tag units
+        self.deadband = deadband
+        self.tau = tau
+        self.x, self.y, self.heading = x, y, heading
+        self.v_left = self.v_right = 0.0
+        self.distance = 0.0
+
+    def wheel_target(self, pins):
+        duty = self.device.duty(pins[0]) - self.device.duty(pins[1])
+        mag = abs(duty) - self.deadband
+        if mag <= 0:
+            return 0.0
+        return math.copysign(self.max_speed * mag / (65535 - self.deadband), duty)
+
+    def step(self, dt):
+        k = min(1.0, dt / self.tau)
+        self.v_left += (self.wheel_target(self.left) - self.v_left) * k
+        self.v_right += (self.wheel_target(self.right) - self.v_right) * k
+        v = self.speed
+        self.heading += self.yaw_rate * dt
+        self.x += v * math.cos(self.heading) * dt
+        self.y += v * math.sin(self.heading) * dt
+        self.distance += abs(v) * dt
+
+    @property
+    def speed(self):
+        return (self.v_left + self.v_right) / 2
+
+    @property
+    def yaw_rate(self):
+        # counter-clockwise positive
+        return (self.v_right - self.v_left) / self.track
+
+
+class FollowScene:
+    """camera mounted on the car, looking at a tag that moves along target(t)"""
+
+    def __init__(self, car, target, fov_deg=70, max_range=25.0):
+        self.car = car
+        self.target = target
+        self.half_fov = math.radians(fov_deg) / 2
+        self.max_range = max_range
+
+    def pose(self, t):
+        # true (x, y, z) tag translation as the camera sees it, None if out of view
+        tx, ty = self.target(t)
+        dx, dy = tx - self.car.x, ty - self.car.y
+        c, s = math.cos(self.car.heading), math.sin(self.car.heading)
+        ahead = dx * c + dy * s
+        right = dx * s - dy * c
+        if ahead <= 0.5 or ahead > self.max_range or abs(math.atan2(right, ahead)) > self.half_fov:
+            return None
+        return right, 0.0, -ahead
+
+
+class TraceScene(FollowScene):
+    """follow a tag path recorded with telemetry.py on the real car
+
+    The recorded (x, z) are where the tag was seen from the car, so the trace
+    should be taken with the car on a stand (wheels off the ground) while the
+    tag is moved by hand: the camera then stays at the origin facing +y like
+    DiffDriveCar starts, and the poses give the tag's path over the floor.
+    Samples without a tag leave it out of view, poses in between are
+    interpolated and the last one is held after the end of the trace.
+    """
+
+    def __init__(self, t, x, z, found=None, step_at=None, **kw):
+        FollowScene.__init__(self, None, self.at, **kw)
+        self.t = [float(v) for v in t]
+        self.x = [float(v) for v in x]
+        self.z = [float(v) for v in z]
+        self.found = [bool(v) for v in found] if found is not None else [True] * len(self.t)
+        self.step_at = step_at
+        self.i = 0
+
+    @classmethod
+    def from_telemetry(cls, path, **kw):
+        # telemetry.bin dump from car_tracker, see useful/telemetry.py
+        if USEFUL not in sys.path:
+            sys.path.append(USEFUL)
+        from telemetry import load
+        d = load(path)
+        t, last, now = [], None, 0
+        for tick in d['tick']:
+            if last is not None:
+                now += (int(tick) - last) % (1 << 30)  # ticks_ms wraps at 2**30
+            last = int(tick)
+            t.append(now / 1000)
+        return cls(t, d['x'], d['z'], d['found'], **kw)
+
+    def _index(self, t):
+        # last sample at or before t, the scene is queried with rising t
+        if self.i and self.t[self.i] > t:
+            self.i = 0
+        while self.i + 1 < len(self.t) and self.t[self.i + 1] <= t:
+            self.i += 1
+        return self.i
+
+    def at(self, t):
+        i = self._index(t)
+        x, z = self.x[i], self.z[i]
+        if i + 1 < len(self.t) and self.found[i + 1] and t > self.t[i]:
+            f = (t - self.t[i]) / (self.t[i + 1] - self.t[i])
+            x += f * (self.x[i + 1] - x)
+            z += f * (self.z[i + 1] - z)
+        return x, -z
+
+    def pose(self, t):
+        if not self.t or not self.found[self._index(t)]:
+            return None
+        return FollowScene.pose(self, t)
+
+
+def make_scene(name):
+    # scene name, or a telemetry file to replay as a TraceScene
+    if os.path.isfile(name):
+        return TraceScene.from_telemetry(name)
+    return name
+
+
+class JoystickScene:
+    """fixed camera, the tag position itself is the command (x, y) = stick(t)"""
+
+    def __init__(self, stick, z=-10.0):
+        self.stick = stick
+        self.z = z
+
+    def pose(self, t):
+        x, y = self.stick(t)
+        return x, y, self.z
+
+
+def step_target(t):
+    # tag 7 ahead of the car, jumps 3 further and 1.5 to the right at t=1 s
+    return (0.0, 7.0) if t < 1.0 else (1.5, 10.0)
+
+
+def circle_target(t, radius=6.0, period=20.0):
+    a = 2 * math.pi * t / period
+    return radius * math.sin(a), 7.0 + radius * (1 - math.cos(a))
+
+
+def joystick_stick(t):
+    # centre, full forward at 1 s, forward and right at 5 s, centre at 9 s
+    if t < 1.0 or t >= 9.0:
+        return 0.0, -0.5
+    if t < 5.0:
+        return 0.0, -4.5
+    return 4.0, -4.5
+
+
+class Camera:
+    """publishes the scene's tag pose as pose frames every period_ms"""
+
+    def __init__(self, runtime, scene, topic, tag_id=0, period_ms=30, latency_ms=40,
+                 jitter_ms=5, noise=0.03, drop=0.0, stamp_offset_ms=123456, seed=0):
+        from pose_frame import PoseBatchEncoder
+        self.runtime = runtime
+        self.scene = scene
+        self.topic = topic
+        self.tag_id = tag_id
+        self.latency_us = latency_ms * 1000
+        self.jitter_us = jitter_ms * 1000
+        self.noise = noise
+        self.drop = drop
+        self.stamp_offset_ms = stamp_offset_ms  # camera clock differs from the car's
+        self.rng = random.Random(seed)
+        self.encoder = PoseBatchEncoder()
+        self.frames = 0
+        runtime.clock.every(period_ms * 1000, self.capture)
+
+    def capture(self):
+        clock = self.runtime.clock
+        self.frames += 1
+        pose = self.scene.pose(clock.now_us / 1e6)
+        self.encoder.begin(clock.now_us // 1000 + self.stamp_offset_ms)
+        if pose is not None:
+            x, y, z = (v + self.rng.gauss(0.0, self.noise) for v in pose)
+            self.encoder.add(self.tag_id, x, y, z)
+        msg = bytes(self.encoder.finish())
+        if self.rng.random() < self.drop:
+            return
+        latency = self.latency_us + self.rng.uniform(-self.jitter_us, self.jitter_us)
+        self.runtime.broker.publish(self.topic, msg, max(0, int(latency)))
+
+
+class Result:
+    """recorded samples of one run plus the metrics computed from them"""
+
+    def __init__(self):
+        self.t = []
+        self.x, self.z = [], []   # true tag pose seen from the car (follow scenes)
+        self.speed, self.yaw_rate = [], []
+        self.effort = []          # sum of the four duties / 65535
+        self.metrics = {}
+        self.namespace = None
+        self.error = None         # exception that stopped the script early
+        self.wall_s = 0.0
+
+
+def settling_time(t, values, target, t_start, band):
+    # time after t_start until values stay within band of target, None if never
+    last_out = None
+    for ti, v in zip(t, values):
+        if ti >= t_start and abs(v - target) > band:
+            last_out = ti
+    if last_out is None:
+        return 0.0
+    if last_out >= t[-1]:
+        return None
+    return last_out - t_start
+
+
+def overshoot(t, values, start, target, t_start):
+    # largest move past target, as a fraction of the step size
+    step = target - start
+    if step == 0:
+        return 0.0
+    worst = max(((v - target) / step for ti, v in zip(t, values) if ti >= t_start), default=0.0)
+    return max(0.0, worst)
+
+
+def simulate(script, scene='step', duration=20.0, noise=0.03, latency_ms=40,
+             jitter_ms=5, period_ms=30, drop=0.0, band=0.2, seed=0,
+             overrides=None, car_params=None, quiet=True):
+    """run script in the given scene for duration simulated seconds
+
+    overrides are assigned into the script's globals on its first sleep,
+    after its own module-level setup (e.g. {'kp_speed': 5.0}), or called
+    with the globals dict if it is a function.
+    """
+    script = os.path.abspath(script)
+    clock = VirtualClock(duration)
+    rt = Runtime(clock)
+    dev = rt.device('car')
+    dev.levels[20] = 1  # start/stop line high, car_motor_control may run
+    car = DiffDriveCar(dev, **(car_params or {}))
+    clock.integrators.append(car.step)
+    topic = TOPICS.get(os.path.basename(script), b'ME35-24/noahcam')
+
+    step_at = None  # time of the target step, for settling and overshoot
+    if scene == 'step':
+        view = FollowScene(car, step_target)
+        step_at = 1.0
+    elif scene == 'circle':
+        view = FollowScene(car, circle_target)
+    elif scene == 'joystick':
+        view = JoystickScene(joystick_stick)
+        step_at = 1.0
+    elif callable(getattr(scene, 'pose', None)):
+        view = scene
+        step_at = getattr(scene, 'step_at', None)
+    else:
+        raise ValueError('unknown scene %r' % (scene,))
+    if isinstance(view, FollowScene):
+        view.car = car
+
+    res = Result()
+
+    def sample():
+        pose = view.pose(clock.now_us / 1e6) if isinstance(view, FollowScene) else None
+        res.t.append(clock.now_us / 1e6)
+        res.x.append(pose[0] if pose else float('nan'))
+        res.z.append(pose[2] if pose else float('nan'))
+        res.speed.append(car.speed)
+        res.yaw_rate.append(car.yaw_rate)
+        res.effort.append(sum(dev.duty(p) for p in car.left + car.right) / 65535)
+
+    clock.every(10000, sample, start_us=0)
+
+    ns = {}
+    if overrides:
+        real_sleep = clock.sleep_us
+
+        def sleep_us(us):
+            # first sleep: the script's own setup is done, put the overrides in
+            clock.sleep_us = real_sleep
+            if callable(overrides):
+                overrides(ns)
+            else:
+                ns.update(overrides)
+            real_sleep(us)
+        clock.sleep_us = sleep_us
+
+    start = time.perf_counter()
+    with rt.installed([os.path.dirname(script)]):
+        Camera(rt, view, topic, period_ms=period_ms, latency_ms=latency_ms,
+               jitter_ms=jitter_ms, noise=noise, drop=drop, seed=seed)
+        try:
+            res.namespace = rt.run_script(script, dev, quiet=quiet, namespace=ns)
+        except Exception as e:
+            # the script would have crashed on the car too, keep what we have
+            res.namespace = ns
+            res.error = '%s: %s' % (type(e).__name__, e)
+    res.wall_s = time.perf_counter() - start
+
+    res.metrics = metrics(res, view, band, step_at)
+    if res.error:
+        res.metrics['crashed_at_s'] = clock.now_us / 1e6
+    res.metrics['car_distance'] = car.distance
+    res.metrics['duty_writes'] = dev.duty_writes
+    return res
+
+
+def metrics(res, view, band, step_at=None):
+    m = {}
+    n = len(res.t)
+    if n == 0:
+        return m
+    m['effort'] = sum(res.effort) / n
+    if isinstance(view, FollowScene):
+        desired_z = res.namespace.get('desired_z', -7)
+        desired_x = res.namespace.get('desired_x', 0)
+        seen = [(t, x, z) for t, x, z in zip(res.t, res.x, res.z) if x == x]
+        m['tag_visible'] = len(seen) / n
+        if seen:
+            ts, xs, zs = zip(*seen)
+            after = [(x, z) for t, x, z in seen if step_at is not None and t >= step_at]
+            if after:
+                m['z_settling_s'] = settling_time(ts, zs, desired_z, step_at, band)
+                m['x_settling_s'] = settling_time(ts, xs, desired_x, step_at, band)
+                m['z_overshoot'] = overshoot(ts, zs, after[0][1], desired_z, step_at)
+                m['x_overshoot'] = overshoot(ts, xs, after[0][0], desired_x, step_at)
+            m['z_rms'] = math.sqrt(sum((z - desired_z) ** 2 for z in zs) / len(zs))
+            m['x_rms'] = math.sqrt(sum((x - desired_x) ** 2 for x in xs) / len(xs))
+    elif step_at is not None:
+        # joystick: forward speed step at step_at, settled 4 s later
+        window = [(t, v) for t, v in zip(res.t, res.speed) if step_at <= t < step_at + 4.0]
+        if window:
+            ts, vs = zip(*window)
+            final = vs[-1]
+            m['speed_final'] = final
+            m['speed_settling_s'] = settling_time(ts, vs, final, step_at, max(0.05 * abs(final), 0.01))
+            m['speed_overshoot'] = overshoot(ts, vs, 0.0, final, step_at)
+    return m
+
+
+def format_metrics(m):
+    parts = []
+    for k, v in m.items():
+        parts.append('%s=%s' % (k, 'never' if v is None else ('%.3f' % v if isinstance(v, float) else v)))
+    return ' '.join(parts)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('script', nargs='?', default=os.path.join(ROOT, 'Smart Driving', 'car_tracker.py'))
+    ap.add_argument('--scene', default=None, help='step, circle, joystick or a telemetry file')
+    ap.add_argument('--duration', type=float, default=20.0, help='simulated seconds')
+    ap.add_argument('--noise', type=float, default=0.03, help='pose noise (std dev)')
+    ap.add_argument('--latency', type=float, default=40, help='capture to car latency (ms)')
+    ap.add_argument('--jitter', type=float, default=5, help='latency jitter (+/- ms)')
+    ap.add_argument('--period', type=float, default=30, help='camera frame period (ms)')
+    ap.add_argument('--drop', type=float, default=0.0, help='fraction of frames lost')
+    ap.add_argument('--band', type=float, default=0.2, help='settling band (tag units)')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--verbose', action='store_true', help="show the script's prints")
+    args = ap.parse_args()
+
+    scene = args.scene or ('joystick' if 'car_motor_control' in args.script else 'step')
+    res = simulate(args.script, make_scene(scene), args.duration, args.noise, args.latency,
+                   args.jitter, args.period, args.drop, args.band, args.seed,
+                   quiet=not args.verbose)
+    print('%s, %s scene: %.1f simulated s in %.2f s (%.0fx real time)' % (
+        os.path.basename(args.script), scene, args.duration, res.wall_s,
+        args.duration / max(res.wall_s, 1e-9)))
+    print(format_metrics(res.metrics))
+    if res.error:
+        print('script stopped early with %s' % res.error)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""Wall-clock check of Zombie Attack/main.py's dual-core mode.
+
+zombie_sim.py runs main.py on a virtual clock, which only one thread can
+sleep on, so it always runs the single-core default. This runs main.py in
+real time instead, once as it is and once with DUAL_CORE = True, where
+ingest.Ingest runs the tag tracker on a second thread (_thread in mpy.py)
+and core 0 only gets its events and levels.
+
+Both runs hear the same script from a harness thread: tag 7 comes in range
+(RSSI -40) for stay_s, then drifts away (-80) for gap_s, three times over,
+while a crowd of weak tags advertises every interval_ms. The first gap is
+quiet instead: nothing advertises at all. Each run has to report tag 7
+tagging three times and then zombifying the player, with no sighting
+dropped from Sniff's ring and no event lost on the way to core 0, and the
+events.bin it writes has to hold the same game. The LED bar has to be fully
+lit at the end of the first stay and dark at the end of the quiet gap.
+
+    python simulator/dual_core_check.py
+    python simulator/dual_core_check.py --crowd 40 --interval-ms 10
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mpy import Radio, Runtime, StopSimulation, WallClock  # noqa: E402
+from zombie_sim import ZOMBIE_DIR, adv_payload, addr_of  # noqa: E402
+
+TAG_ID = 7
+STAYS = 3
+
+
+class Run:
+    def __init__(self, dual):
+        self.dual = dual
+        self.lines = []
+        self.tags = []          # ids from 'Tagged by group N'
+        self.zombie = None
+        self.accepted = 0
+        self.dropped = 0
+        self.events = {}        # kind name -> count for TAG_ID in events.bin
+        self.values = []        # times tagged, per TAG record
+        self.results = None
+        self.stay_lit = None    # LEDs lit at the end of the first stay
+        self.quiet_lit = None   # ... and of the quiet gap after it
+        self.error = None
+        self.wall_s = 0.0
+
+
+def main_source(dual):
+    # main.py, with DUAL_CORE switched on for the dual-core run
+    with open(os.path.join(ZOMBIE_DIR, 'main.py')) as f:
+        src = f.read()
+    if dual:
+        assert 'DUAL_CORE = False' in src
+        src = src.replace('DUAL_CORE = False', 'DUAL_CORE = True', 1)
+    return src
+
+
+def lit(dev):
+    # LEDs of main.py's bar (GPIO 0-5) that are on
+    return sum(dev.levels.get(pin, 0) for pin in range(6))
+
+
+def run(dual, crowd=20, interval_ms=20, stay_s=3.5, gap_s=1.5, period_ms=50):
+    res = Run(dual)
+    clock = WallClock(duration_s=STAYS * (stay_s + gap_s) + 10)
+    rt = Runtime(clock)
+    dev = rt.device('human')
+    dev.levels[20] = 1  # button, pressed once zombified
+
+    def on_print(*args, **kwargs):
+        line = ' '.join(str(a) for a in args)
+        res.lines.append(line)
+        if line.startswith('Tagged by group '):
+            res.tags.append(int(line.split()[-1]))
+        elif line.startswith('Zombified by '):
+            res.zombie = int(line.split()[-1])
+            dev.set_level(20, 0)
+
+    with rt.installed([ZOMBIE_DIR]):
+        radio = dev.radio = Radio(dev)
+
+        def advertise():
+            # the tag's stays and the crowd, on this thread like the BLE IRQ
+            tag = adv_payload('!%d' % TAG_ID)
+            others = [adv_payload('!%d' % (100 + i)) for i in range(crowd)]
+            start = clock.ticks_us()
+            next_tag = next_crowd = start
+            try:
+                while res.zombie is None:
+                    now = clock.ticks_us()
+                    cycle, t = divmod((now - start) / 1e6, stay_s + gap_s)
+                    quiet = cycle == 0 and t >= stay_s
+                    if cycle == 0 and res.stay_lit is None and t >= stay_s - 0.2:
+                        res.stay_lit = lit(dev)
+                    if quiet and res.quiet_lit is None and t >= stay_s + gap_s - 0.2:
+                        res.quiet_lit = lit(dev)
+                    if now >= next_tag:
+                        if not quiet:
+                            radio.deliver(addr_of(TAG_ID), -40 if t < stay_s else -80, tag)
+                        next_tag += period_ms * 1000
+                    if now >= next_crowd:
+                        if not quiet:
+                            for i, payload in enumerate(others):
+                                radio.deliver(addr_of(100 + i), -85, payload)
+                        next_crowd += interval_ms * 1000
+                    clock.sleep_us(max(0, min(next_tag, next_crowd) - clock.ticks_us()))
+            except StopSimulation:
+                pass
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)  # zombie_results.txt and events.bin go here
+            try:
+                path = os.path.join(tmp, 'main.py')
+                with open(path, 'w') as f:
+                    f.write(main_source(dual))
+                start = clock.ticks_us()
+                script = rt.spawn(path, dev, namespace={'print': on_print})
+                while radio.handler is None or radio.scan_until is None:
+                    clock.sleep_us(1000)  # scanning
+                air = threading.Thread(target=advertise, daemon=True)
+                air.start()
+                script.join()
+                res.wall_s = (clock.ticks_us() - start) / 1e6
+                res.error = script.error
+                clock.stop()
+                air.join(1)
+
+                sniff = radio.handler.__self__
+                res.accepted, res.dropped = sniff.accepted, sniff.dropped
+                if os.path.exists('zombie_results.txt'):
+                    with open('zombie_results.txt') as f:
+                        res.results = f.read()
+                from event_log import KIND_NAMES, TAG, load
+                events = load('events.bin')
+                mine = events['tag'] == TAG_ID
+                for kind in set(events['kind'][mine]):
+                    res.events[KIND_NAMES[kind]] = int((events['kind'][mine] == kind).sum())
+                res.values = [int(v) for v in events['value'][mine & (events['kind'] == TAG)]]
+            except Exception as e:
+                res.error = e
+            finally:
+                os.chdir(cwd)
+    return res
+
+
+def failures(res):
+    found = []
+    if res.error is not None:
+        found.append('main.py stopped with %s: %s' % (type(res.error).__name__, res.error))
+    if res.tags != [TAG_ID] * STAYS:
+        found.append('tagged by %s, expected %s' % (res.tags, [TAG_ID] * STAYS))
+    if res.zombie != TAG_ID:
+        found.append('zombified by %s, expected %d' % (res.zombie, TAG_ID))
+    if res.dropped:
+        found.append('%d sightings dropped from the ring' % res.dropped)
+    if res.values != list(range(1, STAYS + 1)):
+        found.append('events.bin TAG records count %s' % res.values)
+    if res.stay_lit != 6 or res.quiet_lit != 0:
+        found.append('LED bar %s lit in range, %s after the quiet gap' % (res.stay_lit, res.quiet_lit))
+    if res.events.get('zombify') != 1 or res.events.get('enter') != STAYS:
+        found.append('events.bin has %s for tag %d' % (res.events, TAG_ID))
+    return found
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--crowd', type=int, default=20, help='weak tags advertising around the player')
+    ap.add_argument('--interval-ms', type=float, default=20, help='crowd advertising interval')
+    ap.add_argument('--stay-s', type=float, default=3.5, help='time tag %d stays in range' % TAG_ID)
+    ap.add_argument('--gap-s', type=float, default=1.5,
+                    help='time it stays away, more than the 1 s it takes to leave range')
+    args = ap.parse_args()
+
+    runs = [run(dual, args.crowd, args.interval_ms, args.stay_s, args.gap_s) for dual in (False, True)]
+    failed = False
+    for res in runs:
+        print('%-11s %5.1f s, %d sightings, %d dropped, events.bin %s' % (
+            'dual-core' if res.dual else 'single-core', res.wall_s, res.accepted, res.dropped,
+            ' '.join('%s %d' % kv for kv in sorted(res.events.items()))))
+        for line in res.lines:
+            if line.startswith('core 0 busy'):
+                print('            ' + line)
+        for problem in failures(res):
+            print('            FAIL: ' + problem)
+            failed = True
+    if runs[0].results != runs[1].results:
+        print('FAIL: results differ: %r, %r' % (runs[0].results, runs[1].results))
+        failed = True
+    print('FAIL' if failed else 'ok')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Offline gain tuning: sweep controller constants through car_sim.py runs.
+
+Every candidate runs the real car script in the simulator (see car_sim.py)
+with its constants replaced after the script's own setup, so the script's
+own controller functions and motor driver are what get tuned. Runs are spread
+over a process pool and ranked by a weighted cost of settling time,
+overshoot and actuator effort (lower is better).
+
+    python simulator/gain_sweep.py                       # car_tracker, 3-point grid
+    python simulator/gain_sweep.py --random 200 --workers 8
+    python simulator/gain_sweep.py kp_speed=4,6,8 kd_speed=0:2:5
+    python simulator/gain_sweep.py --scene telemetry.bin  # replay a recorded tag path
+    python simulator/gain_sweep.py "Convoluted Car/car_motor_control.py"
+
+Parameters are given as name=a,b,c (these values) or name=lo:hi:n (n evenly
+spaced values for a grid, or anywhere in lo..hi with --random). Without any,
+the ranges in PARAMS for the script are swept.
+"""
+
+import argparse
+import itertools
+import math
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from car_sim import format_metrics, make_scene, simulate  # noqa: E402
+from mpy import ROOT  # noqa: E402
+
+# default ranges (lo, hi, grid points) for each script's tuned constants
+PARAMS = {
+    'car_tracker.py': {
+        'kp_speed': (3.0, 11.0, 3),
+        'kd_speed': (0.0, 2.0, 3),
+        'kp_turn': (1.0, 3.0, 3),
+        'kd_turn': (0.0, 1.0, 3),
+        'dead_zone': (4000, 8000, 3),
+    },
+    'car_motor_control.py': {
+        'max_speed': (40, 100, 4),
+        'max_turn': (10, 50, 5),
+    },
+}
+
+# cost weight of each metric, None (never settled) counts as the run length
+WEIGHTS = {
+    'z_settling_s': 1.0,
+    'x_settling_s': 1.0,
+    'z_overshoot': 2.0,
+    'x_overshoot': 2.0,
+    'speed_settling_s': 1.0,
+    'speed_overshoot': 2.0,
+    'effort': 1.0,
+}
+
+# used instead of settling time and overshoot when the scene has no step
+RMS_WEIGHTS = {'z_rms': 1.0, 'x_rms': 1.0}
+
+
+def parse_param(spec):
+    # 'kp=1,2,3' -> ('kp', [1, 2, 3]), 'kp=0:2:5' -> ('kp', (0, 2, 5))
+    name, _, values = spec.partition('=')
+    if ':' in values:
+        lo, hi, n = (values.split(':') + ['3'])[:3]
+        return name, (num(lo), num(hi), int(n))
+    return name, [num(v) for v in values.split(',')]
+
+
+def num(text):
+    value = float(text)
+    return int(value) if value.is_integer() and '.' not in text else value
+
+
+def grid_values(space):
+    if isinstance(space, list):
+        return space
+    lo, hi, n = space
+    if n < 2:
+        return [lo]
+    values = [lo + (hi - lo) * i / (n - 1) for i in range(n)]
+    if isinstance(lo, int) and isinstance(hi, int):
+        values = [int(round(v)) for v in values]
+    return values
+
+
+def random_value(space, rng):
+    if isinstance(space, list):
+        return rng.choice(space)
+    lo, hi, n = space
+    if isinstance(lo, int) and isinstance(hi, int):
+        return rng.randint(lo, hi)
+    return rng.uniform(lo, hi)
+
+
+def candidates(space, samples=0, seed=0):
+    # every grid point, or samples random points
+    names = list(space)
+    if samples:
+        rng = random.Random(seed)
+        return [{k: random_value(space[k], rng) for k in names} for _ in range(samples)]
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid_values(space[k]) for k in names))]
+
+
+class Apply:
+    """puts the gains into the script's globals (picklable for the pool)"""
+
+    def __init__(self, gains):
+        self.gains = gains
+
+    def __call__(self, ns):
+        ns.update(self.gains)
+        motors = ns.get('motors')
+        if 'dead_zone' in self.gains and hasattr(motors, 'set_dead_zone'):
+            motors.set_dead_zone(self.gains['dead_zone'])  # baked into its duty table
+
+
+def cost(m, duration, weights=WEIGHTS):
+    if 'crashed_at_s' in m:
+        return float('inf')
+    used = [k for k in weights if k in m]
+    if not any(k.endswith(('_settling_s', '_overshoot')) for k in used):
+        weights = dict(weights, **RMS_WEIGHTS)
+        used = [k for k in weights if k in m]
+    total = 0.0
+    for k in used:
+        total += weights[k] * (duration if m[k] is None else m[k])
+    if 'tag_visible' in m:
+        total += (1.0 - m['tag_visible']) * duration  # losing the tag is worst
+    return total
+
+
+def run_one(job):
+    script, scene, gains, sim = job
+    res = simulate(script, scene, overrides=Apply(gains), **sim)
+    return gains, res.metrics, res.error
+
+
+def sweep(script, space, scene='step', samples=0, workers=None, weights=WEIGHTS, **sim):
+    """run every candidate, returns [(cost, gains, metrics, error)] best first
+
+    sim is passed on to car_sim.simulate (duration, noise, seed, ...), its seed
+    also picks the random samples.
+    """
+    jobs = [(script, scene, gains, sim) for gains in candidates(space, samples, sim.get('seed', 0))]
+    duration = sim.get('duration', 20.0)
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(run_one, jobs, chunksize=max(1, len(jobs) // 64)))
+    ranked = [(cost(m, duration, weights), gains, m, error) for gains, m, error in results]
+    ranked.sort(key=lambda r: r[0])
+    return ranked
+
+
+def format_gains(gains):
+    return ' '.join('%s=%s' % (k, '%.3g' % v if isinstance(v, float) else v)
+                    for k, v in gains.items())
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('script', nargs='?', default=os.path.join(ROOT, 'Smart Driving', 'car_tracker.py'))
+    ap.add_argument('params', nargs='*', help='name=a,b,c or name=lo:hi:n')
+    ap.add_argument('--scene', default=None, help='step, circle, joystick or a telemetry file')
+    ap.add_argument('--random', type=int, default=0, metavar='N', help='N random samples instead of a grid')
+    ap.add_argument('--workers', type=int, default=None, help='processes (default: all cores)')
+    ap.add_argument('--top', type=int, default=10, help='best gain sets to show')
+    ap.add_argument('--weight', action='append', default=[], metavar='METRIC=W',
+                    help='change a cost weight, e.g. effort=0.5')
+    ap.add_argument('--duration', type=float, default=15.0, help='simulated seconds per run')
+    ap.add_argument('--noise', type=float, default=0.03, help='pose noise (std dev)')
+    ap.add_argument('--latency', type=float, default=40, help='capture to car latency (ms)')
+    ap.add_argument('--drop', type=float, default=0.0, help='fraction of frames lost')
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+
+    # a bare name=... first argument is a parameter, not a script
+    if '=' in args.script:
+        args.params.insert(0, args.script)
+        args.script = os.path.join(ROOT, 'Smart Driving', 'car_tracker.py')
+    script = os.path.abspath(args.script)
+    space = dict(parse_param(p) for p in args.params) or PARAMS.get(os.path.basename(script))
+    if not space:
+        ap.error('no default parameters for %s, give some as name=lo:hi:n' % os.path.basename(script))
+    weights = dict(WEIGHTS)
+    for w in args.weight:
+        k, _, v = w.partition('=')
+        weights[k] = float(v)
+    scene = args.scene or ('joystick' if 'car_motor_control' in script else 'step')
+
+    n = args.random or math.prod(len(grid_values(v)) for v in space.values())
+    print('%s, %s scene: %d runs of %.1f simulated s' % (
+        os.path.basename(script), scene, n, args.duration))
+    start = time.perf_counter()
+    ranked = sweep(script, space, make_scene(scene), args.random, args.workers, weights, duration=args.duration, noise=args.noise,
+                   latency_ms=args.latency, drop=args.drop, seed=args.seed)
+    print('done in %.1f s' % (time.perf_counter() - start))
+    for i, (c, gains, m, error) in enumerate(ranked[:args.top]):
+        print('%2d cost=%.3f %s' % (i + 1, c, format_gains(gains)))
+        print('   ' + format_metrics(m) + (' (%s)' % error if error else ''))
+
+
+if __name__ == '__main__':
+    main()
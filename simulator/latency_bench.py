@@ -0,0 +1,194 @@
+"""End-to-end camera-to-PWM latency benchmark.
+
+Runs a camera script (Smart Driving/cam_publish.py by default) and a car
+script (Smart Driving/car_tracker.py) unchanged, each in its own thread, in
+real time against the stand-ins in mpy.py. The camera sees a synthetic tag
+and the two talk through the in-process MQTT broker. Every frame is stamped
+at
+
+    capture    sensor.snapshot()
+    publish    client.publish() on the camera
+    receive    check_msg() hands the message to the car
+    decode     the car decodes it (pose_frame.decode in pose_subscriber)
+    actuate    the first duty_u16() write after that decode
+
+and the per-stage latency is reported as percentiles and a histogram.
+Frames the car never decodes (superseded by a newer one) only count in the
+first stages.
+
+    python simulator/latency_bench.py --duration 5
+    python simulator/latency_bench.py --detect-ms 30 --network-ms 15
+    python simulator/latency_bench.py --camera "Convoluted Car/cam_control.py" \\
+        --car "Convoluted Car/car_motor_control.py"
+"""
+
+import argparse
+import math
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mpy import ROOT, Runtime, Tag, WallClock  # noqa: E402
+
+STAGES = [
+    ('capture', 'publish'),
+    ('publish', 'receive'),
+    ('receive', 'decode'),
+    ('decode', 'actuate'),
+    ('capture', 'actuate'),
+]
+
+# histogram bin edges in ms
+EDGES = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200]
+
+
+def frame_seq(msg):
+    # sequence number of a pose frame of either version, without decoding it
+    return struct.unpack_from('<H', msg, 2 if msg[0] == 2 else 4)[0]
+
+
+class Stamps:
+    """per-frame stage timestamps (us), keyed by frame sequence number"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.stamps = {name: {} for name in ('capture', 'publish', 'receive', 'decode', 'actuate')}
+        self.frames = 0
+        self.last_decoded = None
+
+    def mark(self, stage, seq):
+        self.stamps[stage].setdefault(seq, self.clock.ticks_us())
+
+    def capture(self, img):
+        self.mark('capture', self.frames % 65536)
+        self.frames += 1
+
+    def publish(self, topic, msg):
+        self.mark('publish', frame_seq(msg))
+
+    def receive(self, client, topic, msg):
+        self.mark('receive', frame_seq(msg))
+
+    def decoded(self, frame):
+        if frame is not None:
+            self.mark('decode', frame[5])
+            self.last_decoded = frame[5]
+
+    def duty(self, pin, duty):
+        if self.last_decoded is not None:
+            self.mark('actuate', self.last_decoded)
+            self.last_decoded = None
+
+    def latencies(self, start, end):
+        a, b = self.stamps[start], self.stamps[end]
+        return sorted((b[s] - a[s]) / 1000 for s in b if s in a)
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(math.ceil(q * len(values))) - 1)]
+
+
+def histogram(values, width=40):
+    counts = [0] * (len(EDGES) + 1)
+    for v in values:
+        i = 0
+        while i < len(EDGES) and v >= EDGES[i]:
+            i += 1
+        counts[i] += 1
+    top = max(counts) or 1
+    lines = []
+    for i, c in enumerate(counts):
+        if not c:
+            continue
+        lo = 0 if i == 0 else EDGES[i - 1]
+        hi = EDGES[i] if i < len(EDGES) else float('inf')
+        lines.append('    %6g-%-6g ms %6d %s' % (lo, hi, c, '#' * max(1, c * width // top)))
+    return lines
+
+
+def report(stamps, sub=None):
+    lines = ['%-20s %6s %8s %8s %8s %8s' % ('stage', 'n', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')]
+    hists = []
+    for start, end in STAGES:
+        values = stamps.latencies(start, end)
+        name = '%s->%s' % (start, end)
+        lines.append('%-20s %6d %8.3f %8.3f %8.3f %8.3f' % (
+            name, len(values), percentile(values, 0.5), percentile(values, 0.9),
+            percentile(values, 0.99), values[-1] if values else float('nan')))
+        hists.append('  ' + name)
+        hists.extend(histogram(values))
+    counts = {k: len(v) for k, v in stamps.stamps.items()}
+    lines.append('frames: ' + ' '.join('%s=%d' % kv for kv in counts.items()))
+    if sub is not None:
+        lines.append('subscriber: received=%d dropped=%d lost=%d stale=%d' % (
+            sub.received, sub.dropped, sub.lost, sub.stale))
+    return '\n'.join(lines + [''] + hists)
+
+
+def moving_tag(t_us):
+    # one tag wandering gently around the car_tracker set point
+    t = t_us / 1e6
+    return [Tag(0, 0.5 * math.sin(t), 0.0, -7 + 0.5 * math.cos(0.7 * t))]
+
+
+def run(camera, car, duration=5.0, detect_ms=0.0, network_ms=0.0, quiet=True):
+    """run both scripts for duration seconds, returns (Stamps, car namespace, errors)"""
+    clock = WallClock(duration)
+    rt = Runtime(clock, latency_us=int(network_ms * 1000))
+    rt.tag_source = moving_tag
+    rt.detect_us = int(detect_ms * 1000)
+    cam_dev = rt.device('camera')
+    car_dev = rt.device('car')
+    car_dev.levels[20] = 1  # start/stop line high
+
+    stamps = Stamps(clock)
+    rt.modules['sensor'].on_snapshot.append(stamps.capture)
+    rt.broker.on_publish.append(stamps.publish)
+    rt.broker.on_receive.append(stamps.receive)
+    car_dev.on_duty.append(stamps.duty)
+
+    paths = [os.path.dirname(os.path.abspath(camera)), os.path.dirname(os.path.abspath(car))]
+    with rt.installed(paths):
+        import pose_subscriber
+        decode = pose_subscriber.decode
+
+        def stamped_decode(msg, tag_id=None):
+            frame = decode(msg, tag_id)
+            stamps.decoded(frame)
+            return frame
+        pose_subscriber.decode = stamped_decode
+
+        car_thread = rt.spawn(car, car_dev, quiet)
+        cam_thread = rt.spawn(camera, cam_dev, quiet)
+        for thread in (cam_thread, car_thread):
+            thread.join(duration + 5)
+        clock.stop()
+    errors = [(t.name, t.error) for t in (cam_thread, car_thread) if t.error]
+    return stamps, car_thread.namespace, errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--camera', default=os.path.join(ROOT, 'Smart Driving', 'cam_publish.py'))
+    ap.add_argument('--car', default=os.path.join(ROOT, 'Smart Driving', 'car_tracker.py'))
+    ap.add_argument('--duration', type=float, default=5.0, help='seconds to run')
+    ap.add_argument('--detect-ms', type=float, default=0.0, help='simulated find_apriltags() time')
+    ap.add_argument('--network-ms', type=float, default=0.0, help='simulated broker latency')
+    ap.add_argument('--verbose', action='store_true', help="show the scripts' prints")
+    args = ap.parse_args()
+
+    stamps, ns, errors = run(args.camera, args.car, args.duration, args.detect_ms,
+                             args.network_ms, quiet=not args.verbose)
+    print('%s -> %s, %.1f s, detect %.1f ms, network %.1f ms' % (
+        os.path.basename(args.camera), os.path.basename(args.car), args.duration,
+        args.detect_ms, args.network_ms))
+    print(report(stamps, ns.get('pose')))
+    for name, error in errors:
+        print('%s script stopped with %s: %s' % (name, type(error).__name__, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1045 @@
+"""MicroPython stand-ins for running the device scripts unchanged on CPython.
+
+A Runtime is one simulated world: a clock, an in-process MQTT broker and any
+number of devices. While a runtime is installed, `import time`, `machine`,
+`mqtt` and `wifi` inside the device scripts resolve to the stand-ins below
+instead of the real (or missing) modules:
+
+    time     MicroPython time API (sleep_ms, ticks_ms, ticks_diff, ...) on the
+             runtime's clock; sleeping on a VirtualClock advances simulated
+             time instead of waiting
+    machine  Pin and PWM that record every value and duty_u16 written, per device
+    mqtt     MQTTClient talking to the in-process Broker
+    wifi     connect()/connect_wifi() that succeed at once
+    network  WLAN that is connected as soon as it is asked to be
+    secrets  placeholder mysecrets for both the dict and the list layout
+    sensor   OpenMV camera whose snapshots hold the tags returned by
+             runtime.tag_source(t_us) (a list of Tag)
+    bluetooth  BLE radio per device; the harness hands it advertisements with
+             Radio.deliver() and reads what the device advertises back
+    neopixel NeoPixel that records every write, per device
+    asyncio  MicroPython's asyncio subset (tasks, sleep_ms, Event,
+             ThreadSafeFlag, ...) scheduled on the runtime's clock, so a
+             script's tasks and the clock's events interleave like tasks and
+             IRQs on the board
+    _thread  start_new_thread() on a CPython thread, running as the same
+             device (its second core); WallClock runtimes only, a
+             VirtualClock cannot be slept on from two threads
+
+Device modules from useful/ and the script's own folder are imported fresh
+while a runtime is installed, so they bind to the stand-ins as well.
+"""
+
+import heapq
+import os
+import sys
+import traceback
+import threading
+import time as _time
+import types
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USEFUL = os.path.join(ROOT, 'useful')
+
+
+class StopSimulation(Exception):
+    """raised from inside a device script when the simulation is over"""
+
+
+# ---------------------------------------------------------------- clocks
+
+class VirtualClock:
+    """simulated time in microseconds
+
+    Sleeping advances the clock. On the way, events scheduled with at() or
+    every() run at their own time, and integrators (fn(dt_s)) are stepped
+    in slices of at most step_us so a physical model can follow along.
+    """
+
+    def __init__(self, duration_s=None, step_us=2000):
+        self.now_us = 0
+        self.end_us = None if duration_s is None else int(duration_s * 1e6)
+        self.step_us = step_us
+        self.integrators = []
+        self._events = []
+        self._seq = 0
+
+    def ticks_us(self):
+        return self.now_us
+
+    def at(self, t_us, fn):
+        # run fn() when the clock reaches t_us
+        self._seq += 1
+        heapq.heappush(self._events, (int(t_us), self._seq, fn))
+
+    def every(self, period_us, fn, start_us=None):
+        # run fn() every period_us, starting at start_us (default: one period from now)
+        def tick():
+            fn()
+            self.at(self.now_us + period_us, tick)
+        self.at(self.now_us + period_us if start_us is None else start_us, tick)
+
+    def next_event_us(self):
+        # when the next scheduled event runs, None if there is none
+        return self._events[0][0] if self._events else None
+
+    def advance_to(self, t_us):
+        if self.end_us is not None:
+            t_us = min(t_us, self.end_us)
+        while self._events and self._events[0][0] <= t_us:
+            t, seq, fn = heapq.heappop(self._events)
+            self._integrate_to(t)
+            fn()
+        self._integrate_to(t_us)
+        if self.end_us is not None and self.now_us >= self.end_us:
+            raise StopSimulation()
+
+    def _integrate_to(self, t_us):
+        while self.now_us < t_us:
+            dt = min(self.step_us, t_us - self.now_us)
+            for fn in self.integrators:
+                fn(dt / 1e6)
+            self.now_us += dt
+
+    def sleep_us(self, us):
+        self.advance_to(self.now_us + max(0, int(us)))
+
+
+class WallClock:
+    """real time, for running several device scripts in threads at once"""
+
+    def __init__(self, duration_s=None):
+        self._start = _time.perf_counter()
+        self.end_us = None if duration_s is None else int(duration_s * 1e6)
+        self.stopped = False
+
+    def ticks_us(self):
+        return int((_time.perf_counter() - self._start) * 1e6)
+
+    def stop(self):
+        self.stopped = True
+
+    def sleep_us(self, us):
+        if us > 0:
+            _time.sleep(us / 1e6)
+        if self.stopped or (self.end_us is not None and self.ticks_us() >= self.end_us):
+            raise StopSimulation()
+
+
+def make_time_module(clock):
+    # MicroPython's time module on top of a clock, anything else falls
+    # through to CPython's time module
+    mod = types.ModuleType('time')
+    mod.ticks_us = clock.ticks_us
+    mod.ticks_ms = lambda: clock.ticks_us() // 1000
+    mod.ticks_cpu = clock.ticks_us
+    mod.ticks_diff = lambda a, b: a - b
+    mod.ticks_add = lambda a, b: a + b
+    mod.sleep_us = lambda us: clock.sleep_us(us)
+    mod.sleep_ms = lambda ms: clock.sleep_us(ms * 1000)
+    mod.sleep = lambda s: clock.sleep_us(s * 1e6)
+    mod.time = lambda: clock.ticks_us() // 1000000
+    mod.time_ns = lambda: clock.ticks_us() * 1000
+    mod.__getattr__ = lambda name: getattr(_time, name)
+    return mod
+
+
+# ---------------------------------------------------------------- machine
+
+_local = threading.local()
+
+
+def current_device():
+    return getattr(_local, 'device', None)
+
+
+def pin_id(id):
+    # 'GPIO18' and 18 name the same pin
+    if isinstance(id, str) and id.startswith('GPIO'):
+        return int(id[4:])
+    return id
+
+
+class Device:
+    """one simulated board: pin levels, IRQ handlers and PWM duties"""
+
+    def __init__(self, runtime, name):
+        self.runtime = runtime
+        self.name = name
+        self.levels = {}     # pin id -> 0/1
+        self.handlers = {}   # pin id -> (handler, trigger, pin)
+        self.duties = {}     # pin id -> duty_u16
+        self.duty_writes = 0
+        self.on_duty = []    # fn(pin, duty) after every duty_u16 write
+        self.on_level = []   # fn(pin, value) after every output write
+        self.wires = {}      # output pin id -> [(device, input pin id)]
+        self.radio = None    # Radio, made by the first bluetooth.BLE()
+        self.pixels = {}     # pin id -> colors last written to the NeoPixels
+        self.pixel_writes = 0
+
+    def duty(self, pin):
+        return self.duties.get(pin, 0)
+
+    def set_level(self, pin, value):
+        # drive a pin from outside (or from a wire) and fire its IRQ on an edge
+        value = 1 if value else 0
+        old = self.levels.get(pin, 0)
+        self.levels[pin] = value
+        if old != value and pin in self.handlers:
+            handler, trigger, obj = self.handlers[pin]
+            edge = Pin.IRQ_RISING if value else Pin.IRQ_FALLING
+            if trigger & edge:
+                handler(obj)
+
+    def wire(self, pin, other, other_pin):
+        # connect this device's output pin to another device's input pin
+        self.wires.setdefault(pin, []).append((other, other_pin))
+        other.set_level(other_pin, self.levels.get(pin, 0))
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.device = current_device()
+        self.id = pin_id(id)
+        self.mode = mode
+        if pull == Pin.PULL_UP and self.id not in self.device.levels:
+            self.device.levels[self.id] = 1
+        if value is not None:
+            self.value(value)
+
+    def value(self, v=None):
+        if v is None:
+            return self.device.levels.get(self.id, 0)
+        v = 1 if v else 0
+        self.device.set_level(self.id, v)
+        for fn in self.device.on_level:
+            fn(self.id, v)
+        for other, other_pin in self.device.wires.get(self.id, ()):
+            other.set_level(other_pin, v)
+
+    __call__ = value
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    high = on
+    low = off
+
+    def toggle(self):
+        self.value(not self.value())
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            self.device.handlers.pop(self.id, None)
+        else:
+            self.device.handlers[self.id] = (handler, trigger, self)
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty_u16=None):
+        self.device = current_device()
+        self.id = pin.id if isinstance(pin, Pin) else pin_id(pin)
+        self._freq = freq or 1000
+        if duty_u16 is not None:
+            self.duty_u16(duty_u16)
+
+    def freq(self, f=None):
+        if f is None:
+            return self._freq
+        self._freq = f
+
+    def duty_u16(self, d=None):
+        if d is None:
+            return self.device.duty(self.id)
+        if not isinstance(d, int) or not 0 <= d <= 65535:
+            raise ValueError('duty_u16 must be from 0 to 65535, got %r' % (d,))
+        self.device.duties[self.id] = d
+        self.device.duty_writes += 1
+        for fn in self.device.on_duty:
+            fn(self.id, d)
+
+    def deinit(self):
+        self.device.duties[self.id] = 0
+
+
+def make_machine_module():
+    mod = types.ModuleType('machine')
+    mod.Pin = Pin
+    mod.PWM = PWM
+    mod.disable_irq = lambda: 0
+    mod.enable_irq = lambda state=0: None
+    mod.freq = lambda f=None: 125000000
+    mod.unique_id = lambda: b'\x00' * 8
+    mod.reset = lambda: None
+    return mod
+
+
+# ---------------------------------------------------------------- neopixel
+
+class NeoPixel:
+    def __init__(self, pin, n, bpp=3, timing=1):
+        self.device = current_device()
+        self.id = pin.id if isinstance(pin, Pin) else pin_id(pin)
+        self.n = n
+        self.buf = [(0,) * bpp for i in range(n)]
+
+    def __len__(self):
+        return self.n
+
+    def __setitem__(self, i, color):
+        self.buf[i] = tuple(color)
+
+    def __getitem__(self, i):
+        return self.buf[i]
+
+    def fill(self, color):
+        self.buf = [tuple(color)] * self.n
+
+    def write(self):
+        self.device.pixels[self.id] = list(self.buf)
+        self.device.pixel_writes += 1
+
+
+def make_neopixel_module():
+    mod = types.ModuleType('neopixel')
+    mod.NeoPixel = NeoPixel
+    return mod
+
+
+# ---------------------------------------------------------------- bluetooth
+
+IRQ_SCAN_RESULT = 5
+IRQ_SCAN_DONE = 6
+
+
+class Radio:
+    """a device's BLE radio, what bluetooth.BLE() returns on it
+
+    Only the GAP broadcaster/observer part is there. gap_advertise() leaves
+    the payload in adv_data for the harness to put on the air, and the
+    harness calls deliver() for every advertisement that reaches the device:
+    while a scan is on and the scan window is open, the IRQ handler gets
+    _IRQ_SCAN_RESULT with the address and payload as memoryviews, like the
+    real stack.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        self._active = False
+        self.handler = None
+        self.scan_until = None   # None: not scanning, 0: scanning forever
+        self.scan_start = 0
+        self.interval_us = self.window_us = 0
+        self.adv_data = None     # payload being advertised, None when not
+        self.adv_interval_us = 0
+        self.adv_calls = 0       # gap_advertise() calls that (re)started advertising
+        self.delivered = 0       # advertisements handed to the IRQ handler
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def gap_scan(self, duration_ms, interval_us=1280000, window_us=11250, active=False):
+        clock = self.device.runtime.clock
+        if duration_ms is None:
+            self._scan_done()
+            return
+        now = clock.ticks_us()
+        self.scan_start = now
+        self.interval_us, self.window_us = interval_us, window_us
+        self.scan_until = now + duration_ms * 1000 if duration_ms else 0
+        if duration_ms and hasattr(clock, 'at'):
+            clock.at(self.scan_until, self._scan_done)
+
+    def _scan_done(self):
+        if self.scan_until is None:
+            return
+        self.scan_until = None
+        if self.handler is not None:
+            self.handler(IRQ_SCAN_DONE, None)
+
+    def listening(self, t_us):
+        # True if a packet sent at t_us falls in an open scan window
+        if not self._active or self.scan_until is None:
+            return False
+        if self.scan_until and t_us >= self.scan_until:
+            return False
+        if self.window_us >= self.interval_us:
+            return True
+        return (t_us - self.scan_start) % self.interval_us < self.window_us
+
+    def deliver(self, addr, rssi, adv_data, adv_type=0):
+        # one advertisement on the air, heard if the scan is listening
+        if self.handler is None or not self.listening(self.device.runtime.clock.ticks_us()):
+            return False
+        self.delivered += 1
+        self.handler(IRQ_SCAN_RESULT, (0, memoryview(addr), adv_type, rssi, memoryview(adv_data)))
+        return True
+
+    def gap_advertise(self, interval_us, adv_data=None, resp_data=None, connectable=True):
+        if interval_us is None:
+            self.adv_data = None
+            return
+        self.adv_interval_us = interval_us
+        if adv_data is not None:
+            self.adv_data = bytes(adv_data)
+        self.adv_calls += 1
+
+
+def make_bluetooth_module():
+    mod = types.ModuleType('bluetooth')
+
+    def BLE():
+        # one radio per device, like the singleton on the board
+        device = current_device()
+        if device.radio is None:
+            device.radio = Radio(device)
+        return device.radio
+    mod.BLE = BLE
+    mod.UUID = lambda value: value
+    return mod
+
+
+# ---------------------------------------------------------------- asyncio
+
+class CancelledError(BaseException):
+    pass
+
+
+class _Suspend:
+    # awaited to hand a command to the loop: None (run again), ('sleep', t_us),
+    # ('wait', obj), which park()s the task until it wakes it
+    def __init__(self, cmd):
+        self.cmd = cmd
+
+    def __await__(self):
+        yield self.cmd
+
+
+class Task:
+    def __init__(self, loop, coro):
+        self.loop = loop
+        self.coro = coro
+        self.token = 0        # bumped on every resume; stale wake-ups are ignored
+        self.waiters = []     # (task, token) awaiting this one
+        self.done = False
+        self.result = None
+        self.error = None
+        self._throw = None
+
+    def cancel(self):
+        if self.done:
+            return False
+        self._throw = CancelledError()
+        self.loop.wake(self)
+        return True
+
+    def park(self, task):
+        self.waiters.append((task, task.token))
+
+    def __await__(self):
+        if not self.done:
+            yield ('wait', self)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class Loop:
+    """runs tasks until they sleep or wait; sleeping moves the clock on"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.ready = []       # (task, token)
+        self.sleeping = []    # heap of (t_us, seq, task, token)
+        self.seq = 0
+        self.current = None
+        self.errors = []      # (task, exception) nobody awaited
+
+    def create_task(self, coro):
+        task = Task(self, coro)
+        self.ready.append((task, task.token))
+        return task
+
+    def wake(self, task):
+        self.ready.append((task, task.token))
+
+    def _step(self, task):
+        task.token += 1
+        self.current = task
+        try:
+            if task._throw is not None:
+                e, task._throw = task._throw, None
+                cmd = task.coro.throw(e)
+            else:
+                cmd = task.coro.send(None)
+        except StopSimulation:
+            raise
+        except StopIteration as e:
+            self._finish(task, e.value, None)
+            return
+        except BaseException as e:
+            self._finish(task, None, e)
+            return
+        finally:
+            self.current = None
+        if cmd is None:
+            self.wake(task)
+        elif cmd[0] == 'sleep':
+            self.seq += 1
+            heapq.heappush(self.sleeping, (cmd[1], self.seq, task, task.token))
+        else:
+            cmd[1].park(task)
+
+    def _finish(self, task, result, error):
+        task.done = True
+        task.result, task.error = result, error
+        if not task.waiters and error is not None and not isinstance(error, CancelledError):
+            # the board prints this and carries on
+            self.errors.append((task, error))
+            traceback.print_exception(type(error), error, error.__traceback__)
+        for waiter, token in task.waiters:
+            if waiter.token == token:
+                self.wake(waiter)
+        task.waiters = []
+
+    def run_until_complete(self, main=None):
+        # main=None: forever, until the clock stops the simulation
+        while main is None or not main.done:
+            if self.ready:
+                task, token = self.ready.pop(0)
+                if task.token == token and not task.done:
+                    self._step(task)
+                continue
+            now = self.clock.ticks_us()
+            # nothing to run: wait for the next sleeper, but no further than
+            # the next clock event (an IRQ may wake a task), or 1 ms on a
+            # WallClock
+            wake_at = self.sleeping[0][0] if self.sleeping else now + 1000
+            event = getattr(self.clock, 'next_event_us', None)
+            if event is None:
+                wake_at = min(wake_at, now + 1000)
+            elif event() is not None:
+                wake_at = min(wake_at, max(now, event()))
+            self.clock.sleep_us(max(0, wake_at - now))  # 0: runs the events due now
+            now = self.clock.ticks_us()
+            while self.sleeping and self.sleeping[0][0] <= now:
+                t, seq, task, token = heapq.heappop(self.sleeping)
+                if task.token == token:
+                    self.wake(task)
+        if main.error is not None:
+            raise main.error
+        return main.result
+
+    def run_forever(self):
+        self.run_until_complete(None)
+
+
+class Event:
+    def __init__(self):
+        self.state = False
+        self.waiters = []
+
+    def is_set(self):
+        return self.state
+
+    def set(self):
+        self.state = True
+        for task, token in self.waiters:
+            if task.token == token:
+                task.loop.wake(task)
+        self.waiters = []
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            await _Suspend(('wait', self))
+        return True
+
+    def park(self, task):
+        self.waiters.append((task, task.token))
+
+
+class ThreadSafeFlag:
+    """set() from an IRQ or another thread wakes one waiter, wait() clears it"""
+
+    def __init__(self):
+        self.state = False
+        self.waiters = []
+        self._lock = threading.Lock()
+
+    def set(self):
+        with self._lock:
+            while self.waiters:
+                task, token = self.waiters.pop(0)
+                if task.token == token:
+                    task.loop.wake(task)
+                    return
+            self.state = True
+
+    def clear(self):
+        self.state = False
+
+    def park(self, task):
+        # a set() from another thread since wait() looked is not lost
+        with self._lock:
+            if self.state:
+                self.state = False
+                task.loop.wake(task)
+            else:
+                self.waiters.append((task, task.token))
+
+    async def wait(self):
+        if self.state:
+            self.state = False
+            return
+        await _Suspend(('wait', self))
+
+
+def make_asyncio_module(clock):
+    mod = types.ModuleType('asyncio')
+    loop = Loop(clock)
+    mod.CancelledError = CancelledError
+    mod.Event = Event
+    mod.ThreadSafeFlag = ThreadSafeFlag
+    mod.Task = Task
+    mod.loop = loop
+    mod.get_event_loop = lambda *args: loop
+    mod.new_event_loop = lambda: loop
+    mod.create_task = loop.create_task
+    mod.current_task = lambda: loop.current
+
+    async def sleep_ms(ms):
+        if ms <= 0:
+            await _Suspend(None)
+        else:
+            await _Suspend(('sleep', clock.ticks_us() + int(ms * 1000)))
+
+    async def sleep(s):
+        await sleep_ms(s * 1000)
+
+    async def gather(*aws, return_exceptions=False):
+        tasks = [aw if isinstance(aw, Task) else loop.create_task(aw) for aw in aws]
+        results = []
+        for task in tasks:
+            try:
+                results.append(await task)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    def run(coro):
+        return loop.run_until_complete(loop.create_task(coro))
+
+    mod.sleep_ms = sleep_ms
+    mod.sleep = sleep
+    mod.gather = gather
+    mod.run = run
+    return mod
+
+
+# ---------------------------------------------------------------- _thread
+
+def make_thread_module():
+    mod = types.ModuleType('_thread')
+
+    def start_new_thread(fn, args, kwargs={}):
+        device = current_device()
+
+        def target():
+            _local.device = device
+            try:
+                fn(*args, **kwargs)
+            except StopSimulation:
+                pass
+        threading.Thread(target=target, name='%s core 1' % device.name, daemon=True).start()
+    mod.start_new_thread = start_new_thread
+    mod.allocate_lock = threading.Lock
+    mod.get_ident = threading.get_ident
+    return mod
+
+
+# ---------------------------------------------------------------- mqtt
+
+class Broker:
+    """in-process MQTT broker, delivers each message after latency_us"""
+
+    def __init__(self, clock, latency_us=0):
+        self.clock = clock
+        self.latency_us = latency_us
+        self.clients = []
+        self.published = 0
+        self.on_publish = []  # fn(topic, msg) for every message published
+        self.on_receive = []  # fn(client, topic, msg) as a client takes a message
+        self.up = True        # False: connects fail, see outage()
+
+    def outage(self, up=False):
+        # network blip: close every connection, and refuse new ones until
+        # outage(True)
+        self.up = up
+        if not up:
+            for client in self.clients:
+                client.closed = True
+            self.clients = []
+
+    def publish(self, topic, msg, latency_us=None):
+        topic, msg = bytes(topic), bytes(msg)
+        self.published += 1
+        for fn in self.on_publish:
+            fn(topic, msg)
+        due = self.clock.ticks_us() + (self.latency_us if latency_us is None else latency_us)
+        for client in self.clients:
+            if client.matches(topic):
+                client.deliver(due, topic, msg)
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None,
+                 keepalive=0, ssl=False, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.broker = None
+        self.cb = None
+        self.topics = []
+        self._inbox = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.device = current_device()
+        self.closed = False
+
+    def connect(self, clean_session=True):
+        self.broker = self.device.runtime.broker
+        if not self.broker.up:
+            raise OSError(113, 'EHOSTUNREACH')
+        self.closed = False
+        self.broker.clients.append(self)
+        return 0
+
+    def _check(self):
+        if self.closed:
+            raise OSError(104, 'ECONNRESET')
+
+    def disconnect(self):
+        if self.broker and self in self.broker.clients:
+            self.broker.clients.remove(self)
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def subscribe(self, topic, qos=0):
+        self._check()
+        self.topics.append(bytes(topic))
+
+    def matches(self, topic):
+        for t in self.topics:
+            if t == topic or t == b'#' or (t.endswith(b'/#') and topic.startswith(t[:-1])):
+                return True
+        return False
+
+    def deliver(self, due, topic, msg):
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._inbox, (due, self._seq, topic, msg))
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._check()
+        self.broker.publish(topic, msg)
+
+    def ping(self):
+        self._check()
+
+    def check_msg(self):
+        # hand at most one due message to the callback, like umqtt.simple
+        self._check()
+        with self._lock:
+            if not self._inbox or self._inbox[0][0] > self.broker.clock.ticks_us():
+                return None
+            due, seq, topic, msg = heapq.heappop(self._inbox)
+        for fn in self.broker.on_receive:
+            fn(self, topic, msg)
+        self.cb(topic, msg)
+
+    def wait_msg(self):
+        # block until a message arrives
+        while True:
+            self._check()
+            with self._lock:
+                due = self._inbox[0][0] if self._inbox else None
+            now = self.broker.clock.ticks_us()
+            if due is not None and due <= now:
+                return self.check_msg()
+            self.broker.clock.sleep_us(1000 if due is None else min(1000, due - now))
+
+
+def make_mqtt_module():
+    mod = types.ModuleType('mqtt')
+    mod.MQTTClient = MQTTClient
+    mod.MQTTException = type('MQTTException', (Exception,), {})
+    return mod
+
+
+# ---------------------------------------------------------------- wifi
+
+def make_wifi_module():
+    # useful/wifi.py's API, always connected at once (the real module would
+    # also write its index file into the working directory)
+    mod = types.ModuleType('wifi')
+    ifconfig = ('10.0.0.2', '255.255.255.0', '10.0.0.1', '10.0.0.1')
+
+    class Connector:
+        index, ssid = 2, 'sim'
+
+        def poll(self):
+            return True
+
+        def wait(self):
+            return ifconfig
+
+        async def wait_async(self):
+            return ifconfig
+
+    class BootLog:
+        def __init__(self):
+            self.marks = []
+
+        def mark(self, phase):
+            self.marks.append((phase, 0))
+
+        def report(self):
+            pass
+
+    connector = Connector()
+
+    async def wifi_async(index=None, ssid=None, key=None):
+        return ifconfig
+
+    mod.connect = mod.connect_wifi = lambda index=None, ssid=None, key=None: ifconfig
+    mod.start_wifi = lambda index=None, ssid=None, key=None: connector
+    mod.wait_wifi = lambda: ifconfig
+    mod.wifi_async = wifi_async
+    mod.boot = BootLog()
+    mod.__all__ = ['connect', 'connect_wifi', 'start_wifi', 'wait_wifi', 'wifi_async', 'boot']
+    return mod
+
+
+# ---------------------------------------------------------------- network
+
+class WLAN:
+    STA_IF = 0
+    AP_IF = 1
+
+    def __init__(self, interface=0):
+        self._active = False
+        self._connected = False
+
+    def active(self, state=None):
+        if state is None:
+            return self._active
+        self._active = bool(state)
+
+    def connect(self, ssid=None, key=None):
+        self._connected = True
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected
+
+    def status(self, param=None):
+        return 3 if self._connected else 0  # STAT_GOT_IP
+
+    def ifconfig(self):
+        if not self._connected:
+            return ('0.0.0.0', '0.0.0.0', '0.0.0.0', '0.0.0.0')
+        return ('10.0.0.2', '255.255.255.0', '10.0.0.1', '10.0.0.1')
+
+
+def make_network_module():
+    mod = types.ModuleType('network')
+    mod.WLAN = WLAN
+    mod.STA_IF = WLAN.STA_IF
+    mod.AP_IF = WLAN.AP_IF
+    mod.STAT_GOT_IP = 3
+    return mod
+
+
+def make_secrets_module():
+    # camera scripts read mysecrets['SSID'], the Picos mysecrets[index]['SSID']
+    mod = types.ModuleType('secrets')
+    network = {'SSID': 'sim', 'key': 'sim'}
+    mod.mysecrets = dict(network)
+    mod.mysecrets.update({i: network for i in range(4)})
+    return mod
+
+
+# ---------------------------------------------------------------- sensor
+
+class Tag:
+    """what img.find_apriltags() returns for one tag"""
+
+    def __init__(self, id, x, y, z, rect=(70, 50, 20, 20)):
+        self.id = id
+        self.x_translation, self.y_translation, self.z_translation = x, y, z
+        self.rect = rect
+        self.cx = rect[0] + rect[2] // 2
+        self.cy = rect[1] + rect[3] // 2
+
+
+class Image:
+    def __init__(self, tags, detect_us, clock):
+        self.tags = tags
+        self.detect_us = detect_us
+        self.clock = clock
+
+    def find_apriltags(self, roi=None, **kwargs):
+        # tags whose centre is inside roi, after the configured detection time
+        if self.detect_us:
+            self.clock.sleep_us(self.detect_us if roi is None else self.detect_us // 3)
+        if roi is None:
+            return list(self.tags)
+        x, y, w, h = roi
+        return [t for t in self.tags if x <= t.cx < x + w and y <= t.cy < y + h]
+
+    def draw_rectangle(self, *args, **kwargs):
+        pass
+
+    def draw_cross(self, *args, **kwargs):
+        pass
+
+
+def make_sensor_module(runtime):
+    mod = types.ModuleType('sensor')
+    mod.GRAYSCALE, mod.RGB565 = 1, 2
+    mod.QQVGA, mod.QVGA = 1, 2
+    for name in ('reset', 'set_pixformat', 'set_framesize', 'skip_frames',
+                 'set_auto_gain', 'set_auto_whitebal'):
+        setattr(mod, name, lambda *args, **kwargs: None)
+    mod.on_snapshot = []  # fn(image) after every snapshot
+
+    def snapshot():
+        img = Image(runtime.tag_source(runtime.clock.ticks_us()),
+                    runtime.detect_us, runtime.clock)
+        for fn in mod.on_snapshot:
+            fn(img)
+        return img
+    mod.snapshot = snapshot
+    return mod
+
+
+# ---------------------------------------------------------------- runtime
+
+class Runtime:
+    """one simulated world: a clock, an MQTT broker and the devices in it"""
+
+    def __init__(self, clock, latency_us=0):
+        self.clock = clock
+        self.broker = Broker(clock, latency_us)
+        self.devices = {}
+        self.tag_source = lambda t_us: []  # tags in view of the camera at t_us
+        self.detect_us = 0                 # simulated find_apriltags() time
+        self.modules = {
+            'time': make_time_module(clock),
+            'machine': make_machine_module(),
+            'mqtt': make_mqtt_module(),
+            'wifi': make_wifi_module(),
+            'network': make_network_module(),
+            'secrets': make_secrets_module(),
+            'sensor': make_sensor_module(self),
+            'bluetooth': make_bluetooth_module(),
+            'neopixel': make_neopixel_module(),
+            'asyncio': make_asyncio_module(clock),
+            '_thread': make_thread_module(),
+        }
+
+    def device(self, name):
+        if name not in self.devices:
+            self.devices[name] = Device(self, name)
+        return self.devices[name]
+
+    @contextmanager
+    def installed(self, paths=()):
+        # swap the stand-ins into sys.modules and put the device source
+        # folders on sys.path, undoing both afterwards
+        paths = [os.path.abspath(p) for p in list(paths) + [USEFUL]]
+
+        def from_paths(mod):
+            f = getattr(mod, '__file__', None) or ''
+            return any(f.startswith(p + os.sep) for p in paths)
+
+        saved = {name: sys.modules.get(name) for name in self.modules}
+        saved_path = list(sys.path)
+        stale = [name for name, mod in sys.modules.items() if from_paths(mod)]
+        for name in stale:
+            saved.setdefault(name, sys.modules[name])
+            del sys.modules[name]
+        sys.modules.update(self.modules)
+        sys.path[:0] = [p for p in paths if p not in sys.path]
+        try:
+            yield self
+        finally:
+            for name, mod in list(sys.modules.items()):
+                if from_paths(mod):
+                    del sys.modules[name]
+            for name, mod in saved.items():
+                if mod is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = mod
+            sys.path[:] = saved_path
+
+    def run_script(self, path, device, quiet=True, namespace=None):
+        # run a device script as device until the clock stops it, returns
+        # the script's globals (namespace, filled in place, if given);
+        # call inside installed()
+        path = os.path.abspath(path)
+        with open(path) as f:
+            code = compile(f.read(), path, 'exec')
+        ns = {} if namespace is None else namespace
+        ns.update({'__name__': '__main__', '__file__': path})
+        if quiet:
+            ns.setdefault('print', lambda *args, **kwargs: None)
+        _local.device = device
+        try:
+            exec(code, ns)
+        except StopSimulation:
+            pass
+        finally:
+            _local.device = None
+        return ns
+
+    def spawn(self, path, device, quiet=True, namespace=None):
+        # run_script in a thread (WallClock runtimes); the thread's error
+        # and namespace attributes are set when it finishes
+        def target():
+            try:
+                thread.namespace = self.run_script(path, device, quiet, thread.namespace)
+            except Exception as e:
+                thread.error = e
+        thread = threading.Thread(target=target, name=device.name, daemon=True)
+        thread.error = None
+        thread.namespace = {} if namespace is None else namespace
+        thread.start()
+        return thread
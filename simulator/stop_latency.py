@@ -0,0 +1,137 @@
+"""Start/stop latency: MQTT publish to motors off on the Convoluted Car.
+
+Runs the relay Pico script (Convoluted Car/car_start_stop.py) and the motor
+Pico script (Convoluted Car/car_motor_control.py) unchanged, each in its own
+thread in real time against the stand-ins in mpy.py, with the relay's pin 2
+wired to the motor Pico's pin 20. The harness plays the camera (a tag held
+at full forward) and the phone, publishing 'run' and then 'stop' at random
+moments, and times each stop at
+
+    publish   'stop' handed to the broker
+    line      the relay drives pin 2 low
+    off       all four motor duties are 0
+
+    python simulator/stop_latency.py --stops 50
+    python simulator/stop_latency.py --network-ms 20
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from latency_bench import percentile  # noqa: E402
+from mpy import ROOT, Runtime, StopSimulation, WallClock  # noqa: E402
+
+CAR_DIR = os.path.join(ROOT, 'Convoluted Car')
+MOTOR_PINS = (2, 3, 4, 5)
+
+
+class StopTimer:
+    """timestamps (us) of each stop's publish, line and motors-off"""
+
+    def __init__(self, clock, car_dev):
+        self.clock = clock
+        self.car_dev = car_dev
+        self.lock = threading.Lock()
+        self.pending = None   # index of the stop being timed
+        self.stops = []       # [publish, line, off]
+
+    def published(self):
+        with self.lock:
+            self.stops.append([self.clock.ticks_us(), None, None])
+            self.pending = len(self.stops) - 1
+
+    def level(self, pin, value):
+        # relay output written
+        with self.lock:
+            if pin == 2 and not value and self.pending is not None:
+                stop = self.stops[self.pending]
+                if stop[1] is None:
+                    stop[1] = self.clock.ticks_us()
+
+    def duty(self, pin, duty):
+        with self.lock:
+            if self.pending is None or any(self.car_dev.duty(p) for p in MOTOR_PINS):
+                return
+            self.stops[self.pending][2] = self.clock.ticks_us()
+            self.pending = None
+
+    def latencies(self, start, end):
+        return sorted((s[end] - s[start]) / 1000 for s in self.stops
+                      if s[start] is not None and s[end] is not None)
+
+
+def run(stops=20, network_ms=0.0, quiet=True, seed=0):
+    """time stops publish->off, returns (StopTimer, errors)"""
+    rng = random.Random(seed)
+    clock = WallClock()
+    rt = Runtime(clock, latency_us=int(network_ms * 1000))
+    relay = rt.device('relay')
+    car = rt.device('car')
+    relay.wire(2, car, 20)
+    timer = StopTimer(clock, car)
+    relay.on_level.append(timer.level)
+    car.on_duty.append(timer.duty)
+
+    with rt.installed([CAR_DIR]):
+        from pose_frame import PoseBatchEncoder
+        encoder = PoseBatchEncoder()
+        threads = [rt.spawn(os.path.join(CAR_DIR, 'car_start_stop.py'), relay, quiet),
+                   rt.spawn(os.path.join(CAR_DIR, 'car_motor_control.py'), car, quiet)]
+
+        def camera():
+            # tag at full forward every 30 ms, so the car drives whenever it may
+            try:
+                while True:
+                    encoder.begin(clock.ticks_us() // 1000)
+                    encoder.add(0, 0.0, -4.5, -10.0)
+                    rt.broker.publish(b'ME35-24/noahmedha', encoder.finish())
+                    clock.sleep_us(30000)
+            except StopSimulation:
+                pass
+        threading.Thread(target=camera, daemon=True).start()
+
+        try:
+            clock.sleep_us(500000)  # let both scripts connect
+            for i in range(stops):
+                rt.broker.publish(b'ME35-24/carstartstop', b'run')
+                clock.sleep_us(rng.randint(200000, 400000))
+                timer.published()
+                rt.broker.publish(b'ME35-24/carstartstop', b'stop')
+                clock.sleep_us(rng.randint(100000, 200000))
+        finally:
+            clock.stop()
+            for thread in threads:
+                thread.join(5)
+    errors = [(t.name, t.error) for t in threads if t.error]
+    return timer, errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--stops', type=int, default=20, help='stops to time')
+    ap.add_argument('--network-ms', type=float, default=0.0, help='simulated broker latency')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--verbose', action='store_true', help="show the scripts' prints")
+    args = ap.parse_args()
+
+    timer, errors = run(args.stops, args.network_ms, not args.verbose, args.seed)
+    print('%d stops, network %.1f ms' % (len(timer.stops), args.network_ms))
+    print('%-16s %6s %8s %8s %8s %8s' % ('stage', 'n', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for name, start, end in (('publish->line', 0, 1), ('line->off', 1, 2), ('publish->off', 0, 2)):
+        values = timer.latencies(start, end)
+        print('%-16s %6d %8.3f %8.3f %8.3f %8.3f' % (
+            name, len(values), percentile(values, 0.5), percentile(values, 0.9),
+            percentile(values, 0.99), values[-1] if values else float('nan')))
+    missed = sum(1 for s in timer.stops if s[2] is None)
+    if missed:
+        print('%d stops never turned the motors off' % missed)
+    for name, error in errors:
+        print('%s script stopped with %s: %s' % (name, type(error).__name__, error))
+
+
+if __name__ == '__main__':
+    main()
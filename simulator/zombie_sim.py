@@ -0,0 +1,352 @@
+"""BLE crowd simulator for the zombie game (Zombie Attack/main.py).
+
+main.py and Tufts_ble.Sniff run unchanged against the stand-ins in mpy.py on
+a virtual clock, as the one human player in the middle of an arena. Around
+it, N zombie players walk between random waypoints (some of them right up
+to the human, where they may linger long enough to tag) and advertise
+'!<id>' every interval plus the 0-10 ms random delay BLE adds. Bystanders
+(phones and the like) advertise other names. Each advertisement reaches the
+human's radio with the RSSI of a log-distance path-loss model plus Gaussian
+shadowing, if it is above the receiver's sensitivity.
+
+Ground truth applies the game rules to the noise-free RSSI: a zombie is in
+range while its mean RSSI is above the threshold, and tags after staying in
+range for 3 s. main.py's 'Tagged by group N' / 'Zombified by N' messages are
+matched against it.
+
+    python simulator/zombie_sim.py --players 8 --duration 60
+    python simulator/zombie_sim.py --players 10,50,100,200 --interval-ms 20 --chase 0
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mpy import ROOT, Radio, Runtime, VirtualClock  # noqa: E402
+
+ZOMBIE_DIR = os.path.join(ROOT, 'Zombie Attack')
+NAME_FLAG = 0x09
+
+
+def adv_payload(name):
+    # what Tufts_ble.Yell puts on the air for a name
+    name = name[:8].encode()
+    return bytes((len(name) + 1, NAME_FLAG)) + name
+
+
+def addr_of(n):
+    return bytes((0xd8, 0x3a, 0xdd, (n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff))
+
+
+class Mover:
+    """walks between random waypoints, pausing at each
+
+    With probability chase a waypoint is next to home (the human player),
+    otherwise anywhere in the arena. Positions are worked out from the
+    current leg when asked, nothing is stepped.
+    """
+
+    def __init__(self, rng, width, height, home, chase=0.3, speed=(0.5, 1.5),
+                 pause=(0.0, 6.0), near=0.8):
+        self.rng = rng
+        self.width, self.height = width, height
+        self.home = home
+        self.chase = chase
+        self.speed = speed
+        self.pause = pause
+        self.near = near
+        self.x, self.y = rng.uniform(0, width), rng.uniform(0, height)
+        self.leg = (0.0, self.x, self.y, 0.0, self.x, self.y)  # t0, x0, y0, t1, x1, y1
+        self.rest_until = 0.0
+
+    def _waypoint(self):
+        if self.rng.random() < self.chase:
+            a = self.rng.uniform(0, 2 * math.pi)
+            r = self.near * math.sqrt(self.rng.random())
+            return self.home[0] + r * math.cos(a), self.home[1] + r * math.sin(a)
+        return self.rng.uniform(0, self.width), self.rng.uniform(0, self.height)
+
+    def position(self, t):
+        while t > self.rest_until:
+            # at the end of the leg, pause there, then start the next one
+            t0, x0, y0, t1, x1, y1 = self.leg
+            x2, y2 = self._waypoint()
+            start = self.rest_until
+            t2 = start + math.hypot(x2 - x1, y2 - y1) / self.rng.uniform(*self.speed)
+            self.leg = (start, x1, y1, t2, x2, y2)
+            self.rest_until = t2 + self.rng.uniform(*self.pause)
+        t0, x0, y0, t1, x1, y1 = self.leg
+        if t >= t1:
+            return x1, y1
+        k = (t - t0) / (t1 - t0) if t1 > t0 else 1.0
+        return x0 + (x1 - x0) * k, y0 + (y1 - y0) * k
+
+
+class Arena:
+    """the radio environment: every advertiser and the human's receiver"""
+
+    def __init__(self, clock, radio, width=6.0, height=6.0, tx_power=-59, n=2.0,
+                 sigma=4.0, sensitivity=-95, seed=0):
+        self.clock = clock
+        self.radio = radio      # the human's Radio
+        self.width, self.height = width, height
+        self.home = (width / 2, height / 2)
+        self.tx_power = tx_power
+        self.n = n
+        self.sigma = sigma
+        self.sensitivity = sensitivity
+        self.rng = random.Random(seed)
+        self.movers = []
+        self.on_air = 0         # advertisements sent
+        self.in_range = 0       # ... strong enough to be received
+
+    def mean_rssi(self, mover, t):
+        x, y = mover.position(t)
+        d = max(0.1, math.hypot(x - self.home[0], y - self.home[1]))
+        return self.tx_power - 10 * self.n * math.log10(d)
+
+    def add(self, mover, payload, interval_ms, start_us=None):
+        # advertise payload every interval_ms (+0-10 ms advDelay) from start_us
+        addr = addr_of(len(self.movers) + 1)
+        self.movers.append(mover)
+        interval_us = int(interval_ms * 1000)
+
+        def advertise():
+            t = self.clock.now_us
+            self.on_air += 1
+            rssi = self.mean_rssi(mover, t / 1e6) + self.rng.gauss(0, self.sigma)
+            if rssi >= self.sensitivity:
+                self.in_range += 1
+                self.radio.deliver(addr, max(-127, min(20, int(round(rssi)))), payload)
+            self.clock.at(t + interval_us + self.rng.randrange(10000), advertise)
+        self.clock.at(self.rng.randrange(interval_us) if start_us is None else start_us, advertise)
+
+
+class Truth:
+    """the game rules on the noise-free RSSI, sampled every period_s"""
+
+    def __init__(self, arena, zombies, rssi_thresh=-60, tag_s=3.0, tags_to_zombify=3,
+                 period_s=0.05):
+        self.arena = arena
+        self.zombies = zombies      # {id: Mover}
+        self.rssi_thresh = rssi_thresh
+        self.tag_s = tag_s
+        self.tags_to_zombify = tags_to_zombify
+        self.period_s = period_s
+        self.entered = {}           # id -> time it came in range
+        self.counts = {}
+        self.tags = []              # (t, id)
+        self.zombie = None          # (t, id)
+        arena.clock.every(int(period_s * 1e6), self.sample, start_us=0)
+
+    def sample(self):
+        t = self.arena.clock.now_us / 1e6
+        for tag_id, mover in self.zombies.items():
+            if self.arena.mean_rssi(mover, t) <= self.rssi_thresh:
+                self.entered.pop(tag_id, None)
+                continue
+            start = self.entered.setdefault(tag_id, t)
+            if start is not None and t - start > self.tag_s:
+                self.entered[tag_id] = None  # once per stay
+                self.tags.append((t, tag_id))
+                self.counts[tag_id] = self.counts.get(tag_id, 0) + 1
+                if self.zombie is None and self.counts[tag_id] == self.tags_to_zombify:
+                    self.zombie = (t, tag_id)
+
+
+class Decisions:
+    """the human's tag/zombify messages, as (t, id)"""
+
+    def __init__(self, clock, echo=False, on_zombie=None):
+        self.clock = clock
+        self.echo = echo
+        self.on_zombie = on_zombie
+        self.tags = []
+        self.zombie = None
+
+    def print(self, *args, **kwargs):
+        line = ' '.join(str(a) for a in args)
+        t = self.clock.now_us / 1e6
+        if line.startswith('Tagged by group '):
+            self.tags.append((t, int(line.split()[-1])))
+        elif line.startswith('Zombified by '):
+            self.zombie = (t, int(line.split()[-1]))
+            if self.on_zombie is not None:
+                self.on_zombie()
+        if self.echo:
+            print('%8.3f %s' % (t, line))
+
+
+def match(truth, found, tolerance_s):
+    # pair decisions with true tags of the same id within tolerance_s;
+    # returns (matched delays, missed, false)
+    free = list(truth)
+    delays = []
+    false = 0
+    for t, tag_id in found:
+        best = None
+        for k, (tt, tid) in enumerate(free):
+            if tid == tag_id and abs(t - tt) <= tolerance_s and (best is None or abs(t - tt) < abs(t - free[best][0])):
+                best = k
+        if best is None:
+            false += 1
+        else:
+            delays.append(t - free.pop(best)[0])
+    return delays, len(free), false
+
+
+class Result:
+    def __init__(self):
+        self.players = 0
+        self.sim_s = 0.0
+        self.wall_s = 0.0
+        self.on_air = 0
+        self.in_range = 0
+        self.delivered = 0
+        self.accepted = 0
+        self.dropped = 0
+        self.truth_tags = 0
+        self.found_tags = 0
+        self.delays = []
+        self.missed = 0
+        self.false = 0
+        self.truth_zombie = None
+        self.zombie = None
+        self.pixel_writes = 0
+        self.pin_writes = 0
+        self.adv_calls = 0      # gap_advertise() calls as a zombie
+        self.error = None
+
+
+def simulate(players=8, duration=60.0, interval_ms=100, others=0, other_interval_ms=100,
+             width=6.0, height=6.0, chase=0.3, sigma=4.0, tolerance_s=1.5, seed=0,
+             zombie_s=5.0, verbose=False):
+    """run main.py as the human among players zombies for duration simulated s
+
+    Once zombified, the human advertises for zombie_s before the button
+    (GPIO20, high until pressed) ends the script.
+    """
+    clock = VirtualClock(duration)
+    rt = Runtime(clock)
+    dev = rt.device('human')
+    dev.levels[20] = 1
+    rng = random.Random(seed)
+
+    def press_later():
+        clock.at(clock.now_us + int(zombie_s * 1e6), lambda: dev.set_level(20, 0))
+    decisions = Decisions(clock, echo=verbose, on_zombie=press_later)
+    res = Result()
+    res.players = players
+
+    def pin_write(pin, value):
+        res.pin_writes += 1
+    dev.on_level.append(pin_write)
+
+    with rt.installed([ZOMBIE_DIR]):
+        radio = dev.radio = Radio(dev)  # what bluetooth.BLE() returns in main.py
+        arena = Arena(clock, radio, width, height, sigma=sigma, seed=seed + 1)
+        zombies = {}
+        for i in range(players):
+            tag_id = i + 1
+            zombies[tag_id] = Mover(rng, width, height, arena.home, chase)
+            arena.add(zombies[tag_id], adv_payload('!%d' % tag_id), interval_ms)
+        for i in range(others):
+            arena.add(Mover(rng, width, height, arena.home, 0.0),
+                      adv_payload('Phone%d' % i), other_interval_ms)
+        truth = Truth(arena, zombies)
+
+        cwd = os.getcwd()
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)  # zombie_results.txt goes here
+            try:
+                rt.run_script(os.path.join(ZOMBIE_DIR, 'main.py'), dev,
+                              namespace={'print': decisions.print})
+            except Exception as e:
+                res.error = '%s: %s' % (type(e).__name__, e)
+            finally:
+                os.chdir(cwd)
+        res.wall_s = time.perf_counter() - start
+
+    res.sim_s = clock.now_us / 1e6
+    sniff = getattr(radio.handler, '__self__', None)
+    if sniff is not None:
+        res.accepted = sniff.accepted
+        res.dropped = sniff.dropped
+    res.on_air = arena.on_air
+    res.in_range = arena.in_range
+    res.delivered = radio.delivered
+    res.adv_calls = radio.adv_calls
+    res.pixel_writes = dev.pixel_writes
+
+    # compare up to the end of the human's game
+    end = decisions.zombie[0] if decisions.zombie else res.sim_s
+    truth_tags = [(t, i) for t, i in truth.tags if t <= end + tolerance_s]
+    res.truth_tags = len(truth_tags)
+    res.found_tags = len(decisions.tags)
+    res.delays, res.missed, res.false = match(truth_tags, decisions.tags, tolerance_s)
+    res.truth_zombie = truth.zombie
+    res.zombie = decisions.zombie
+    return res
+
+
+def format_zombie(z):
+    return '-' if z is None else '%d@%.1fs' % (z[1], z[0])
+
+
+def report(results):
+    print('%7s %9s %9s %8s %8s %6s %5s %5s %6s %5s %6s %9s %9s %5s %8s' % (
+        'players', 'air/s', 'heard/s', 'accepted', 'dropped', 'drop%',
+        'tags', 'found', 'missed', 'false', 'delay', 'zombie', 'truth', 'adv', 'host/s'))
+    for r in results:
+        s = max(r.sim_s, 1e-9)
+        heard = r.delivered
+        print('%7d %9.0f %9.0f %8d %8d %6.1f %5d %5d %6d %5d %6s %9s %9s %5d %8.0f' % (
+            r.players, r.on_air / s, heard / s, r.accepted, r.dropped,
+            100.0 * r.dropped / max(1, r.accepted + r.dropped),
+            r.truth_tags, r.found_tags, r.missed, r.false,
+            '%.2f' % (sum(r.delays) / len(r.delays)) if r.delays else '-',
+            format_zombie(r.zombie), format_zombie(r.truth_zombie), r.adv_calls,
+            heard / max(r.wall_s, 1e-9)))
+        if r.error:
+            print('        main.py stopped with %s' % r.error)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--players', default='8', help='zombies, or a comma list to sweep')
+    ap.add_argument('--duration', type=float, default=60.0, help='simulated seconds')
+    ap.add_argument('--interval-ms', type=float, default=100, help='zombie advertising interval')
+    ap.add_argument('--others', type=int, default=0, help='bystanders advertising other names')
+    ap.add_argument('--other-interval-ms', type=float, default=100)
+    ap.add_argument('--size', type=float, default=6.0, help='arena side (m)')
+    ap.add_argument('--chase', type=float, default=0.3,
+                    help='chance a zombie heads for the human (0: load only, no tags)')
+    ap.add_argument('--sigma', type=float, default=4.0, help='RSSI shadowing std dev (dB)')
+    ap.add_argument('--tolerance', type=float, default=1.5, help='tag match window (s)')
+    ap.add_argument('--zombie-s', type=float, default=5.0, help='advertising time once zombified')
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--verbose', action='store_true', help="show main.py's prints")
+    args = ap.parse_args()
+
+    results = []
+    for players in (int(p) for p in args.players.split(',')):
+        results.append(simulate(players, args.duration, args.interval_ms, args.others,
+                                args.other_interval_ms, args.size, args.size, args.chase,
+                                args.sigma, args.tolerance, args.seed, args.zombie_s,
+                                args.verbose))
+    print('%.0f simulated s, zombies every %.0f ms, %d bystanders; '
+          'counts are for the game until the human is zombified' % (
+              args.duration, args.interval_ms, args.others))
+    report(results)
+    print('(air/s: advertisements sent, heard/s: reached the scan IRQ, '
+          'adv: gap_advertise calls as a zombie, host/s: IRQs per wall second)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import time
+
+FULL = 0  # search mode: whole frame
+ROI = 1   # search mode: padded box around the last detection
+
+
+class RoiTagFinder:
+    """AprilTag search that tracks a region of interest between frames
+
+    After a detection, the next frames only search a padded box around the
+    last tag.rect, which is much cheaper than the full frame. After
+    max_misses frames without a tag in the box it goes back to full-frame
+    search. With several tags the box covers all of them, and every
+    full_every frames a full-frame search picks up tags that just came into
+    view (0 turns this off). Set tracking = False to always search the full
+    frame.
+    """
+
+    def __init__(self, fx, fy, cx, cy, width=160, height=120, pad=16,
+                 max_misses=3, full_every=0, report_ms=2000):
+        self.fx, self.fy, self.cx, self.cy = fx, fy, cx, cy
+        self.width = width
+        self.height = height
+        self.pad = pad                # minimum padding around the last rect (px)
+        self.max_misses = max_misses  # ROI misses before a full-frame search
+        self.full_every = full_every  # ROI frames between full-frame searches
+        self.tracking = True
+
+        self.roi = None
+        self.misses = 0
+        self.roi_frames = 0
+
+        # per mode: frames, frame time (us) and search time (us)
+        self.frames = [0, 0]
+        self.frame_us = [0, 0]
+        self.search_us = [0, 0]
+        self._last_us = None
+
+        self.report_ms = report_ms
+        self._report_at = time.ticks_add(time.ticks_ms(), report_ms)
+
+    def find(self, img):
+        # find tags in img, searching only the ROI while a tag is tracked
+        mode = ROI if self.roi else FULL
+        if mode == ROI and self.full_every:
+            self.roi_frames += 1
+            if self.roi_frames > self.full_every:
+                mode = FULL
+                self.roi_frames = 0
+        start = time.ticks_us()
+        if mode == ROI:
+            tags = img.find_apriltags(roi=self.roi, fx=self.fx, fy=self.fy,
+                                      cx=self.cx, cy=self.cy)
+        else:
+            tags = img.find_apriltags(fx=self.fx, fy=self.fy,
+                                      cx=self.cx, cy=self.cy)
+        end = time.ticks_us()
+
+        # frame time runs from the previous search to this one
+        self.frames[mode] += 1
+        self.search_us[mode] += time.ticks_diff(end, start)
+        if self._last_us is not None:
+            self.frame_us[mode] += time.ticks_diff(end, self._last_us)
+        self._last_us = end
+
+        if tags and self.tracking:
+            self.roi = self._pad(tags)
+            self.misses = 0
+        elif self.roi:
+            self.misses += 1
+            if self.misses >= self.max_misses or not self.tracking:
+                self.roi = None
+                self.misses = 0
+        return tags
+
+    def _pad(self, tags):
+        # bounding box of all tag rects, padded and clipped to the image
+        x0, y0, x1, y1 = self.width, self.height, 0, 0
+        for tag in tags:
+            x, y, w, h = tag.rect
+            x0, y0 = min(x0, x), min(y0, y)
+            x1, y1 = max(x1, x + w), max(y1, y + h)
+        pad = max(self.pad, (x1 - x0) // 2, (y1 - y0) // 2)
+        x0, y0 = max(0, x0 - pad), max(0, y0 - pad)
+        x1, y1 = min(self.width, x1 + pad), min(self.height, y1 + pad)
+        return (x0, y0, x1 - x0, y1 - y0)
+
+    def fps(self, mode):
+        # average frames per second of frames searched in this mode
+        if not self.frame_us[mode]:
+            return 0.0
+        return self.frames[mode] * 1000000 / self.frame_us[mode]
+
+    def search_ms(self, mode):
+        # average time spent in find_apriltags for this mode
+        if not self.frames[mode]:
+            return 0.0
+        return self.search_us[mode] / self.frames[mode] / 1000
+
+    def report(self):
+        return 'full: %d frames %.1f fps %.1f ms/search | roi: %d frames %.1f fps %.1f ms/search' % (
+            self.frames[FULL], self.fps(FULL), self.search_ms(FULL),
+            self.frames[ROI], self.fps(ROI), self.search_ms(ROI))
+
+    def maybe_report(self):
+        # print the FPS report every report_ms
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self._report_at) >= 0:
+            self._report_at = time.ticks_add(now, self.report_ms)
+            print(self.report())
@@ -0,0 +1,106 @@
+import time
+from array import array
+
+
+class FixedRateLoop:
+    """paces a loop from absolute deadlines and keeps period statistics
+
+    Call wait() once per iteration instead of time.sleep_ms(period). The
+    next deadline is always the previous deadline plus the period, so the
+    time spent on MQTT, parsing and printing does not add to the period.
+    If an iteration runs past the deadline it is counted as an overrun, and
+    if it is more than a whole period late the schedule restarts from now
+    instead of rushing through the missed ticks.
+
+    stats() can be read at any time (e.g. from the REPL) and gives the
+    min/mean/max/p99 period and the jitter (|period - target|) in ms.
+    """
+
+    def __init__(self, period_ms=10, bins=100):
+        self.period_us = int(period_ms * 1000)
+        self.bins = bins
+        # period histogram covers 0..2 periods, jitter histogram 0..1 period
+        self.bin_us = max(1, 2 * self.period_us // bins)
+        self.period_hist = array('I', [0] * bins)
+        self.jitter_hist = array('I', [0] * bins)
+        self._next = None
+        self._last = None
+        self.reset()
+
+    def reset(self):
+        # clear the statistics, the schedule keeps running
+        self.ticks = 0
+        self.overruns = 0
+        self.min_us = 1 << 30
+        self.max_us = 0
+        self.total_us = 0
+        self.jitter_max_us = 0
+        self.jitter_total_us = 0
+        for i in range(self.bins):
+            self.period_hist[i] = 0
+            self.jitter_hist[i] = 0
+
+    def wait(self):
+        # sleep until the next deadline, then record the period just finished
+        now = time.ticks_us()
+        if self._next is None:  # first call starts the schedule
+            self._next = time.ticks_add(now, self.period_us)
+            self._last = now
+            return
+        remaining = time.ticks_diff(self._next, now)
+        if remaining > 0:
+            if remaining > 2000:
+                time.sleep_ms(remaining // 1000 - 1)  # coarse sleep, lets the CPU idle
+            remaining = time.ticks_diff(self._next, time.ticks_us())
+            if remaining > 0:
+                time.sleep_us(remaining)
+        else:
+            self.overruns += 1
+            if -remaining > self.period_us:  # too far behind, restart from now
+                self._next = now
+        now = time.ticks_us()
+        self._record(time.ticks_diff(now, self._last))
+        self._last = now
+        self._next = time.ticks_add(self._next, self.period_us)
+
+    def _record(self, period):
+        self.ticks += 1
+        self.total_us += period
+        if period < self.min_us:
+            self.min_us = period
+        if period > self.max_us:
+            self.max_us = period
+        jitter = abs(period - self.period_us)
+        self.jitter_total_us += jitter
+        if jitter > self.jitter_max_us:
+            self.jitter_max_us = jitter
+        self.period_hist[min(self.bins - 1, period // self.bin_us)] += 1
+        self.jitter_hist[min(self.bins - 1, 2 * jitter // self.bin_us)] += 1
+
+    def _percentile(self, hist, bin_us, fraction):
+        # upper edge of the bin holding the given fraction of samples
+        target = self.ticks * fraction
+        count = 0
+        for i in range(self.bins):
+            count += hist[i]
+            if count >= target:
+                return (i + 1) * bin_us
+        return self.bins * bin_us
+
+    def stats(self):
+        # period and jitter statistics in ms
+        if not self.ticks:
+            return {'ticks': 0, 'overruns': self.overruns}
+        n = self.ticks
+        return {
+            'ticks': n,
+            'overruns': self.overruns,
+            'target_ms': self.period_us / 1000,
+            'min_ms': self.min_us / 1000,
+            'mean_ms': self.total_us / n / 1000,
+            'max_ms': self.max_us / 1000,
+            'p99_ms': self._percentile(self.period_hist, self.bin_us, 0.99) / 1000,
+            'jitter_mean_ms': self.jitter_total_us / n / 1000,
+            'jitter_max_ms': self.jitter_max_us / 1000,
+            'jitter_p99_ms': self._percentile(self.jitter_hist, self.bin_us / 2, 0.99) / 1000,
+        }
@@ -0,0 +1,81 @@
+from machine import Pin, PWM
+from array import array
+
+
+class MotorDriver:
+    """two DC motors on four PWM pins (forward, reverse per motor)
+
+    Speeds are signed integers from -levels to levels. They are turned into
+    duties through a table built once at start up:
+
+        duty = dead_zone + speed * full_scale // levels   (clamped to 65535)
+
+    so the motors get at least dead_zone as soon as they are asked to move,
+    and speed 0 is always a duty of 0. Out-of-range speeds are clamped here,
+    the last duty of every pin is cached and only changed duties are written.
+    With slew set, a motor's speed moves at most slew levels per update.
+    """
+
+    def __init__(self, left=(2, 3), right=(4, 5), freq=1000, levels=100,
+                 dead_zone=0, full_scale=65535, slew=None):
+        self.pwms = []
+        for pin in left + right:
+            pwm = PWM(Pin(pin))
+            pwm.freq(freq)
+            pwm.duty_u16(0)
+            self.pwms.append(pwm)
+        self.duties = array('H', [0, 0, 0, 0])  # last duty written to each pin
+        self.speeds = [0, 0]                     # last speed of each motor
+        self.levels = levels
+        self.full_scale = full_scale
+        self.slew = slew
+        self.table = array('H', [0] * (levels + 1))
+        self.set_dead_zone(dead_zone)
+        self.writes = 0   # duty_u16 calls made
+        self.skipped = 0  # duty_u16 calls saved by the cache
+
+    def set_dead_zone(self, dead_zone):
+        # rebuild the duty table, takes effect on the next drive()
+        self.dead_zone = dead_zone
+        for i in range(1, self.levels + 1):
+            self.table[i] = min(65535, dead_zone + i * self.full_scale // self.levels)
+
+    def _write(self, i, duty):
+        if self.duties[i] != duty:
+            self.pwms[i].duty_u16(duty)
+            self.duties[i] = duty
+            self.writes += 1
+        else:
+            self.skipped += 1
+
+    def _motor(self, m, speed):
+        speed = int(speed)
+        if self.slew is not None:
+            last = self.speeds[m]
+            speed = max(last - self.slew, min(last + self.slew, speed))
+        speed = max(-self.levels, min(self.levels, speed))
+        self.speeds[m] = speed
+        fwd, rev = 2 * m, 2 * m + 1
+        if speed >= 0:
+            self._write(rev, 0)  # reverse pin off before forward goes on
+            self._write(fwd, self.table[speed])
+        else:
+            self._write(fwd, 0)
+            self._write(rev, self.table[-speed])
+
+    def drive(self, left, right):
+        # set both motor speeds (-levels to levels)
+        self._motor(0, left)
+        self._motor(1, right)
+
+    def stop(self, force=False):
+        # all pins to 0 at once, ignores the slew limit; force writes every
+        # pin even if the cache says it is off (safe to call from an IRQ)
+        self.speeds[0] = self.speeds[1] = 0
+        for i in range(4):
+            if force:
+                self.pwms[i].duty_u16(0)
+                self.duties[i] = 0
+                self.writes += 1
+            else:
+                self._write(i, 0)
@@ -0,0 +1,222 @@
+import time
+from mqtt import MQTTClient, MQTTException
+
+try:
+    import select
+except ImportError:
+    select = None
+
+# what a failed connect can raise: umqtt.simple indexes and asserts on the
+# broker's CONNACK/SUBACK, so a broker that accepts TCP and then closes
+# gives IndexError or AssertionError rather than OSError
+CONNECT_ERRORS = (OSError, MQTTException, IndexError, AssertionError)
+
+
+class MqttSession:
+    """MQTTClient that stays connected
+
+    Takes the place of MQTTClient (connect, set_callback, subscribe,
+    check_msg, wait_msg, publish). Every call keeps the session alive: it
+    pings the broker every keepalive/2 seconds and, once a socket call fails,
+    reconnects with a backoff that doubles from min_backoff_ms up to
+    max_backoff_ms and subscribes to every topic again. Messages published
+    while the connection is down wait in a queue of queue_size, dropping the
+    oldest, and are sent after the reconnect.
+
+    The connect blocks until it succeeds or fails. With auto_reconnect=False
+    only poll(reconnect=True) and wait_msg() reconnect, so a control loop can
+    check connected, make its outputs safe and then call poll(reconnect=True)
+    itself; check_msg() and publish() return at once while disconnected.
+    """
+
+    def __init__(self, client_id, server, port=1883, keepalive=30, queue_size=16,
+                 min_backoff_ms=500, max_backoff_ms=30000, auto_reconnect=True, **kwargs):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.kwargs = kwargs  # user, password, ssl, ... for MQTTClient
+        self.queue_size = queue_size
+        self.min_backoff_ms = min_backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.auto_reconnect = auto_reconnect
+        self.client = None
+        self.poller = None
+        self.cb = None
+        self.topics = []    # (topic, qos) to subscribe on every connect
+        self.queue = []     # (topic, msg, retain, qos) waiting for a connection
+        self.connected = False
+        self.clean_session = True
+        self.backoff_ms = min_backoff_ms
+        now = time.ticks_ms()
+        self.retry_at = now     # next connection attempt
+        self.pinged_at = now
+        self.connects = 0       # successful connects, the first one included
+        self.reconnects = 0
+        self.failures = 0       # connection attempts that failed
+        self.dropped = 0        # queued messages thrown away
+        self.published = 0
+
+    def connect(self, clean_session=True):
+        # keep trying until the first connection is up
+        self.clean_session = clean_session
+        while not self._try_connect():
+            print('MQTT connect to %s failed, retry in %d ms' % (self.server, self.retry_in()))
+            time.sleep_ms(self.retry_in())
+        return 0
+
+    def retry_in(self):
+        return max(0, time.ticks_diff(self.retry_at, time.ticks_ms()))
+
+    def _try_connect(self):
+        self._close()
+        client = None
+        try:
+            client = MQTTClient(self.client_id, self.server, self.port,
+                                keepalive=self.keepalive, **self.kwargs)
+            if self.cb is not None:
+                client.set_callback(self.cb)
+            client.connect(self.clean_session)
+            for topic, qos in self.topics:
+                client.subscribe(topic, qos)
+        except CONNECT_ERRORS:
+            _close_sock(client)  # the half-open socket of this attempt
+            self.failures += 1
+            self.retry_at = time.ticks_add(time.ticks_ms(), self.backoff_ms)
+            self.backoff_ms = min(self.backoff_ms * 2, self.max_backoff_ms)
+            return False
+        self.client = client
+        self.connected = True
+        self.backoff_ms = self.min_backoff_ms
+        self.pinged_at = time.ticks_ms()
+        self.connects += 1
+        if self.connects > 1:
+            self.reconnects += 1
+            print('MQTT reconnected to %s' % self.server)
+        sock = getattr(client, 'sock', None)
+        if select is not None and sock is not None:
+            self.poller = select.poll()
+            self.poller.register(sock, select.POLLIN)
+        self._flush()
+        return True
+
+    def _close(self):
+        _close_sock(self.client)
+        self.poller = None
+
+    def _lost(self):
+        # a socket call failed, reconnect from the next poll()
+        if self.connected:
+            print('MQTT connection to %s lost' % self.server)
+        self.connected = False
+        self.retry_at = time.ticks_ms()
+
+    def poll(self, reconnect=None):
+        # reconnect when due (if auto_reconnect, or reconnect=True), ping
+        # when due; returns True if connected
+        now = time.ticks_ms()
+        if not self.connected:
+            if reconnect is None:
+                reconnect = self.auto_reconnect
+            if reconnect and time.ticks_diff(now, self.retry_at) >= 0:
+                self._try_connect()
+            return self.connected
+        if self.keepalive and time.ticks_diff(now, self.pinged_at) >= self.keepalive * 500:
+            self.pinged_at = now
+            try:
+                self.client.ping()
+            except (OSError, MQTTException):
+                self._lost()
+        return self.connected
+
+    def _flush(self):
+        while self.queue and self.connected:
+            topic, msg, retain, qos = self.queue[0]
+            try:
+                self.client.publish(topic, msg, retain, qos)
+            except (OSError, MQTTException):
+                self._lost()
+                return
+            self.queue.pop(0)
+            self.published += 1
+
+    def set_callback(self, f):
+        self.cb = f
+        if self.client is not None:
+            self.client.set_callback(f)
+
+    def subscribe(self, topic, qos=0):
+        self.topics.append((topic, qos))
+        if self.connected:
+            try:
+                self.client.subscribe(topic, qos)
+            except (OSError, MQTTException):
+                self._lost()
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        # returns True if sent now, False if queued for the reconnect
+        if self.poll() and not self.queue:
+            try:
+                self.client.publish(topic, msg, retain, qos)
+                self.published += 1
+                return True
+            except (OSError, MQTTException):
+                self._lost()
+        if self.queue_size <= 0:
+            self.dropped += 1
+            return False
+        if len(self.queue) >= self.queue_size:
+            self.queue.pop(0)
+            self.dropped += 1
+        self.queue.append((topic, bytes(msg), retain, qos))  # msg may be a reused buffer
+        return False
+
+    def check_msg(self):
+        if not self.poll():
+            return None
+        try:
+            return self.client.check_msg()
+        except (OSError, MQTTException):
+            self._lost()
+
+    def wait_msg(self):
+        # block until the next packet from the broker has been handled,
+        # pinging and reconnecting on time while waiting
+        while True:
+            if not self.poll(True):
+                time.sleep_ms(max(1, self.retry_in()))
+                continue
+            if self.poller is not None and self.keepalive:
+                wait = self.keepalive * 500 - time.ticks_diff(time.ticks_ms(), self.pinged_at)
+                if not self.poller.poll(max(0, wait)):
+                    continue  # time to ping
+            try:
+                return self.client.wait_msg()
+            except (OSError, MQTTException):
+                self._lost()
+
+    def ping(self):
+        if self.poll():
+            self.pinged_at = time.ticks_ms()
+            try:
+                self.client.ping()
+            except (OSError, MQTTException):
+                self._lost()
+
+    def disconnect(self):
+        if self.connected:
+            try:
+                self.client.disconnect()
+            except (OSError, MQTTException):
+                pass
+        self.connected = False
+        self._close()
+
+
+def _close_sock(client):
+    sock = getattr(client, 'sock', None)
+    if sock is not None:
+        try:
+            sock.close()
+        except OSError:
+            pass
@@ -0,0 +1,133 @@
+import struct
+
+# Binary pose frames shared by the OpenMV publishers and the car subscribers.
+# They replace the 'found,x,y' text messages with little-endian records the
+# Pico can decode without splitting strings or calling float().
+#
+# Version 1, one tag per frame (FORMAT):
+#   version  B   1
+#   found    B   1 if a tag was found, 0 otherwise
+#   tag_id   H   AprilTag id (0 when nothing was found)
+#   seq      H   frame sequence number, wraps at 65536
+#   stamp    I   camera time.ticks_ms() at capture
+#   x, y, z  fff tag translation
+#
+# Version 2, every tag seen in a frame (BATCH_HEADER + count * BATCH_TAG):
+#   version  B   2
+#   count    B   number of tags that follow (0 when nothing was found)
+#   seq      H   frame sequence number, wraps at 65536
+#   stamp    I   camera time.ticks_ms() at capture
+#   then per tag:
+#   tag_id   H   AprilTag id
+#   x, y, z  fff tag translation
+
+VERSION = 1
+FORMAT = '<BBHHIfff'
+SIZE = struct.calcsize(FORMAT)  # 22 bytes
+
+BATCH_VERSION = 2
+BATCH_HEADER = '<BBHI'
+BATCH_TAG = '<Hfff'
+HEADER_SIZE = struct.calcsize(BATCH_HEADER)  # 8 bytes
+TAG_SIZE = struct.calcsize(BATCH_TAG)        # 14 bytes
+
+SEQ_MOD = 65536
+
+
+class PoseFrameEncoder:
+    """packs pose frames into one reused buffer and numbers them"""
+
+    def __init__(self):
+        self.buf = bytearray(SIZE)
+        self.seq = 0
+
+    def encode(self, found, tag_id, x, y, z, stamp):
+        # pack a frame in place and return the buffer, ready to publish
+        if not found:
+            tag_id, x, y, z = 0, 0.0, 0.0, 0.0
+        struct.pack_into(FORMAT, self.buf, 0, VERSION, 1 if found else 0,
+                         tag_id, self.seq, stamp, x, y, z)
+        self.seq = (self.seq + 1) % SEQ_MOD
+        return self.buf
+
+
+class PoseBatchEncoder:
+    """packs every tag seen in a frame into one reused buffer"""
+
+    def __init__(self, max_tags=8):
+        self.max_tags = max_tags
+        self.buf = bytearray(HEADER_SIZE + max_tags * TAG_SIZE)
+        self.view = memoryview(self.buf)
+        self.seq = 0
+        self.count = 0
+        self.stamp = 0
+
+    def begin(self, stamp):
+        # start a new frame captured at camera time stamp
+        self.count = 0
+        self.stamp = stamp
+
+    def add(self, tag_id, x, y, z):
+        # add one tag, extra tags past max_tags are left out
+        if self.count < self.max_tags:
+            struct.pack_into(BATCH_TAG, self.buf, HEADER_SIZE + self.count * TAG_SIZE,
+                             tag_id, x, y, z)
+            self.count += 1
+
+    def finish(self):
+        # write the header and return the packed frame, ready to publish
+        struct.pack_into(BATCH_HEADER, self.buf, 0, BATCH_VERSION, self.count,
+                         self.seq, self.stamp)
+        self.seq = (self.seq + 1) % SEQ_MOD
+        return self.view[:HEADER_SIZE + self.count * TAG_SIZE]
+
+
+def _batch_ok(msg):
+    return (len(msg) >= HEADER_SIZE and msg[0] == BATCH_VERSION
+            and len(msg) == HEADER_SIZE + msg[1] * TAG_SIZE)
+
+
+def decode(msg, tag_id=None):
+    # returns (found, tag_id, x, y, z, seq, stamp), or None if msg is not a frame
+    # for a batch frame this is the tag with tag_id (the first tag if None),
+    # found is 0 when that tag is not in the frame
+    if len(msg) == SIZE and msg[0] == VERSION:
+        version, found, tid, seq, stamp, x, y, z = struct.unpack_from(FORMAT, msg)
+        if found and tag_id is not None and tid != tag_id:
+            return 0, tid, 0.0, 0.0, 0.0, seq, stamp
+        return found, tid, x, y, z, seq, stamp
+    if not _batch_ok(msg):
+        return None
+    version, count, seq, stamp = struct.unpack_from(BATCH_HEADER, msg)
+    offset = HEADER_SIZE
+    for i in range(count):
+        # compare the id before unpacking the floats of other cars' tags
+        tid = msg[offset] | (msg[offset + 1] << 8)
+        if tag_id is None or tid == tag_id:
+            tid, x, y, z = struct.unpack_from(BATCH_TAG, msg, offset)
+            return 1, tid, x, y, z, seq, stamp
+        offset += TAG_SIZE
+    return 0, 0 if tag_id is None else tag_id, 0.0, 0.0, 0.0, seq, stamp
+
+
+def decode_batch(msg):
+    # returns (seq, stamp, {tag_id: (x, y, z)}) for every tag in a frame of
+    # either version, or None if msg is not a frame
+    if len(msg) == SIZE and msg[0] == VERSION:
+        version, found, tid, seq, stamp, x, y, z = struct.unpack_from(FORMAT, msg)
+        return seq, stamp, {tid: (x, y, z)} if found else {}
+    if not _batch_ok(msg):
+        return None
+    version, count, seq, stamp = struct.unpack_from(BATCH_HEADER, msg)
+    tags = {}
+    for i in range(count):
+        tid, x, y, z = struct.unpack_from(BATCH_TAG, msg, HEADER_SIZE + i * TAG_SIZE)
+        tags[tid] = (x, y, z)
+    return seq, stamp, tags
+
+
+def seq_delta(seq, last_seq):
+    # signed distance from last_seq to seq: 1 is the next frame, >1 means frames
+    # were dropped, <= 0 means a duplicate or reordered frame
+    d = (seq - last_seq) % SEQ_MOD
+    return d - SEQ_MOD if d >= SEQ_MOD // 2 else d
@@ -0,0 +1,99 @@
+import time
+from pose_frame import decode, seq_delta
+
+
+class PoseSubscriber:
+    """latest-value subscriber for pose frames (see pose_frame.py)
+
+    drain() reads every message waiting on the socket and keeps only the
+    newest one, so the controller always steers from the most recent pose
+    instead of working through a backlog one message per loop.
+    With tag_id set only that tag is followed in batched frames, so several
+    cars can share one camera stream.
+    A frame more than reorder_window behind the newest one, or max_stale
+    stale frames in a row, means the camera started counting again (reboot or
+    script restart): the sequence is taken over from that frame.
+    """
+
+    def __init__(self, client, topic, tag_id=None, max_age_ms=250, max_drain=32,
+                 reorder_window=8, max_stale=5):
+        self.client = client
+        self.follow = tag_id          # tag to follow, None for the first tag
+        self.max_age_ms = max_age_ms  # poses older than this are not driven on
+        self.max_drain = max_drain    # upper bound on messages read per drain
+        self.reorder_window = reorder_window
+        self.max_stale = max_stale
+
+        # newest pose
+        self.found = False
+        self.tag_id = 0
+        self.x, self.y, self.z = 0.0, 0.0, 0.0
+        self.seq = None
+        self.stamp = 0           # camera ticks_ms at capture
+        self.received_ms = None  # car ticks_ms when the pose was read
+
+        # counters
+        self.received = 0  # messages read from the socket
+        self.dropped = 0   # messages replaced by a newer one before being used
+        self.lost = 0      # frames that never arrived (sequence gaps)
+        self.stale = 0     # duplicate, reordered or malformed frames ignored
+        self.resyncs = 0   # times the sequence was taken over from the camera
+        self._stale_run = 0
+
+        self._msg = None
+        self._pending = 0
+        client.set_callback(self._callback)
+        client.subscribe(topic)
+
+    def _callback(self, topic, msg):
+        # only remember the message, decoding waits until the drain is done
+        self._msg = msg
+        self._pending += 1
+
+    def drain(self):
+        # read all pending messages, returns True if a newer pose was taken
+        self._pending = 0
+        for i in range(self.max_drain):
+            before = self._pending
+            self.client.check_msg()
+            if self._pending == before:  # socket is empty
+                break
+        count = self._pending
+        if count == 0:
+            return False
+        self.received += count
+        self.dropped += count - 1
+
+        frame = decode(self._msg, self.follow)
+        self._msg = None
+        if frame is None:
+            self.stale += 1
+            return False
+        found, tag_id, x, y, z, seq, stamp = frame
+        if self.seq is not None:
+            gap = seq_delta(seq, self.seq)
+            if gap <= 0 and gap >= -self.reorder_window and self._stale_run < self.max_stale:
+                # older than the pose we already have
+                self.stale += 1
+                self._stale_run += 1
+                return False
+            if gap <= 0:
+                self.resyncs += 1  # the camera restarted its count
+            else:
+                self.lost += max(0, gap - count)  # gaps not explained by drained messages
+        self._stale_run = 0
+        self.found, self.tag_id = bool(found), tag_id
+        self.x, self.y, self.z = x, y, z
+        self.seq, self.stamp = seq, stamp
+        self.received_ms = time.ticks_ms()
+        return True
+
+    def age_ms(self):
+        # time since the newest pose was read, very large if there is none
+        if self.received_ms is None:
+            return 1 << 30
+        return time.ticks_diff(time.ticks_ms(), self.received_ms)
+
+    def fresh(self):
+        # True if the newest pose is recent enough to drive on
+        return self.age_ms() <= self.max_age_ms
@@ -0,0 +1,156 @@
+# Compact Teachable Machine prediction messages and a debounced decoder.
+#
+# Messages are text, so they go over BLE and MQTT unchanged:
+#
+#   '#forward,backward,left,right,stop'   class table, sent first, whenever
+#                                         the classes change and every
+#                                         table_every messages
+#   '=o3050'                              scores in table order, one char per
+#                                         class: chr(48 + round(score * 63))
+#
+# Scores that do not fit the receiver's table are dropped (counted in bad),
+# so a receiver that restarts or reconnects mid-stream waits for the next
+# table; the sender can also call resend_table() when a receiver connects.
+#
+# The old 'class: value,class: value' text is still understood, so either
+# end can be updated first.
+#
+# Receivers: spike_teachable_machines.py (SPIKE hub, over BLE). The sender is
+# the browser page running the Teachable Machine model, which is not in this
+# repository; under PyScript (like Convoluted Car/tm_start_stop.py) it would
+# import this module and send what PredictionEncoder.encode() returns.
+
+TABLE = '#'
+SCORES = '='
+LEVELS = 63   # scores are quantized to 0..63 (6 bits)
+ZERO = 48     # ord('0'), score 0
+NONE = 255    # vote slot without a confident class
+
+
+def encode_table(classes):
+    return TABLE + ','.join(classes)
+
+
+def encode_scores(scores):
+    # scores (0..1) in table order
+    return SCORES + ''.join(chr(ZERO + int(max(0.0, min(1.0, s)) * LEVELS + 0.5)) for s in scores)
+
+
+class PredictionEncoder:
+    """sender side: returns the messages to send for one prediction"""
+
+    def __init__(self, table_every=20):
+        self.classes = []
+        self.table_every = table_every  # scores between tables, 0: only on changes
+        self.since_table = 0
+
+    def resend_table(self):
+        # send the table with the next prediction, e.g. when a receiver connects
+        self.classes = []
+
+    def encode(self, classes, scores):
+        # class table first when the classes changed (or it is due), then
+        # the scores
+        messages = []
+        if list(classes) != self.classes or (self.table_every and self.since_table >= self.table_every):
+            self.classes = list(classes)
+            self.since_table = 0
+            messages.append(encode_table(self.classes))
+        messages.append(encode_scores(scores))
+        self.since_table += 1
+        return messages
+
+
+class PredictionDecoder:
+    """receiver side: argmax of each message, then a majority vote
+
+    A message votes for its best class if that scores at least min_score and
+    margin more than the runner-up, otherwise it votes for nothing. The class
+    with min_votes of the last window votes becomes current. feed() returns
+    the index of a class that just became current, None otherwise.
+    """
+
+    def __init__(self, window=5, min_votes=3, min_score=0.6, margin=0.0):
+        self.window = window
+        self.min_votes = min_votes
+        self.min_score = int(min_score * LEVELS + 0.5)
+        self.margin = int(margin * LEVELS + 0.5)
+        self.votes = bytearray([NONE] * window)  # ring of the last votes
+        self.slot = 0
+        self.classes = []
+        self.scores = bytearray(0)  # latest quantized score per class
+        self.counts = bytearray(0)  # votes per class in the window
+        self.current = None         # index of the class acted on
+        self.messages = 0
+        self.bad = 0                # messages that did not fit the table
+
+    def name(self):
+        return None if self.current is None else self.classes[self.current]
+
+    def set_classes(self, classes):
+        self.classes = classes
+        self.scores = bytearray(len(classes))
+        self.counts = bytearray(len(classes))
+        for i in range(self.window):
+            self.votes[i] = NONE
+        self.current = None
+
+    def feed(self, msg):
+        if not msg:
+            return None
+        if msg[0] == TABLE:
+            self.set_classes(msg[1:].split(','))
+            return None
+        if msg[0] == SCORES:
+            if len(msg) - 1 != len(self.classes):
+                self.bad += 1
+                return None
+            scores = self.scores
+            for i in range(len(scores)):
+                scores[i] = min(LEVELS, max(0, ord(msg[i + 1]) - ZERO))
+            return self.vote()
+        return self.feed_pairs(msg.split(','))
+
+    def feed_pairs(self, pairs):
+        # old format, a list of 'class: value' strings
+        names = [p.partition(': ')[0] for p in pairs]
+        if names != self.classes:
+            self.set_classes(names)
+        for i in range(len(pairs)):
+            value = pairs[i].partition(': ')[2]
+            try:
+                self.scores[i] = min(LEVELS, max(0, int(float(value) * LEVELS + 0.5)))
+            except ValueError:
+                self.bad += 1
+                return None
+        return self.vote()
+
+    def argmax(self):
+        # (best index, its score, runner-up score)
+        scores = self.scores
+        best, second = 0, 0
+        for i in range(1, len(scores)):
+            if scores[i] > scores[best]:
+                best = i
+        for i in range(len(scores)):
+            if i != best and scores[i] > second:
+                second = scores[i]
+        return best, scores[best], second
+
+    def vote(self):
+        self.messages += 1
+        if not self.scores:
+            return None
+        best, top, second = self.argmax()
+        vote = best if top >= self.min_score and top - second >= self.margin else NONE
+        old = self.votes[self.slot]
+        if old != NONE:
+            self.counts[old] -= 1
+        if vote != NONE:
+            self.counts[vote] += 1
+        self.votes[self.slot] = vote
+        self.slot = (self.slot + 1) % self.window
+        if vote != NONE and vote != self.current and self.counts[vote] >= self.min_votes:
+            self.current = vote
+            return vote
+        return None
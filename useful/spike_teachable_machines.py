@@ -1,57 +1,135 @@
 from BLE_CEEO import Yell, Listen
 import time
 import motor
+import asyncio
 from hub import port
+from predictions import PredictionDecoder
 
-def peripheral(name): 
+# motor speeds (left, right) for each class, 0 stops the motor
+speeds = {
+    'forward': (1000, 1000),
+    'backward': (-500, -500),
+    'right': (100, -100),
+    'left': (-100, 100),
+    'stop': (0, 0),
+}
+
+poll_ms = 5  # how often the receive task checks for messages
+
+
+class Mailbox:
+    """holds only the newest command, a burst collapses to the last one"""
+
+    def __init__(self):
+        self.command = None
+        self.received_us = 0  # when the message behind the command arrived
+        self.event = asyncio.Event()
+        self.merged = 0       # commands replaced before the actuator saw them
+
+    def put(self, command, received_us):
+        if self.event.is_set():
+            self.merged += 1
+        self.command = command
+        self.received_us = received_us
+        self.event.set()
+
+    async def get(self):
+        await self.event.wait()
+        self.event.clear()
+        return self.command, self.received_us
+
+
+class Pipeline:
+    """receive task -> mailbox -> actuator task"""
+
+    def __init__(self, p, left, right):
+        self.p = p
+        self.ports = (left, right)
+        self.running = [None, None]  # speed each motor was last set to
+        self.target = None
+        self.mailbox = Mailbox()
+        # a class must win 3 of the last 5 predictions with 60% to count
+        self.decoder = PredictionDecoder(window=5, min_votes=3, min_score=0.6)
+        self.connected = True
+        self.actions = 0
+        self.latency_us = 0      # receive to motor command, last one
+        self.max_latency_us = 0
+        self.total_latency_us = 0
+
+    async def receive(self):
+        # read every waiting message, hand the newest class change over
+        p = self.p
+        while p.is_connected:
+            changed = None
+            received = 0
+            while p.is_any:
+                received = time.ticks_us()
+                # class table or scores, see predictions.py
+                if self.decoder.feed(p.read()) is not None:
+                    changed = received
+            if changed is not None:
+                self.mailbox.put(self.decoder.name(), changed)
+            await asyncio.sleep_ms(poll_ms)
+        print('lost connection')
+        self.connected = False
+        self.mailbox.put('stop', time.ticks_us())
+
+    def set_motor(self, i, speed):
+        # only touch a motor whose speed changes
+        if self.running[i] == speed:
+            return
+        if speed:
+            motor.run(self.ports[i], speed)
+        else:
+            motor.stop(self.ports[i])
+        self.running[i] = speed
+
+    async def actuate(self):
+        while self.connected:
+            command, received_us = await self.mailbox.get()
+            if command == self.target:
+                continue
+            if command not in speeds:
+                print('unknown class', command)
+                continue
+            self.target = command
+            left, right = speeds[command]
+            self.set_motor(0, left)
+            self.set_motor(1, right)
+            self.latency_us = time.ticks_diff(time.ticks_us(), received_us)
+            self.max_latency_us = max(self.max_latency_us, self.latency_us)
+            self.total_latency_us += self.latency_us
+            self.actions += 1
+            print(command, '%.1f ms' % (self.latency_us / 1000))
+
+    def report(self):
+        if self.actions:
+            print('%d commands, receive to motor %.1f ms mean, %.1f ms max, %d merged' % (
+                self.actions, self.total_latency_us / self.actions / 1000,
+                self.max_latency_us / 1000, self.mailbox.merged))
+
+
+async def run(p):
+    pipeline = Pipeline(p, port.E, port.F)
+    actuator = asyncio.create_task(pipeline.actuate())
+    await pipeline.receive()
+    await actuator
+    pipeline.report()
+
+
+def peripheral(name):
     try:
         p = Yell(name, verbose = True)
         if p.connect_up():
             print('P connected')
             time.sleep(2)
-            left = port.E
-            right = port.F
-            while True:
-                if p.is_any:
-                    message = p.read()
-                    predictions = message.split(',')
-                    classes = []
-                    values = []
-                    for i in range (0,len(predictions)):
-                        class_name = predictions[i].split(': ')[0]
-                        value = predictions[i].split(': ')[1]
-                        classes.append(class_name)
-                        values.append(float(value))
-                    max_index = values.index(max(values))
-                    predicted_class = classes[max_index]
-                    print(predicted_class)
-                    
-                    if predicted_class == 'forward':
-                        motor.run(left, 1000)
-                        motor.run(right, 1000)
-                    elif predicted_class == 'backward':
-                        motor.run(left, -500)
-                        motor.run(right, -500)
-                    elif predicted_class == 'right':
-                        motor.run(left, 100)
-                        motor.run(right, -100)
-                    elif predicted_class == 'left':
-                        motor.run(left, -100)
-                        motor.run(right, 100)
-                    elif predicted_class == 'stop':
-                        motor.stop(left)
-                        motor.stop(right)
-                    else:
-                        print('unknown class')
-                    
-                if not p.is_connected:
-                    print('lost connection')
-                    break
-                time.sleep(1)
+            asyncio.run(run(p))
     except Exception as e:
         print(e)
     finally:
+        motor.stop(port.E)
+        motor.stop(port.F)
         p.disconnect()
         print('closing up')
 
-peripheral('Noah')
\ No newline at end of file
+peripheral('Noah')
@@ -0,0 +1,106 @@
+import struct
+from array import array
+
+# Control-loop telemetry kept in preallocated arrays instead of print().
+#
+# record() only stores numbers into arrays, so it does not allocate or block
+# on USB serial. flush() writes everything held, oldest first, as one block:
+#
+#   magic  4s  b'TLM1'
+#   count  H   number of records in the block
+#   pad    H   0
+#   then each field for all records, one after the other:
+#   tick   I * count   time.ticks_ms()
+#   x      f * count
+#   z      f * count
+#   speed  f * count   speed control signal
+#   turn   f * count   turn control signal
+#   found  B * count   1 if the tag was found
+#
+# Blocks are appended to the file, load() on the host reads them all back.
+
+MAGIC = b'TLM1'
+HEADER = '<4sHH'
+HEADER_SIZE = struct.calcsize(HEADER)
+FIELDS = (('tick', 'I'), ('x', 'f'), ('z', 'f'), ('speed', 'f'), ('turn', 'f'), ('found', 'B'))
+
+
+class Telemetry:
+    """ring buffer of (tick, x, z, speed, turn, found) records"""
+
+    def __init__(self, capacity=500, path='telemetry.bin', flush_when_full=False):
+        self.capacity = capacity
+        self.path = path                       # flush() target on flash
+        self.flush_when_full = flush_when_full  # else the oldest records are overwritten
+        self.tick = array('I', [0] * capacity)
+        self.x = array('f', [0] * capacity)
+        self.z = array('f', [0] * capacity)
+        self.speed = array('f', [0] * capacity)
+        self.turn = array('f', [0] * capacity)
+        self.found = bytearray(capacity)
+        self.columns = (self.tick, self.x, self.z, self.speed, self.turn, self.found)
+        self.header = bytearray(HEADER_SIZE)
+        self.head = 0         # next slot to write
+        self.count = 0        # records held
+        self.overwritten = 0  # records lost to the ring wrapping
+        self.flushed = 0      # records written out
+
+    def record(self, tick, x, z, speed, turn, found):
+        i = self.head
+        self.tick[i] = tick
+        self.x[i] = x
+        self.z[i] = z
+        self.speed[i] = speed
+        self.turn[i] = turn
+        self.found[i] = 1 if found else 0
+        i += 1
+        self.head = 0 if i == self.capacity else i
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.overwritten += 1
+        if self.count == self.capacity and self.flush_when_full:
+            self.flush()
+
+    def flush(self, stream=None):
+        # write all held records as one block to stream (e.g. sys.stdout.buffer)
+        # or append it to path, then empty the buffer
+        if not self.count:
+            return 0
+        if stream is None:
+            with open(self.path, 'ab') as f:
+                return self.flush(f)
+        n = self.count
+        start = (self.head - n) % self.capacity
+        struct.pack_into(HEADER, self.header, 0, MAGIC, n, 0)
+        stream.write(self.header)
+        for col in self.columns:
+            view = memoryview(col)
+            if start + n <= self.capacity:
+                stream.write(view[start:start + n])
+            else:
+                stream.write(view[start:])
+                stream.write(view[:start + n - self.capacity])
+        self.count = 0
+        self.flushed += n
+        return n
+
+
+def load(path):
+    # host side: read every block of a telemetry file into NumPy arrays,
+    # returns {'tick': ..., 'x': ..., 'z': ..., 'speed': ..., 'turn': ..., 'found': ...}
+    import numpy as np
+    with open(path, 'rb') as f:
+        data = f.read()
+    parts = {name: [] for name, code in FIELDS}
+    offset = 0
+    while offset + HEADER_SIZE <= len(data):
+        magic, n, pad = struct.unpack_from(HEADER, data, offset)
+        if magic != MAGIC:
+            raise ValueError('bad telemetry block at byte %d' % offset)
+        offset += HEADER_SIZE
+        for name, code in FIELDS:
+            dtype = np.dtype('<' + {'I': 'u4', 'f': 'f4', 'B': 'u1'}[code])
+            parts[name].append(np.frombuffer(data, dtype, n, offset))
+            offset += n * dtype.itemsize
+    return {name: np.concatenate(p) if p else np.array([]) for name, p in parts.items()}
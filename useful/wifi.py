@@ -1,13 +1,160 @@
 import network
-from secrets import mysecrets
-import urequests
 import time
-        
-def connect(index=2):
-    wlan = network.WLAN(network.STA_IF)
-    wlan.active(True)
-    wlan.connect(mysecrets[index]['SSID'], mysecrets[index]['key'])
-    while wlan.ifconfig()[0] == '0.0.0.0':
-        print('.', end=' ')
-        time.sleep(1)
-    return wlan.ifconfig()
\ No newline at end of file
+
+# Wi-Fi bring-up that does not hold up the rest of start up:
+#
+#   start_wifi()      # starts associating and returns at once
+#   ...               # set up motors, sensors, neopixels meanwhile
+#   wait_wifi()       # (or: await wifi_async()) returns as soon as the link is up
+#
+# connect() / connect_wifi() still do both in one call. mysecrets is either a
+# list of {'SSID': ..., 'key': ...} (tried from the last one that worked) or a
+# single dict; start_wifi(ssid=..., key=...) skips secrets altogether.
+
+__all__ = ['connect', 'connect_wifi', 'start_wifi', 'wait_wifi', 'wifi_async', 'boot']
+
+DEFAULT_INDEX = 2           # tried first when no network has worked yet
+INDEX_FILE = 'wifi_index'   # remembers the index of the last network that worked
+POLL_MS = 25                # how often the link status is checked
+TIMEOUT_MS = 10000          # give up on a network after this long
+
+
+class BootLog:
+    """time since start up of each boot phase"""
+
+    def __init__(self):
+        self.start = time.ticks_ms()
+        self.marks = []
+
+    def mark(self, phase):
+        self.marks.append((phase, time.ticks_diff(time.ticks_ms(), self.start)))
+
+    def report(self):
+        last = 0
+        for phase, ms in self.marks:
+            print('boot %6d ms (+%5d) %s' % (ms, ms - last, phase))
+            last = ms
+
+
+boot = BootLog()  # started when wifi is first imported, i.e. at boot
+
+
+def _read_index():
+    try:
+        with open(INDEX_FILE) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_index(index):
+    try:
+        with open(INDEX_FILE, 'w') as f:
+            f.write(str(index))
+    except OSError:
+        pass
+
+
+def candidates(index=None):
+    # (index, ssid, key) in the order to try them; secrets is only needed
+    # (and imported) here, so boards given ssid/key can do without it
+    from secrets import mysecrets
+    if isinstance(mysecrets, dict):
+        return [(None, mysecrets['SSID'], mysecrets['key'])]
+    order = []
+    for i in (index, _read_index(), DEFAULT_INDEX):
+        if i is not None and 0 <= i < len(mysecrets) and i not in order:
+            order.append(i)
+    order += [i for i in range(len(mysecrets)) if i not in order]
+    return [(i, mysecrets[i]['SSID'], mysecrets[i]['key']) for i in order]
+
+
+class WifiConnector:
+    """associates with the first network that works, one poll() at a time"""
+
+    def __init__(self, index=None, ssid=None, key=None, timeout_ms=TIMEOUT_MS):
+        self.networks = [(None, ssid, key)] if ssid is not None else candidates(index)
+        self.timeout_ms = timeout_ms
+        self.wlan = network.WLAN(network.STA_IF)
+        self.tried = -1
+        self.started_at = 0
+        self.index = None   # index of the network connected to
+        self.ssid = None
+
+    def _next(self):
+        self.tried = (self.tried + 1) % len(self.networks)
+        index, ssid, key = self.networks[self.tried]
+        self.started_at = time.ticks_ms()
+        self.wlan.connect(ssid, key)
+
+    def start(self):
+        self.wlan.active(True)
+        if self.wlan.isconnected():
+            self.tried = 0
+        else:
+            self._next()
+        boot.mark('wifi started')
+        return self
+
+    def poll(self):
+        # True once connected, moves on to the next network on failure
+        if self.ssid is not None:
+            return True
+        if self.wlan.isconnected():
+            self.index, self.ssid = self.networks[self.tried][0], self.networks[self.tried][1]
+            boot.mark('wifi up (%s)' % self.ssid)
+            if self.index is not None and self.index != _read_index():
+                _write_index(self.index)
+            return True
+        try:
+            failed = self.wlan.status() < 0  # wrong password, no AP, ...
+        except (AttributeError, TypeError):
+            failed = False
+        if failed or time.ticks_diff(time.ticks_ms(), self.started_at) > self.timeout_ms:
+            print('wifi: %s failed, trying the next network' % self.networks[self.tried][1])
+            self.wlan.disconnect()
+            self._next()
+        return False
+
+    def wait(self):
+        while not self.poll():
+            time.sleep_ms(POLL_MS)
+        return self.wlan.ifconfig()
+
+    async def wait_async(self):
+        import asyncio
+        while not self.poll():
+            await asyncio.sleep_ms(POLL_MS)
+        return self.wlan.ifconfig()
+
+
+connector = None
+
+
+def start_wifi(index=None, ssid=None, key=None):
+    # start associating, returns straight away
+    global connector
+    connector = WifiConnector(index, ssid, key).start()
+    return connector
+
+
+def wait_wifi():
+    # block until the network started by start_wifi() is up
+    if connector is None:
+        start_wifi()
+    return connector.wait()
+
+
+async def wifi_async(index=None, ssid=None, key=None):
+    # start (if not started yet) and wait without blocking other tasks
+    if connector is None:
+        start_wifi(index, ssid, key)
+    return await connector.wait_async()
+
+
+def connect(index=None, ssid=None, key=None):
+    start_wifi(index, ssid, key)
+    return wait_wifi()
+
+
+connect_wifi = connect